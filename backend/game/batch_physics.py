@@ -0,0 +1,231 @@
+from typing import Dict, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # The scalar backend in GameStateManager is used instead
+    np = None
+
+from .game_state import Ball, Paddle
+from .collision import sweep, max_ball_speed
+
+INITIAL_CAPACITY = 64
+
+
+def is_available() -> bool:
+    """Whether the vectorized backend can be used"""
+    return np is not None
+
+
+def _array_property(name: str):
+    """Attribute of a view stored at the view's slot of the BatchPhysics array `name`"""
+    def get(self):
+        return getattr(self._batch, name).item(self._slot)
+
+    def set(self, value):
+        getattr(self._batch, name)[self._slot] = value
+    return property(get, set)
+
+
+class BallView:
+    """Ball of a game attached to a BatchPhysics, read from and written to its arrays"""
+    __slots__ = ('_batch', '_slot')
+    x, y, dx, dy, radius = (_array_property(name) for name in ('x', 'y', 'dx', 'dy', 'radius'))
+    to_wire = Ball.to_wire
+
+    def __init__(self, batch: 'BatchPhysics', slot: int):
+        self._batch = batch
+        self._slot = slot
+
+
+class Paddle1View:
+    """Left paddle of a game attached to a BatchPhysics"""
+    __slots__ = ('_batch', '_slot')
+    x, y, width, height = (_array_property(name) for name in ('p1x', 'p1y', 'p1w', 'p1h'))
+    to_wire = Paddle.to_wire
+
+    def __init__(self, batch: 'BatchPhysics', slot: int):
+        self._batch = batch
+        self._slot = slot
+
+
+class Paddle2View(Paddle1View):
+    """Right paddle of a game attached to a BatchPhysics"""
+    __slots__ = ()
+    x, y, width, height = (_array_property(name) for name in ('p2x', 'p2y', 'p2w', 'p2h'))
+
+
+class BatchPhysics:
+    """Struct-of-arrays physics backend that advances many games in one vectorized step.
+
+    Each attached game owns one slot of flat NumPy arrays, kept from one tick
+    to the next. While it is attached, the ball and paddles of its GameState
+    are views reading and writing its slot, so the arrays are the only copy of
+    the positions and nothing is gathered or scattered per tick; `release`
+    puts plain Ball and Paddle objects back. `step` applies exactly the rules
+    of GameStateManager.update_ball_position (swept wall and paddle
+    collisions) to all the due games at once. Balls that cannot reach a
+    paddle during the step are moved in closed form; the few that can go
+    through collision.sweep, so hits are resolved by exactly the same code as
+    the scalar path. Balls reaching a goal line are reported to the caller,
+    which scores the point and serves again.
+    """
+    _ARRAYS = ('x', 'y', 'dx', 'dy', 'radius', 'p1x', 'p1y', 'p1w', 'p1h',
+               'p2x', 'p2y', 'p2w', 'p2h', 'width', 'height')
+
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        if np is None:
+            raise RuntimeError("NumPy is required for the batch physics backend")
+        self.capacity = capacity
+        for name in self._ARRAYS:
+            setattr(self, name, np.zeros(capacity, dtype=np.float64))
+        self.active = np.zeros(capacity, dtype=bool)
+        self.slots: Dict[str, int] = {}  # game_id -> slot
+        self.states: List = [None] * capacity  # GameState attached to each slot
+        self.free = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return len(self.slots)
+
+    def attach(self, game_id: str, game_state) -> int:
+        """Slot of a game, moving its ball and paddles into the arrays on first use"""
+        ball = game_state.ball
+        if type(ball) is BallView and ball._batch is self:
+            return ball._slot
+
+        slot = self.slots.get(game_id)
+        if slot is None:
+            if not self.free:
+                self._grow()
+            slot = self.free.pop()
+            self.slots[game_id] = slot
+        elif self.states[slot] is not None and self.states[slot] is not game_state:
+            # The game was replaced in memory (handoff, rehydration): the old object gets plain values back
+            self._detach(slot)
+
+        paddle1, paddle2 = game_state.paddle1, game_state.paddle2
+        self.x[slot], self.y[slot], self.dx[slot], self.dy[slot], self.radius[slot] = (
+            ball.x, ball.y, ball.dx, ball.dy, ball.radius)
+        self.p1x[slot], self.p1y[slot], self.p1w[slot], self.p1h[slot] = (
+            paddle1.x, paddle1.y, paddle1.width, paddle1.height)
+        self.p2x[slot], self.p2y[slot], self.p2w[slot], self.p2h[slot] = (
+            paddle2.x, paddle2.y, paddle2.width, paddle2.height)
+        self.width[slot] = game_state.canvas_width
+        self.height[slot] = game_state.canvas_height
+        self.active[slot] = True
+        self.states[slot] = game_state
+        game_state.ball = BallView(self, slot)
+        game_state.paddle1 = Paddle1View(self, slot)
+        game_state.paddle2 = Paddle2View(self, slot)
+        return slot
+
+    def release(self, game_id: str):
+        """Give a game that stopped playing or left memory its slot back, with plain positions"""
+        slot = self.slots.pop(game_id, None)
+        if slot is None:
+            return
+        self._detach(slot)
+        self.active[slot] = False
+        self.free.append(slot)
+
+    def _detach(self, slot: int):
+        game_state = self.states[slot]
+        self.states[slot] = None
+        if game_state is None:
+            return
+        ball, paddle1, paddle2 = game_state.ball, game_state.paddle1, game_state.paddle2
+        game_state.ball = Ball(ball.x, ball.y, ball.dx, ball.dy, ball.radius)
+        game_state.paddle1 = Paddle(paddle1.x, paddle1.y, paddle1.width, paddle1.height)
+        game_state.paddle2 = Paddle(paddle2.x, paddle2.y, paddle2.width, paddle2.height)
+
+    def _grow(self):
+        """Double the capacity; views read the arrays through the batch, so they follow"""
+        capacity = self.capacity * 2
+        for name in self._ARRAYS + ('active',):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.capacity] = old
+            setattr(self, name, new)
+        self.states.extend([None] * (capacity - self.capacity))
+        self.free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def step(self, step_scale: float = 1.0, mask=None):
+        """Advance every attached game (optionally restricted by `mask`) by one step.
+
+        Returns the slots whose ball reached a goal line; their point is left
+        to the caller.
+        """
+        m = self.active if mask is None else self.active & mask
+        if not m.any():
+            return np.empty(0, dtype=np.intp)
+        x, y, dx, dy, r = self.x, self.y, self.dx, self.dy, self.radius
+
+        # Broad phase: can the ball reach the paddle it travels towards during this step?
+        vx = dx * step_scale
+        toward1 = vx < 0
+        slab_lo = np.where(toward1, self.p1x, self.p2x) - r
+        slab_hi = np.where(toward1, self.p1x + self.p1w, self.p2x + self.p2w) + r
+        end = x + vx
+        near = m & (np.maximum(x, end) >= slab_lo) & (np.minimum(x, end) <= slab_hi)
+        free = m & ~near
+
+        # Free flight: straight line horizontally, folded against the walls vertically
+        lo = r
+        span = (self.height - r) - lo
+        folded, direction = self._fold(y + dy * step_scale, lo, span)
+        np.add(x, vx, out=x, where=free)
+        np.copyto(y, folded, where=free)
+        np.multiply(dy, direction, out=dy, where=free)
+
+        # Narrow phase with the scalar sweep for balls close to a paddle
+        max_speed = max_ball_speed()
+        for i in np.flatnonzero(near).tolist():
+            x[i], y[i], dx[i], dy[i], _ = sweep(
+                x.item(i), y.item(i), dx.item(i), dy.item(i), r.item(i),
+                (self.p1x.item(i), self.p1y.item(i), self.p1w.item(i), self.p1h.item(i)),
+                (self.p2x.item(i), self.p2y.item(i), self.p2w.item(i), self.p2h.item(i)),
+                self.height.item(i), step_scale, max_speed
+            )
+
+        # Same tests as update_ball_position
+        return np.flatnonzero(m & ((x - r <= 0) | (x + r >= self.width)))
+
+    @staticmethod
+    def _fold(u, lo, span):
+        """Vectorized collision.fold, taking the span (hi - lo) instead of hi"""
+        with np.errstate(invalid='ignore', divide='ignore'):  # Free slots have a zero span
+            m = np.mod(u - lo, 2 * span)
+        rising = m <= span
+        folded = np.where(rising, lo + m, lo + 2 * span - m)
+        folded = np.where(span > 0, folded, lo)
+        direction = np.where(rising | (span <= 0), 1.0, -1.0)
+        return folded, direction
+
+    def run(self, slots, steps, step_scale: float = 1.0) -> List[Tuple[int, int]]:
+        """Run `steps[i]` steps of the game in `slots[i]`, all games one step at a time.
+
+        A game stops at the step its ball reaches a goal line. Returns
+        (i, steps left) for these games, in the order of `slots`.
+        """
+        slots = np.asarray(slots, dtype=np.intp)
+        remaining = np.zeros(self.capacity, dtype=np.int64)
+        remaining[slots] = steps
+        scored = []
+        while True:
+            due = remaining > 0
+            if not (due & self.active).any():
+                break
+            reached = self.step(step_scale, due)
+            remaining -= due
+            if len(reached):
+                scored.append((reached, remaining[reached]))
+                remaining[reached] = 0
+        if not scored:
+            return []
+
+        index = np.full(self.capacity, -1, dtype=np.intp)
+        index[slots] = np.arange(len(slots))
+        result = [(position, left) for reached, left in scored
+                  for position, left in zip(index[reached].tolist(), left.tolist())]
+        result.sort()
+        return result
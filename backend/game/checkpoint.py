@@ -0,0 +1,255 @@
+import asyncio
+import logging
+import socket
+import struct
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+from django.conf import settings
+from .game_state import GameState, PlayerState
+from .wire import STATUS_CODES, STATUS_NAMES
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Checkpointing is disabled without the redis client
+    aioredis = None
+
+logger = logging.getLogger('game')
+
+CHECKPOINT_VERSION = 2
+CHECKPOINTS_KEY = 'game:checkpoints:{worker}'  # Hash of game_id -> blob, one per process
+ALIVE_KEY = 'game:checkpoints-alive:{worker}'  # Heartbeat of the process owning a hash
+
+# Identifies this process; random, since a restarted container gets the same hostname and pid back,
+# so a restarted worker always gets a new id and rehydrates the old one's games
+WORKER_ID = f"{socket.gethostname()}-{uuid.uuid4().hex}"
+
+# version, status, flags, ball x/y/dx/dy, paddle1 y, paddle2 y, score1, score2,
+# tick, player1 input ack, player2 input ack, start time (little-endian, 75 bytes),
+# followed by the player ids and usernames as length-prefixed UTF-8 strings.
+# Canvas and paddle geometry are the GameState defaults and are not stored.
+HEADER = struct.Struct('<BBBddddddHHIIId')
+STRING_LENGTH = struct.Struct('<H')
+
+# Bits of the flags byte
+PLAYER1_READY, PLAYER2_READY, HAS_PLAYER2 = 1, 2, 4
+
+
+def _pack_string(value) -> bytes:
+    data = str(value).encode('utf-8')
+    return STRING_LENGTH.pack(len(data)) + data
+
+
+def _unpack_string(blob: bytes, offset: int):
+    (length,) = STRING_LENGTH.unpack_from(blob, offset)
+    offset += STRING_LENGTH.size
+    return blob[offset:offset + length].decode('utf-8'), offset + length
+
+
+def pack_checkpoint(game_state: GameState) -> bytes:
+    """Pack what is needed to resume a waiting or playing game into a compact blob"""
+    ball = game_state.ball
+    player1, player2 = game_state.player1, game_state.player2
+    flags = (PLAYER1_READY if player1.is_ready else 0)
+    if player2 is not None:
+        flags |= HAS_PLAYER2 | (PLAYER2_READY if player2.is_ready else 0)
+    parts = [HEADER.pack(
+        CHECKPOINT_VERSION,
+        STATUS_CODES.get(game_state.status, 0),
+        flags,
+        ball.x, ball.y, ball.dx, ball.dy,
+        game_state.paddle1.y, game_state.paddle2.y,
+        game_state.score1, game_state.score2,
+        game_state.tick & 0xFFFFFFFF,
+        game_state.input_acks['player1'] & 0xFFFFFFFF,
+        game_state.input_acks['player2'] & 0xFFFFFFFF,
+        game_state.start_time or 0.0
+    )]
+    for player in (player1, player2):
+        if player is None:
+            continue
+        parts.append(_pack_string(player.id))
+        parts.append(_pack_string(player.username))
+    return b''.join(parts)
+
+
+def unpack_checkpoint(blob: bytes) -> GameState:
+    """Rebuild a GameState from a blob made by pack_checkpoint"""
+    (version, status, flags, x, y, dx, dy, paddle1_y, paddle2_y, score1, score2,
+     tick, ack1, ack2, start_time) = HEADER.unpack_from(blob)
+    if version != CHECKPOINT_VERSION:
+        raise ValueError(f"Unsupported checkpoint version {version}")
+
+    offset = HEADER.size
+    players = []
+    for ready_flag in ((PLAYER1_READY, PLAYER2_READY) if flags & HAS_PLAYER2 else (PLAYER1_READY,)):
+        player_id, offset = _unpack_string(blob, offset)
+        username, offset = _unpack_string(blob, offset)
+        players.append(PlayerState(id=player_id, username=username, is_ready=bool(flags & ready_flag)))
+
+    game_state = GameState(player1=players[0])
+    game_state.player2 = players[1] if len(players) > 1 else None
+    game_state.status = STATUS_NAMES.get(status, 'waiting')
+    game_state.ball.x, game_state.ball.y = x, y
+    game_state.ball.dx, game_state.ball.dy = dx, dy
+    game_state.paddle1.y = paddle1_y
+    game_state.paddle2.y = paddle2_y
+    game_state.score1 = score1
+    game_state.score2 = score2
+    game_state.tick = tick
+    game_state.input_acks = {'player1': ack1, 'player2': ack2}
+    game_state.start_time = start_time or (time.time() if game_state.status == 'playing' else None)
+    return game_state
+
+
+class Checkpoints:
+    """Periodic checkpoints of the playing games to Redis, for crash recovery.
+
+    The tick scheduler calls `maybe_checkpoint` after every tick; every
+    GAME_CHECKPOINT_INTERVAL seconds the playing games of this process are
+    packed with pack_checkpoint and written to one Redis hash in a background
+    task, and games that stopped playing are removed from it. Each process
+    writes to its own hash and refreshes a short-lived heartbeat key with it.
+
+    `rehydrate` looks for hashes whose owner's heartbeat has expired and loads
+    the checkpoints of games that are still 'playing' in the database back
+    into GameStateManager, so a restart does not lose the matches in
+    progress. Each checkpoint is claimed with HDEL, so only one process
+    resumes a given game. MatchRouter runs `rehydrate` when it starts and
+    after a worker leaves.
+    """
+    _client = None
+    _client_loop = None
+    _write_task = None
+    _last_checkpoint = 0.0
+    _saved = set()  # game_ids currently checkpointed by this process
+    _stats = {'checkpoints': 0, 'games_written': 0, 'errors': 0, 'rehydrated': 0}
+
+    @classmethod
+    def enabled(cls) -> bool:
+        return aioredis is not None and bool(getattr(settings, 'GAME_CHECKPOINT_REDIS_URL', None))
+
+    @classmethod
+    def get_stats(cls) -> Dict:
+        stats = dict(cls._stats)
+        stats['checkpointed_games'] = len(cls._saved)
+        return stats
+
+    @classmethod
+    def get_client(cls):
+        """Redis client bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        if cls._client is None or cls._client_loop is not loop:
+            cls._client = aioredis.Redis.from_url(
+                settings.GAME_CHECKPOINT_REDIS_URL,
+                socket_timeout=1, socket_connect_timeout=1
+            )
+            cls._client_loop = loop
+        return cls._client
+
+    @classmethod
+    def maybe_checkpoint(cls, instances: Dict[str, GameState], now: Optional[float] = None, force: bool = False):
+        """Start a checkpoint write if GAME_CHECKPOINT_INTERVAL has elapsed and none is in flight"""
+        if not cls.enabled():
+            return None
+        if now is None:
+            now = time.monotonic()
+        if not force and now - cls._last_checkpoint < getattr(settings, 'GAME_CHECKPOINT_INTERVAL', 1.0):
+            return None
+        if cls._write_task is not None and not cls._write_task.done():
+            return None
+        cls._last_checkpoint = now
+
+        # Pack on the loop so the blobs are consistent with this tick; only the I/O runs in the task
+        blobs = {
+            game_id: pack_checkpoint(game_state)
+            for game_id, game_state in instances.items()
+            if game_state.status == 'playing' and game_state.player2 is not None
+        }
+        stale = cls._saved - set(blobs)
+        if not blobs and not stale:
+            return None
+        cls._write_task = asyncio.get_running_loop().create_task(cls._write(blobs, stale))
+        return cls._write_task
+
+    @classmethod
+    async def _write(cls, blobs: Dict[str, bytes], stale: set):
+        key = CHECKPOINTS_KEY.format(worker=WORKER_ID)
+        heartbeat = max(5, int(3 * getattr(settings, 'GAME_CHECKPOINT_INTERVAL', 1.0)))
+        try:
+            pipe = cls.get_client().pipeline(transaction=False)
+            if blobs:
+                pipe.hset(key, mapping=blobs)
+            if stale:
+                pipe.hdel(key, *stale)
+            pipe.expire(key, getattr(settings, 'GAME_CHECKPOINT_TTL', 600))
+            pipe.set(ALIVE_KEY.format(worker=WORKER_ID), 1, ex=heartbeat)
+            await pipe.execute()
+            cls._saved = set(blobs)
+            cls._stats['checkpoints'] += 1
+            cls._stats['games_written'] += len(blobs)
+        except Exception as e:
+            cls._stats['errors'] += 1
+            logger.error(f"Failed to checkpoint {len(blobs)} games: {str(e)}")
+
+    @classmethod
+    async def rehydrate(cls, owns: Optional[Callable[[str], bool]] = None) -> List[str]:
+        """Load orphaned checkpoints of games still playing in the database into GameStateManager.
+
+        With `owns`, only the games for which it returns True are claimed (the
+        match router passes its shard assignment). Returns the ids of the
+        games restored by this process.
+        """
+        if not cls.enabled():
+            return []
+        from channels.db import database_sync_to_async
+        from .game_state_manager import GameStateManager
+        from .models import Game
+
+        try:
+            client = cls.get_client()
+            checkpoints = {}  # game_id -> (hash key, blob)
+            async for key in client.scan_iter(match=CHECKPOINTS_KEY.format(worker='*')):
+                key = key.decode() if isinstance(key, bytes) else key
+                worker = key[len(CHECKPOINTS_KEY.format(worker='')):]
+                if worker == WORKER_ID or await client.exists(ALIVE_KEY.format(worker=worker)):
+                    continue
+                for game_id, blob in (await client.hgetall(key)).items():
+                    game_id = game_id.decode() if isinstance(game_id, bytes) else game_id
+                    if owns is None or owns(game_id):
+                        checkpoints[game_id] = (key, blob)
+            if not checkpoints:
+                return []
+
+            def playing_ids():
+                ids = [int(game_id) for game_id in checkpoints if game_id.isdigit()]
+                return {str(game_id) for game_id in
+                        Game.objects.filter(id__in=ids, status='playing').values_list('id', flat=True)}
+            playing = await database_sync_to_async(playing_ids)()
+
+            # Claim each checkpoint; HDEL returns 1 only for the process that removed it
+            game_ids = list(checkpoints)
+            pipe = client.pipeline(transaction=False)
+            for game_id in game_ids:
+                pipe.hdel(checkpoints[game_id][0], game_id)
+            claimed = await pipe.execute()
+        except Exception as e:
+            cls._stats['errors'] += 1
+            logger.error(f"Failed to rehydrate games from checkpoints: {str(e)}")
+            return []
+
+        restored = []
+        for game_id, was_claimed in zip(game_ids, claimed):
+            if not was_claimed or game_id not in playing or GameStateManager.game_exists(game_id):
+                continue
+            try:
+                GameStateManager._instances[game_id] = unpack_checkpoint(checkpoints[game_id][1])
+            except (ValueError, struct.error, UnicodeDecodeError) as e:
+                logger.error(f"Invalid checkpoint for game {game_id}: {str(e)}")
+                continue
+            restored.append(game_id)
+
+        cls._stats['rehydrated'] += len(restored)
+        if restored:
+            logger.info(f"Rehydrated {len(restored)} games from checkpoints: {restored}")
+        return restored
@@ -14,8 +14,16 @@ import logging
 import time
 from datetime import timedelta
 import random
+import statistics
+from collections import deque
+from django.conf import settings
 from django.utils import timezone
-from .game_state_manager import GameStateManager
+from . import wire
+from .fanout import LocalFanout
+from .match_router import MatchRouter
+from .matchmaking import MatchmakingQueue
+from .ratings import record_result
+from .snapshots import round_trip_ticks
 
 logger = logging.getLogger('game')
 User = get_user_model()
@@ -29,7 +37,13 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
         self.game = None
         self.channel_group_name = None
         self.is_connected = False
-        self.game_loop_task = None
+        self.binary_frames = False
+        self.joined_games = set()  # Games whose group this connection joined, as a player or spectator
+        self.last_keyframe_request = 0.0
+        self.ping_id = 0
+        self.last_ping = 0.0  # When the latest ping was sent
+        self.ping_answered = True
+        self.round_trips = deque(maxlen=5)  # Latest round trips measured with pings, in seconds
 
     async def connect(self):
         """Handle WebSocket connection"""
@@ -42,9 +56,19 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
         # Add user to their personal group for direct messages
         self.user_group = f"user_{self.user.id}"
         await self.channel_layer.group_add(self.user_group, self.channel_name)
-        await self.accept()
+
+        # Clients offering the binary subprotocol get packed per-tick frames, others stay on JSON
+        if wire.binary_enabled() and wire.SUBPROTOCOL in self.scope.get('subprotocols', []):
+            self.binary_frames = True
+            await self.accept(subprotocol=wire.SUBPROTOCOL)
+        else:
+            await self.accept()
         self.is_connected = True
 
+        # Games owned by other workers are reached through the match router; the first
+        # connection after a restart also resumes the games orphaned by the previous process
+        await MatchRouter.ensure_running(self.channel_layer)
+
         # Send connection established message with user info
         await self.send_json({
             'type': 'connection_established',
@@ -58,17 +82,13 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
         """Handle WebSocket disconnect"""
         print(f"[DEBUG] WebSocket disconnecting with code {close_code}")
         try:
-            # Cancel game loop if it's running
-            if hasattr(self, 'game_loop_task') and self.game_loop_task:
-                print(f"[DEBUG] Cancelling game loop task")
-                self.game_loop_task.cancel()
-                self.game_loop_task = None
-
             # Leave all game groups
             for group in self.groups:
                 await self.channel_layer.group_discard(group, self.channel_name)
                 print(f"[DEBUG] Left group {group}")
 
+            LocalFanout.unregister(self)
+
             # Remove user from their personal group
             if self.user_group:
                 await self.channel_layer.group_discard(self.user_group, self.channel_name)
@@ -104,12 +124,11 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
             return None
 
     @database_sync_to_async
-    def create_game_sync(self):
-        """Create a new game in the database"""
+    def create_game_sync(self, bucket=None):
+        """Create a new game in the database and queue it for matchmaking"""
         try:
             game = Game.objects.create(player1=self.user)
-            # Initialize the game state in memory
-            GameStateManager.create_game(str(game.id), str(self.user.id), self.user.username)
+            MatchmakingQueue.enqueue(game.id, self.user.id, bucket)
             logger.info(f"Game {game.id} created by {self.user.username}")
             return game
         except Exception as e:
@@ -148,28 +167,38 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                     logger.warning(f"Player {player.username} tried to join game {game.id} but player2 slot is taken by {game.player2.username}")
                     return None
             
-            # Otherwise, join as player2
+            # Otherwise, join as player2; the conditional update lets a single player take the slot
+            joined = Game.objects.filter(id=game.id, status='waiting', player2__isnull=True).update(
+                player2=player, updated_at=timezone.now()
+            )
+            if not joined:
+                logger.warning(f"Player {player.username} tried to join game {game.id} but it was taken meanwhile")
+                return None
+            MatchmakingQueue.remove(game.id)
             game.player2 = player
-            game.status = 'waiting'
-            game.save(update_fields=['player2', 'status', 'updated_at'])
             return game
         except Exception as e:
             logger.error(f"Error updating game: {str(e)}", exc_info=True)
             return None
 
     @database_sync_to_async
-    def find_available_game(self):
-        """Find an available game to join"""
+    def find_available_game(self, bucket=None):
+        """Take a game waiting for a second player from the matchmaking queue"""
         try:
-            # Look for a game waiting for players
-            game = Game.objects.select_related('player1', 'player2').filter(
-                status='waiting'
-            ).first()
-            
-            if game:
-                logger.info(f"Found available game {game.id}")
-            return game
-            
+            while True:
+                game_id = MatchmakingQueue.pop(self.user.id, bucket)
+                if game_id is None:
+                    return None
+
+                # The queue hands each game out once; the conditional update also
+                # guards against a player joining the same game by id meanwhile
+                joined = Game.objects.filter(
+                    id=game_id, status='waiting', player2__isnull=True
+                ).exclude(player1=self.user).update(player2=self.user, updated_at=timezone.now())
+                if joined:
+                    logger.info(f"Found available game {game_id}")
+                    return Game.objects.select_related('player1', 'player2').get(id=game_id)
+
         except Exception as e:
             logger.error(f"Error finding available game: {str(e)}", exc_info=True)
             return None
@@ -194,7 +223,7 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                 game.status = status
             # COMMENTED OUT: Centralizing winner determination to score comparison only
             if winner:
-                game.winner = winner
+                game.winner_id = winner
             if duration is not None:
                 game.duration = duration
             if duration_formatted:
@@ -205,75 +234,70 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                 game.score_player2 = score_player2
             
             game.save()
+            if game.status == 'finished':
+                record_result(game.id)
             return True
         except Exception as e:
             logger.error(f"Error updating game status: {str(e)}")
             return False
 
-    async def game_loop(self, game_id):
-        """Main game loop that updates ball position and broadcasts game state"""
-        print(f"[DEBUG] Starting game loop for game {game_id}")
-        try:
-            while True:
-                # Get current game state
-                game_state = GameStateManager.get_game_state(str(game_id))
-                if not game_state or game_state['status'] != 'playing':
-                    print(f"[DEBUG] Game {game_id} is no longer playing, stopping game loop")
-                    break
-
-                # Update ball position
-                GameStateManager.update_ball_position(str(game_id))
-                game_state = GameStateManager.get_game_state(str(game_id))
-                
-                # Check if game has ended and needs to send notification
-                if game_state and game_state.get('_send_end_notification') and game_state.get('_end_notification_data'):
-                    print(f"[DEBUG] Game {game_id} has end notification flag set, sending notification")
-                    # Send game end notification
-                    notification_data = game_state.get('_end_notification_data')
-                    print(f"[DEBUG] Notification data: {notification_data}")
-                    await self.channel_layer.group_send(
-                        game_group,
-                        notification_data
-                    )
-                    print(f"[DEBUG] Game end notification sent to game group: {game_group}")
-                    # Clear notification flag to avoid sending multiple times
-                    GameStateManager._instances[str(game_id)]['_send_end_notification'] = False
-                    print(f"[DEBUG] Cleared notification flag for game {game_id}")
-                
-                # Broadcast updated state
-                game_group = f"game_{game_id}"
-                await self.channel_layer.group_send(
-                    game_group,
-                    {
-                        'type': 'game_state_update',
-                        'game_state': game_state
-                    }
-                )
+    async def join_game_group(self, game_id):
+        """Join game_{game_id} and register for in-process fan-out"""
+        await self.channel_layer.group_add(f"game_{game_id}", self.channel_name)
+        LocalFanout.register(game_id, self)
+        self.joined_games.add(str(game_id))
 
-                # Sleep for a short duration to control game speed
-                await asyncio.sleep(0.016)  # Approximately 60 FPS
+    async def send_keyframe(self, game_id, throttle=True) -> bool:
+        """Send the group's current baseline to this socket only.
 
-        except Exception as e:
-            print(f"[ERROR] Error in game loop: {str(e)}")
-            logger.error(f"Error in game loop: {str(e)}", exc_info=True)
-        finally:
-            print(f"[DEBUG] Game loop ended for game {game_id}")
-            if hasattr(self, 'game_loop_task'):
-                self.game_loop_task = None
-
-    async def paddle_move(self, direction, game_id):
-        """Handle paddle movement"""
+        Only for games whose group this connection joined, and with `throttle`
+        at most once per GAME_KEYFRAME_REQUEST_INTERVAL seconds; other requests
+        are dropped, the client asks again at its next out-of-order delta.
+        """
+        if str(game_id) not in self.joined_games:
+            return False
+        now = time.monotonic()
+        if throttle and now - self.last_keyframe_request < getattr(settings, 'GAME_KEYFRAME_REQUEST_INTERVAL', 1.0):
+            return False
+        self.last_keyframe_request = now
+        event = await MatchRouter.call(game_id, 'keyframe_event')
+        if event is None:
+            return False
+        await self.game_state_update(event)
+        return True
+
+    async def broadcast_game_state(self, game_id, keyframe=False):
+        """Have the game's owner send its next game_state_update (delta or keyframe) to the group"""
+        await MatchRouter.call(game_id, 'broadcast_state', keyframe)
+
+    async def maybe_ping(self):
+        """Measure the round trip of a connection receiving game states every GAME_PING_INTERVAL seconds"""
+        now = time.monotonic()
+        if now - self.last_ping < getattr(settings, 'GAME_PING_INTERVAL', 2.0):
+            return
+        self.ping_id += 1
+        self.last_ping = now
+        self.ping_answered = False
+        await self.send_json({'type': 'ping', 'id': self.ping_id})
+
+    def handle_pong(self, ping_id):
+        # Only the first answer to the latest ping is a round trip
+        if self.ping_answered or ping_id != self.ping_id:
+            return
+        self.ping_answered = True
+        self.round_trips.append(time.monotonic() - self.last_ping)
+
+    def max_input_lag(self) -> int:
+        """Ticks of lag compensation an input of this connection may claim, none before its first pong"""
+        if not self.round_trips:
+            return 0
+        return round_trip_ticks(statistics.median(self.round_trips))
+
+    async def paddle_move(self, direction, game_id, seq=None, seen_tick=None):
+        """Queue a paddle input; the tick scheduler applies and broadcasts it"""
         try:
-            new_state = GameStateManager.move_paddle(str(game_id), str(self.user.id), direction)
-            if new_state:
-                game_group = f"game_{game_id}"
-                await self.channel_layer.group_send(
-                    game_group,
-                    {
-                        'type': 'game_state_update',
-                        'game_state': new_state
-                    }
-                )
+            await MatchRouter.call(game_id, 'queue_input', str(self.user.id), direction, seq, seen_tick,
+                                   self.max_input_lag(), expect_reply=False)
         except Exception as e:
             logger.error(f"Error in paddle_move: {str(e)}", exc_info=True)
 
@@ -283,8 +307,11 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
             logger.info("[GAME] === ENDING GAME ===")
             logger.info(f"[GAME] Reason: {reason}")
 
+            # A game that ends while waiting must not be handed out anymore
+            await sync_to_async(MatchmakingQueue.remove)(game_id)
+
             # Get final state from GameStateManager
-            final_state = GameStateManager.end_game(str(game_id))
+            final_state = await MatchRouter.call(game_id, 'end_game')
             if final_state:
                 logger.info(f"[GAME] Final Score: {final_state['score']}")
                 
@@ -310,21 +337,10 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                 )
 
                 # Broadcast final state to all players
-                game_group = f"game_{game_id}"
-                await self.channel_layer.group_send(
-                    game_group,
-                    {
-                        'type': 'game_state_update',
-                        'game_state': final_state
-                    }
-                )
+                await self.broadcast_game_state(game_id, keyframe=True)
 
                 # Clean up
-                GameStateManager.remove_game(str(game_id))
-                
-                if hasattr(self, 'game_loop_task') and self.game_loop_task:
-                    self.game_loop_task.cancel()
-                    self.game_loop_task = None
+                await MatchRouter.call(game_id, 'remove_game')
                 
                 # # Nettoyer les parties inactives à chaque fin de partie
                 # # Cela garantit que les parties abandonnées seront nettoyées régulièrement
@@ -345,6 +361,9 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                 'type': 'heartbeat_response'
             })
             return
+        if message_type == 'pong':
+            self.handle_pong(content.get('id'))
+            return
         
         # Validate user session
         if not self.user.is_authenticated:
@@ -357,11 +376,13 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
             
         try:
             if message_type == 'create_game':
-                game = await self.create_game_sync()
+                game = await self.create_game_sync(content.get('bucket'))
                 if game:
+                    # Initialize the game state in memory, on the game's shard
+                    await MatchRouter.call(game.id, 'create_game', str(self.user.id), self.user.username)
                     # Add creator to game group
                     game_group = f'game_{game.id}'
-                    await self.channel_layer.group_add(game_group, self.channel_name)
+                    await self.join_game_group(game.id)
                     
                     # Send game created message
                     await self.channel_layer.group_send(
@@ -371,7 +392,7 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                             'game_id': str(game.id),
                             'player1_id': str(game.player1.id),
                             'player1_username': game.player1.username,
-                            'game_state': GameStateManager.get_game_state(str(game.id))
+                            'game_state': await MatchRouter.call(game.id, 'get_game_state')
                         }
                     )
                 else:
@@ -380,6 +401,14 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                         'message': 'Failed to create game'
                     })
                     
+            elif message_type == 'find_game':
+                # Join the oldest waiting game of the bucket, or create one and wait in the queue
+                game = await self.find_available_game(content.get('bucket'))
+                if game:
+                    await self.receive_json({'type': 'join_game', 'game_id': game.id})
+                else:
+                    await self.handle_create_game(content.get('bucket'))
+
             elif message_type == 'join_game':
                 game_id = content.get('game_id')
                 if not game_id:
@@ -408,11 +437,11 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                     return
                 
                 # Add player2 to game state
-                GameStateManager.join_game(str(game.id), str(self.user.id), self.user.username)
+                await MatchRouter.call(game.id, 'join_game', str(self.user.id), self.user.username)
                 
                 # Add player to game group
                 game_group = f'game_{game.id}'
-                await self.channel_layer.group_add(game_group, self.channel_name)
+                await self.join_game_group(game.id)
                 
                 # Send game joined message
                 await self.channel_layer.group_send(
@@ -422,7 +451,7 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                         'game_id': str(game.id),
                         'player1_id': str(game.player1.id),
                         'player2_id': str(game.player2.id),
-                        'game_state': GameStateManager.get_game_state(str(game.id))
+                        'game_state': await MatchRouter.call(game.id, 'get_game_state')
                     }
                 )
                 
@@ -444,14 +473,20 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                     return
                     
                 # Add player to game group
-                game_group = f'game_{game.id}'
-                await self.channel_layer.group_add(game_group, self.channel_name)
+                await self.join_game_group(game.id)
                 
-                # Send current game state
-                await self.send_json({
-                    'type': 'game_state_update',
-                    'game_state': GameStateManager.get_game_state(str(game.id))
-                })
+                # Send current game state, to the rejoining client only
+                if not await self.send_keyframe(game.id, throttle=False):
+                    await self.send_json({
+                        'type': 'game_state_update',
+                        'game_state': None
+                    })
+                
+            elif message_type == 'request_keyframe':
+                # A client missed a delta and asks for the full state
+                game_id = content.get('game_id')
+                if game_id:
+                    await self.send_keyframe(game_id)
                 
             elif message_type == 'player_ready':
                 await self.handle_player_ready(content.get('game_id'))
@@ -465,7 +500,7 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                         'message': 'Missing required parameters'
                     })
                     return
-                await self.paddle_move(direction, game_id)
+                await self.paddle_move(direction, game_id, content.get('seq'), content.get('tick'))
                 
             else:
                 await self.send_json({
@@ -494,10 +529,16 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
             # Debug messages disabled
             # print(f"[DEBUG] GameUIConsumer: Received game state update, status: {event.get('game_state', {}).get('status')}")
             # print(f"[DEBUG] Game state update: {event.get('game_state')}")
+            await self.maybe_ping()
+            if self.binary_frames and event.get('frame'):
+                await self.send(bytes_data=event['frame'])
+                return
             await self.send_json({
                 'type': 'game_state_update',
                 'game_state': event.get('game_state', {}),
-                'update_type': event.get('update_type', 'all')
+                'update_type': event.get('update_type', 'all'),
+                'seq': event.get('seq'),
+                'base_seq': event.get('base_seq')
             })
         except Exception as e:
             logger.error(f"Error in game_state_update: {str(e)}", exc_info=True)
@@ -573,7 +614,7 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                     
                     # If winner_id is not in the event, try to get it from the game state
                     if 'winner_id' not in tournament_notification or not tournament_notification['winner_id']:
-                        game_state = GameStateManager.get_game_state(str(game_id))
+                        game_state = await MatchRouter.call(game_id, 'get_game_state')
                         if game_state and 'winner' in game_state:
                             winner_key = game_state['winner']
                             if 'players' in game_state and winner_key in game_state['players']:
@@ -621,7 +662,7 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
         except Exception as e:
             logger.error(f"Error handling UI action: {str(e)}", exc_info=True)
 
-    async def handle_create_game(self):
+    async def handle_create_game(self, bucket=None):
         try:
             print("Creating game...")  
             # Create game in database
@@ -630,13 +671,14 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                 status='waiting'
             )
             print(f"Game created with ID: {game.id}")  
+            await sync_to_async(MatchmakingQueue.enqueue)(game.id, self.user.id, bucket)
             
             # Initialize game state in GameStateManager
-            initial_state = GameStateManager.create_game(str(game.id), str(self.user.id), self.user.username)
+            initial_state = await MatchRouter.call(game.id, 'create_game', str(self.user.id), self.user.username)
             
             # Add user to game channel group
             game_group = f"game_{game.id}"
-            await self.channel_layer.group_add(game_group, self.channel_name)
+            await self.join_game_group(game.id)
             
             # Send game_created through the channel layer to ensure consistent state
             await self.channel_layer.group_send(
@@ -683,12 +725,16 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
             game = game_info['game']
             player1 = game_info['player1']
             
-            # Update game with database_sync_to_async
+            # Conditional update, so that two sockets joining the same game cannot both take the slot
             @database_sync_to_async
             def update_game():
+                joined = Game.objects.filter(
+                    id=game.id, status='waiting', player2__isnull=True
+                ).exclude(player1=self.user).update(player2=self.user, updated_at=timezone.now())
+                if not joined:
+                    raise ValueError('Game not available')
+                MatchmakingQueue.remove(game.id)
                 game.player2 = self.user
-                game.status = 'waiting'
-                game.save()
                 return game
             
             game = await update_game()
@@ -705,7 +751,7 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                 })
                 return
                 
-            new_state = GameStateManager.join_game(str(game.id), str(self.user.id), self.user.username)
+            new_state = await MatchRouter.call(game.id, 'join_game', str(self.user.id), self.user.username)
             if not new_state:
                 await self.send_json({
                     'type': 'error',
@@ -714,17 +760,10 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                 return
             
             # Add user to game channel group
-            game_group = f"game_{game.id}"
-            await self.channel_layer.group_add(game_group, self.channel_name)
+            await self.join_game_group(game.id)
             
             # Notify all players with the new state
-            await self.channel_layer.group_send(
-                game_group,
-                {
-                    'type': 'game_state_update',
-                    'game_state': new_state
-                }
-            )
+            await self.broadcast_game_state(game.id, keyframe=True)
 
             # Send game_joined event specifically to the joining player
             await self.send_json({
@@ -788,29 +827,20 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                 print(f"[DEBUG] Could not determine player role")
             
             # Set player ready in game state with role information
-            new_state = GameStateManager.set_player_ready(str(game_id), str(self.user.id), player_role)
+            new_state = await MatchRouter.call(game_id, 'set_player_ready', str(self.user.id), player_role)
             if new_state:
                 print(f"[DEBUG] New game state: {new_state}")
                 
                 # If game is now in playing state, update game status in database
                 if new_state['status'] == 'playing':
-                    print(f"[DEBUG] Game {game.id} is now playing, starting game loop")
+                    print(f"[DEBUG] Game {game.id} is now playing, handing it to the tick scheduler")
                     game.status = 'playing'
                     await database_sync_to_async(game.save)()
                     
-                    # Start the game loop
-                    if not hasattr(self, 'game_loop_task') or not self.game_loop_task:
-                        self.game_loop_task = asyncio.create_task(self.game_loop(game.id))
-                        print(f"[DEBUG] Started game loop for game {game.id}")
+                    # The owner's scheduler picks up every playing game on its next tick (see MatchRouter)
                 
                 # Broadcast the updated state to all players in the game
-                await self.channel_layer.group_send(
-                    game_group,
-                    {
-                        'type': 'game_state_update',
-                        'game_state': new_state
-                    }
-                )
+                await self.broadcast_game_state(game_id, keyframe=True)
             else:
                 await self.send_json({
                     'type': 'error',
@@ -839,6 +869,9 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                     'type': 'heartbeat_response'
                 })
                 return
+            if message_type == 'pong':
+                self.handle_pong(data.get('id'))
+                return
             
             # Validate user session
             if not self.user.is_authenticated:
@@ -851,13 +884,18 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
             
             # Handle different message types
             if message_type == 'create_game':
-                await self.handle_create_game()
+                await self.handle_create_game(data.get('bucket'))
+            elif message_type == 'find_game':
+                await self.receive_json({'type': 'find_game', 'bucket': data.get('bucket')})
             elif message_type == 'join_game':
                 game_id = data.get('game_id')
                 await self.receive_json({'type': 'join_game', 'game_id': game_id})
             elif message_type == 'rejoin_game_group':
                 game_id = data.get('game_id')
                 await self.receive_json({'type': 'rejoin_game_group', 'game_id': game_id})
+            elif message_type == 'request_keyframe':
+                game_id = data.get('game_id')
+                await self.receive_json({'type': 'request_keyframe', 'game_id': game_id})
             elif message_type == 'player_ready':
                 game_id = data.get('game_id')
                 player_role = data.get('player_role')  # Get player role if provided
@@ -871,7 +909,7 @@ class GameUIConsumer(AsyncJsonWebsocketConsumer):
                         'message': 'Missing required parameters'
                     })
                     return
-                await self.paddle_move(direction, game_id)
+                await self.paddle_move(direction, game_id, data.get('seq'), data.get('tick'))
             else:
                 await self.send_json({
                     'type': 'error',
@@ -0,0 +1,89 @@
+from typing import Dict, Optional
+from django.conf import settings
+
+
+def diff_state(old: Dict, new: Dict) -> Dict:
+    """Return the parts of `new` that differ from `old`, as a nested partial dict.
+
+    Both arguments must have the same keys; nested dicts are compared
+    recursively so that a moving ball only contributes ball.x and ball.y.
+    """
+    delta = {}
+    for key, value in new.items():
+        previous = old.get(key)
+        if isinstance(value, dict) and isinstance(previous, dict) and value.keys() == previous.keys():
+            nested = diff_state(previous, value)
+            if nested:
+                delta[key] = nested
+        elif value != previous:
+            delta[key] = value
+    return delta
+
+
+def same_shape(old: Dict, new: Dict) -> bool:
+    """Whether a delta can express the change from `old` to `new` (no added or removed keys)"""
+    if old.keys() != new.keys():
+        return False
+    for key, value in new.items():
+        previous = old[key]
+        if isinstance(value, dict) != isinstance(previous, dict):
+            return False
+        if isinstance(value, dict) and not same_shape(previous, value):
+            return False
+    return True
+
+
+class DeltaEncoder:
+    """Builds game_state_update events for one game.
+
+    Each broadcast gets a sequence number. A delta carries only the fields that
+    changed since the previous broadcast (`base_seq`); a client whose last
+    applied sequence differs asks for a keyframe and gets the last broadcast
+    state (`baseline`), so the next delta of the group applies to it. Full keyframes also go out
+    every GAME_KEYFRAME_INTERVAL broadcasts and whenever the shape of the state
+    changes (e.g. winner fields appearing when the game ends).
+    """
+    __slots__ = ('seq', 'snapshot', 'since_keyframe', 'keyframe_interval')
+
+    def __init__(self, keyframe_interval: Optional[int] = None):
+        self.seq = 0
+        self.snapshot = None
+        self.since_keyframe = 0
+        self.keyframe_interval = keyframe_interval or getattr(settings, 'GAME_KEYFRAME_INTERVAL', 60)
+
+    def encode(self, wire: Dict, keyframe: bool = False) -> Dict:
+        """Record `wire` as the latest broadcast state and return the event to send"""
+        base_seq = self.seq
+        previous = self.snapshot
+        self.seq += 1
+        self.snapshot = wire
+
+        if (keyframe or previous is None or self.since_keyframe >= self.keyframe_interval
+                or not same_shape(previous, wire)):
+            self.since_keyframe = 0
+            return {
+                'type': 'game_state_update',
+                'update_type': 'all',
+                'seq': self.seq,
+                'game_state': wire
+            }
+
+        self.since_keyframe += 1
+        return {
+            'type': 'game_state_update',
+            'update_type': 'delta',
+            'seq': self.seq,
+            'base_seq': base_seq,
+            'game_state': diff_state(previous, wire)
+        }
+
+    def baseline(self) -> Optional[Dict]:
+        """Keyframe of the last broadcast state, for one client; the sequence does not move"""
+        if self.snapshot is None:
+            return None
+        return {
+            'type': 'game_state_update',
+            'update_type': 'all',
+            'seq': self.seq,
+            'game_state': self.snapshot
+        }
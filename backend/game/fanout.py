@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from typing import Dict, List
+
+logger = logging.getLogger('game')
+
+
+class LocalFanout:
+    """In-process registry of the consumers attached to each game.
+
+    When every player of a game has a consumer registered in this process,
+    broadcasts are handed straight to those consumers instead of making a
+    round trip through the channel layer. Otherwise `broadcast` falls back to
+    group_send, which reaches members living on other workers.
+    """
+    _members = {}  # game_id -> {channel_name: consumer}
+    _stats = {'local': 0, 'layer': 0}
+
+    @classmethod
+    def register(cls, game_id, consumer):
+        cls._members.setdefault(str(game_id), {})[consumer.channel_name] = consumer
+
+    @classmethod
+    def unregister(cls, consumer):
+        """Remove a consumer from every game it was registered under"""
+        for game_id in list(cls._members):
+            members = cls._members[game_id]
+            members.pop(consumer.channel_name, None)
+            if not members:
+                del cls._members[game_id]
+
+    @classmethod
+    def local_members(cls, game_id, player_ids) -> List:
+        """Consumers to deliver to locally, or an empty list if a player is not connected here"""
+        members = cls._members.get(str(game_id))
+        if not members:
+            return []
+        local_users = {str(consumer.user.id) for consumer in members.values()}
+        if not all(str(player_id) in local_users for player_id in player_ids if player_id is not None):
+            return []
+        return list(members.values())
+
+    @classmethod
+    def get_stats(cls) -> Dict:
+        return dict(cls._stats)
+
+    @classmethod
+    async def broadcast(cls, channel_layer, game_id, event, player_ids):
+        """Deliver `event` to everyone in game_{game_id}, in-process when possible"""
+        consumers = cls.local_members(game_id, player_ids)
+        if not consumers:
+            cls._stats['layer'] += 1
+            await channel_layer.group_send(f"game_{game_id}", event)
+            return
+
+        cls._stats['local'] += 1
+        handler_name = event['type'].replace('.', '_')
+        results = await asyncio.gather(
+            *(getattr(consumer, handler_name)(event) for consumer in consumers),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error in local fan-out for game {game_id}: {str(result)}")
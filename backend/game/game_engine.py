@@ -0,0 +1,62 @@
+import time
+from django.conf import settings
+
+# Ball and paddle speeds in GameStateManager are expressed in pixels per step at this rate
+PHYSICS_BASE_RATE = 60
+
+
+class FixedTimestepEngine:
+    """Fixed-timestep clock of a single match.
+
+    Wall-clock time is fed into an accumulator and consumed in constant `dt`
+    slices, so the simulation advances by the same amount per second whatever
+    the event-loop jitter. Broadcasting runs on its own, usually lower, rate.
+    The steps themselves are run by the TickScheduler, for all games at once.
+    """
+
+    def __init__(self, game_id, tick_rate=None, broadcast_rate=None, max_steps_per_frame=None):
+        self.game_id = str(game_id)
+        self.tick_rate = tick_rate or getattr(settings, 'GAME_TICK_RATE', PHYSICS_BASE_RATE)
+        self.broadcast_rate = broadcast_rate or getattr(settings, 'GAME_BROADCAST_RATE', self.tick_rate)
+        self.max_steps_per_frame = max_steps_per_frame or getattr(settings, 'GAME_MAX_STEPS_PER_FRAME', 5)
+
+        self.dt = 1.0 / self.tick_rate
+        self.broadcast_interval = 1.0 / self.broadcast_rate
+        # Scale applied to per-step velocities so the game speed does not depend on the tick rate
+        self.step_scale = PHYSICS_BASE_RATE / self.tick_rate
+
+        self.accumulator = 0.0
+        self.last_time = None
+        self.last_broadcast = None
+        self.tick = 0
+        self.dropped_time = 0.0
+
+    def consume(self, now=None):
+        """Account for elapsed time and return (steps_due, should_broadcast) without stepping.
+
+        At most `max_steps_per_frame` steps are due per call; time beyond that
+        budget is dropped instead of being caught up later, which caps the CPU
+        cost of a match on an overloaded host.
+        """
+        if now is None:
+            now = time.monotonic()
+        if self.last_time is None:
+            self.last_time = now
+            self.last_broadcast = now - self.broadcast_interval
+
+        self.accumulator += now - self.last_time
+        self.last_time = now
+
+        max_backlog = self.max_steps_per_frame * self.dt
+        if self.accumulator > max_backlog:
+            self.dropped_time += self.accumulator - max_backlog
+            self.accumulator = max_backlog
+
+        steps = int(self.accumulator / self.dt)
+        self.accumulator -= steps * self.dt
+        self.tick += steps
+
+        should_broadcast = steps > 0 and now - self.last_broadcast >= self.broadcast_interval
+        if should_broadcast:
+            self.last_broadcast = now
+        return steps, should_broadcast
@@ -0,0 +1,150 @@
+import time
+from typing import Dict, Optional
+
+
+class PlayerState:
+    """A player taking part in an in-memory game"""
+    __slots__ = ('id', 'username', 'score', 'paddle_y', 'is_ready')
+
+    def __init__(self, id: str, username: str, score: int = 0, paddle_y: float = 250, is_ready: bool = False):
+        self.id = id
+        self.username = username
+        self.score = score
+        self.paddle_y = paddle_y
+        self.is_ready = is_ready
+
+    def __repr__(self):
+        return f"PlayerState(id={self.id!r}, username={self.username!r}, is_ready={self.is_ready})"
+
+    def to_wire(self) -> Dict:
+        return {
+            'id': self.id,
+            'username': self.username,
+            'score': self.score,
+            'paddle_y': self.paddle_y,
+            'is_ready': self.is_ready
+        }
+
+
+class Ball:
+    __slots__ = ('x', 'y', 'dx', 'dy', 'radius')
+
+    def __init__(self, x: float = 400, y: float = 300, dx: float = 40, dy: float = 40, radius: float = 10):
+        self.x = x
+        self.y = y
+        self.dx = dx
+        self.dy = dy
+        self.radius = radius
+
+    def to_wire(self) -> Dict:
+        return {'x': self.x, 'y': self.y, 'dx': self.dx, 'dy': self.dy, 'radius': self.radius}
+
+
+class Paddle:
+    __slots__ = ('x', 'y', 'width', 'height')
+
+    def __init__(self, x: float, y: float = 250, width: float = 20, height: float = 100):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    def to_wire(self) -> Dict:
+        return {'x': self.x, 'y': self.y, 'width': self.width, 'height': self.height}
+
+
+class GameState:
+    """Live state of one match, kept in GameStateManager._instances.
+
+    Slotted attributes instead of a tree of dicts keep each live match small
+    and make attribute access in the physics step cheap. `to_wire` builds the
+    JSON-serializable representation sent to clients and stored in
+    Game.game_state.
+    """
+    __slots__ = (
+        'ball', 'paddle1', 'paddle2', 'canvas_width', 'canvas_height',
+        'score1', 'score2', 'paddle_speed', 'status', 'player1', 'player2',
+        'start_time', 'last_update', 'winner', 'winner_id', 'end_reason',
+        'duration', 'duration_formatted', 'send_end_notification', 'end_notification_data',
+        'encoder', 'pending_inputs', 'input_acks', 'tick', 'history', 'input_lag',
+    )
+
+    def __init__(self, player1: PlayerState, canvas_width: float = 800, canvas_height: float = 600):
+        self.ball = Ball()
+        self.paddle1 = Paddle(x=50)
+        self.paddle2 = Paddle(x=730)
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        self.score1 = 0
+        self.score2 = 0
+        self.paddle_speed = 25
+        self.status = 'waiting'
+        self.player1 = player1
+        self.player2 = None
+        self.start_time = None
+        self.last_update = time.time()
+        self.winner = None
+        self.winner_id = None
+        self.end_reason = None
+        self.duration = None
+        self.duration_formatted = None
+        self.send_end_notification = False
+        self.end_notification_data = None
+        self.encoder = None  # DeltaEncoder, created on the first broadcast
+        self.pending_inputs = []  # (player_key, seq, direction, seen_tick) applied at the next tick
+        self.input_acks = {'player1': 0, 'player2': 0}  # Last applied input seq per player
+        self.tick = 0  # Physics steps simulated since the game started
+        self.history = None  # SnapshotHistory, created when the game starts playing
+        self.input_lag = {'player1': 0, 'player2': 0}  # Ticks between the state a player saw and their input
+
+    def get_player(self, player_key: str) -> Optional[PlayerState]:
+        return self.player1 if player_key == 'player1' else self.player2
+
+    def get_paddle(self, player_key: str) -> Paddle:
+        return self.paddle1 if player_key == 'player1' else self.paddle2
+
+    def player_key_for(self, player_id: str) -> Optional[str]:
+        """Return 'player1' or 'player2' for a player ID, or None if not in this game"""
+        if self.player1 and str(self.player1.id) == str(player_id):
+            return 'player1'
+        if self.player2 and str(self.player2.id) == str(player_id):
+            return 'player2'
+        return None
+
+    def player_ids(self) -> tuple:
+        return (
+            self.player1.id if self.player1 else None,
+            self.player2.id if self.player2 else None
+        )
+
+    def to_wire(self) -> Dict:
+        wire = {
+            'ball': self.ball.to_wire(),
+            'paddles': {
+                'player1': self.paddle1.to_wire(),
+                'player2': self.paddle2.to_wire()
+            },
+            'canvas': {'width': self.canvas_width, 'height': self.canvas_height},
+            'score': {'player1': self.score1, 'player2': self.score2},
+            'paddle_speed': self.paddle_speed,
+            'status': self.status,
+            'players': {
+                'player1': self.player1.to_wire() if self.player1 else None,
+                'player2': self.player2.to_wire() if self.player2 else None
+            },
+            'input_acks': dict(self.input_acks),
+            'tick': self.tick,
+            'start_time': self.start_time,
+            'last_update': self.last_update
+        }
+        if self.status == 'finished':
+            wire.update({
+                'winner': self.winner,
+                'winner_id': self.winner_id,
+                'end_reason': self.end_reason,
+                'duration': self.duration,
+                'duration_formatted': self.duration_formatted,
+                'score_player1': self.score1,
+                'score_player2': self.score2
+            })
+        return wire
@@ -1,91 +1,57 @@
 import time
 import random
-from dataclasses import dataclass
 from typing import Dict, Optional
+from .game_state import GameState, PlayerState
+from .delta import DeltaEncoder
+from .persistence import PersistenceQueue
+from . import wire
+from .collision import sweep_ball, bounce_dx, max_ball_speed
+from .snapshots import SnapshotHistory, max_rewind_ticks, TICK, BALL_X, BALL_Y, BALL_DX, BALL_DY
 
-@dataclass
-class PlayerState:
-    id: str
-    username: str
-    score: int = 0
-    paddle_y: float = 250
-    is_ready: bool = False
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'username': self.username,
-            'score': self.score,
-            'paddle_y': self.paddle_y,
-            'is_ready': self.is_ready
-        }
+WINNING_SCORE = 5
+MAX_PENDING_INPUTS = 64  # Per game; inputs beyond this before the next tick are dropped
 
 class GameStateManager:
-    _instances = {}  # Dictionary to store game states by game_id
-
-    @classmethod
-    def _serialize_game_state(cls, game_state):
-        """Convert game state to JSON serializable format"""
-        serialized = game_state.copy()
-        if 'players' in serialized:
-            players = serialized['players']
-            serialized['players'] = {
-                'player1': players['player1'].to_dict() if players['player1'] else None,
-                'player2': players['player2'].to_dict() if players['player2'] else None
-            }
-        return serialized
+    _instances = {}  # GameState objects by game_id
+    _batch = None  # BatchPhysics of step_games_batch
 
     @classmethod
     def create_game(cls, game_id: str, player1_id: str, player1_username: str):
         """Initialize a new game state"""
-        cls._instances[game_id] = {
-            'ball': {'x': 400, 'y': 300, 'dx': 40, 'dy': 40, 'radius': 10},
-            'paddles': {
-                'player1': {'x': 50, 'y': 250, 'width': 20, 'height': 100},
-                'player2': {'x': 730, 'y': 250, 'width': 20, 'height': 100}
-            },
-            'canvas': {'width': 800, 'height': 600},
-            'score': {'player1': 0, 'player2': 0},
-            'paddle_speed': 25,
-            'status': 'waiting',
-            'players': {
-                'player1': PlayerState(id=player1_id, username=player1_username, is_ready=False),
-                'player2': None
-            },
-            'start_time': None,
-            'last_update': time.time()
-        }
-        return cls._serialize_game_state(cls._instances[game_id])
+        cls._instances[game_id] = GameState(
+            player1=PlayerState(id=player1_id, username=player1_username, is_ready=False)
+        )
+        return cls._instances[game_id].to_wire()
 
     @classmethod
     def join_game(cls, game_id: str, player2_id: str, player2_username: str) -> Optional[Dict]:
         """Add second player to the game"""
         if game_id in cls._instances:
             game_state = cls._instances[game_id]
-            if game_state['status'] == 'waiting':
+            if game_state.status == 'waiting':
                 # Check if player2 already exists and has a different ID
-                if game_state['players']['player2'] and game_state['players']['player2'].id != player2_id:
-                    print(f"[DEBUG] Warning: Replacing player2 ID {game_state['players']['player2'].id} with {player2_id}")
+                if game_state.player2 and game_state.player2.id != player2_id:
+                    print(f"[DEBUG] Warning: Replacing player2 ID {game_state.player2.id} with {player2_id}")
 
                 # Make sure player2's ID is different from player1's ID
-                if game_state['players']['player1'] and game_state['players']['player1'].id == player2_id:
+                if game_state.player1 and game_state.player1.id == player2_id:
                     print(f"[DEBUG] Error: player2_id {player2_id} is the same as player1_id")
                     print(f"[DEBUG] This should not happen - players must have different IDs")
                     return None
 
                 # Create player2 state with the correct ID
-                game_state['players']['player2'] = PlayerState(
+                game_state.player2 = PlayerState(
                     id=player2_id,
                     username=player2_username,
                     is_ready=False
                 )
 
                 print(f"[DEBUG] Player 2 joined game {game_id}")
-                print(f"[DEBUG] Player 1: {game_state['players']['player1'].username} (ID: {game_state['players']['player1'].id})")
-                print(f"[DEBUG] Player 2: {game_state['players']['player2'].username} (ID: {game_state['players']['player2'].id})")
+                print(f"[DEBUG] Player 1: {game_state.player1.username} (ID: {game_state.player1.id})")
+                print(f"[DEBUG] Player 2: {game_state.player2.username} (ID: {game_state.player2.id})")
 
                 # Return the serialized game state
-                return cls._serialize_game_state(game_state)
+                return game_state.to_wire()
         return None
 
     @classmethod
@@ -97,8 +63,8 @@ class GameStateManager:
             return None
 
         game_state = cls._instances[game_id]
-        player1 = game_state['players']['player1']
-        player2 = game_state['players']['player2']
+        player1 = game_state.player1
+        player2 = game_state.player2
 
         print(f"[DEBUG] Current game state before update:")
         print(f"[DEBUG] - Player 1: {player1.username} (ID: {player1.id}) Ready: {player1.is_ready}")
@@ -130,24 +96,19 @@ class GameStateManager:
         # Check if both players are ready
         if (player1 and player2 and
             player1.is_ready and player2.is_ready and
-            game_state['status'] == 'waiting'):
+            game_state.status == 'waiting'):
             print(f"[DEBUG] Both players ready in game {game_id}, starting game")
-            game_state['status'] = 'playing'
-            game_state['start_time'] = time.time()
+            game_state.status = 'playing'
+            game_state.start_time = time.time()
 
             # Initialize ball with random direction
-            game_state['ball'].update({
-                'x': game_state['canvas']['width'] / 2,
-                'y': game_state['canvas']['height'] / 2,
-                'dx': 6 * (1 if random.random() > 0.5 else -1),
-                'dy': 6 * (1 if random.random() > 0.5 else -1)
-            })
+            cls._reset_ball(game_state)
 
         print(f"[DEBUG] Game state after update:")
         print(f"[DEBUG] - Player 1: {player1.username} (ID: {player1.id}) Ready: {player1.is_ready}")
         print(f"[DEBUG] - Player 2: {player2.username} (ID: {player2.id}) Ready: {player2.is_ready}" if player2 else "[DEBUG] - Player 2: Not joined yet")
 
-        return cls._serialize_game_state(game_state)
+        return game_state.to_wire()
 
     @classmethod
     def move_paddle(cls, game_id: str, player_id: str, direction: str) -> Optional[Dict]:
@@ -156,343 +117,381 @@ class GameStateManager:
             return None
 
         game_state = cls._instances[game_id]
-        if game_state['status'] != 'playing':
+        if game_state.status != 'playing':
             return None
 
         # Determine which paddle to move
         player_key = None
-        if player_id == game_state['players']['player1'].id:
+        if player_id == game_state.player1.id:
             player_key = 'player1'
-        elif game_state['players']['player2'] and player_id == game_state['players']['player2'].id:
+        elif game_state.player2 and player_id == game_state.player2.id:
             player_key = 'player2'
 
         if not player_key:
             return None
 
-        # Update paddle position
-        paddle = game_state['paddles'][player_key]
-        move_amount = game_state['paddle_speed']
+        cls._move_paddle(game_state, player_key, direction)
+        return game_state.to_wire()
+
+    @classmethod
+    def queue_input(cls, game_id: str, player_id: str, direction: str, seq: Optional[int] = None,
+                    seen_tick: Optional[int] = None, max_lag: Optional[int] = None) -> Optional[int]:
+        """Queue a paddle input to be applied at the next simulation tick.
+
+        `seq` is the client's input sequence number; inputs that are not newer
+        than the last one queued for that player are ignored. `seen_tick` is the
+        tick of the last state the client had displayed, used for lag
+        compensation; it is reported by the client, so `max_lag` (the ticks
+        allowed by the round trip the server measured on the connection)
+        bounds how far back it may be. Returns the sequence number assigned to
+        the input, or None if it was rejected.
+        """
+        game_state = cls._instances.get(game_id)
+        if game_state is None or game_state.status != 'playing' or direction not in ('up', 'down'):
+            return None
+
+        player_key = game_state.player_key_for(player_id)
+        if not player_key:
+            return None
+
+        last_seq = game_state.input_acks[player_key]
+        for queued in game_state.pending_inputs:
+            if queued[0] == player_key:
+                last_seq = queued[1]
+        if seq is None:
+            seq = last_seq + 1
+        else:
+            try:
+                seq = int(seq)
+            except (TypeError, ValueError):
+                return None
+            if seq <= last_seq:
+                return None
+
+        try:
+            seen_tick = int(seen_tick) if seen_tick is not None else None
+            if seen_tick is not None and max_lag is not None:
+                seen_tick = max(seen_tick, game_state.tick - max(0, int(max_lag)))
+        except (TypeError, ValueError):
+            seen_tick = None
+
+        if len(game_state.pending_inputs) >= MAX_PENDING_INPUTS:
+            return None
+        game_state.pending_inputs.append((player_key, seq, direction, seen_tick))
+        return seq
+
+    @classmethod
+    def apply_inputs(cls, game_state: GameState) -> bool:
+        """Apply the queued inputs of a game in arrival order. Returns True if any were applied."""
+        if not game_state.pending_inputs:
+            return False
+        for player_key, seq, direction, seen_tick in game_state.pending_inputs:
+            cls._move_paddle(game_state, player_key, direction)
+            game_state.input_acks[player_key] = seq
+            if seen_tick is not None:
+                game_state.input_lag[player_key] = max(0, game_state.tick - seen_tick)
+        game_state.pending_inputs = []
+        return True
+
+    @classmethod
+    def record_snapshot(cls, game_state: GameState, tick: int):
+        """Advance the game's tick counter and store its positions in the snapshot history"""
+        if game_state.history is None:
+            game_state.history = SnapshotHistory()
+        game_state.tick = tick
+        game_state.history.record(tick, game_state)
+
+    @classmethod
+    def compensate_lag(cls, game_state: GameState) -> bool:
+        """Grant a lagging defender the paddle hit they saw on their screen.
+
+        A player's paddle inputs were made while looking at a state that is
+        `input_lag` ticks old, as claimed by the client and bounded by the
+        round trip of its connection (see queue_input). Once the ball has got
+        past a defender's paddle, the ball is rewound through the snapshot
+        history (at most GAME_MAX_REWIND_MS) to the moment it reached the
+        paddle face. If the
+        defender's current paddle covers that position, the ball is restored
+        there and bounced as a regular hit. Returns True if a hit was granted.
+
+        The rewind can only happen before the ball reaches the goal line, so
+        at high ball speeds the effective window is shorter than the maximum.
+        """
+        history = game_state.history
+        ball = game_state.ball
+        if history is None or not history.count or ball.dx == 0:
+            return False
+
+        if ball.dx < 0:
+            player_key, paddle = 'player1', game_state.paddle1
+            face = paddle.x + paddle.width
+            in_front = lambda x: x - ball.radius > face
+        else:
+            player_key, paddle = 'player2', game_state.paddle2
+            face = paddle.x
+            in_front = lambda x: x + ball.radius < face
+        if in_front(ball.x):
+            return False
+
+        lag = min(game_state.input_lag[player_key], max_rewind_ticks())
+        if lag <= 0:
+            return False
+
+        oldest_tick = game_state.tick - lag
+        for snapshot in history.newest_first():
+            if snapshot[TICK] < oldest_tick:
+                break
+            if not in_front(snapshot[BALL_X]):
+                continue
+            # Last position before the ball got past the paddle face
+            if (snapshot[BALL_DX] * ball.dx > 0 and
+                    paddle.y <= snapshot[BALL_Y] <= paddle.y + paddle.height):
+                ball.x = snapshot[BALL_X]
+                ball.y = snapshot[BALL_Y]
+                ball.dx = bounce_dx(snapshot[BALL_DX], max_ball_speed())
+                ball.dy = snapshot[BALL_DY]
+                return True
+            return False
+        return False
+
+    @classmethod
+    def _move_paddle(cls, game_state: GameState, player_key: str, direction: str):
+        paddle = game_state.get_paddle(player_key)
+        move_amount = game_state.paddle_speed
 
         if direction == 'up':
-            paddle['y'] = max(0, paddle['y'] - move_amount)
+            paddle.y = max(0, paddle.y - move_amount)
         elif direction == 'down':
-            paddle['y'] = min(
-                game_state['canvas']['height'] - paddle['height'],
-                paddle['y'] + move_amount
+            paddle.y = min(
+                game_state.canvas_height - paddle.height,
+                paddle.y + move_amount
             )
 
-        return cls._serialize_game_state(game_state)
-
     @classmethod
-    def update_ball_position(cls, game_id: str) -> Optional[Dict]:
-        """Update ball position and handle collisions"""
-        if game_id not in cls._instances:
+    def update_ball_position(cls, game_id: str, step_scale: float = 1.0) -> Optional[GameState]:
+        """Advance the ball by one physics step and handle collisions.
+
+        `step_scale` scales the per-step velocity, so that engines running at a
+        tick rate other than the base rate keep the same game speed. Returns the
+        live GameState, or None if the game is not playing.
+        """
+        game_state = cls._instances.get(game_id)
+        if game_state is None or game_state.status != 'playing':
             return None
 
-        game_state = cls._instances[game_id]
-        if game_state['status'] != 'playing':
-            return None
+        ball = game_state.ball
 
-        ball = game_state['ball']
-        current_time = time.time()
-
-        # Only log ball position every 5 seconds
-        if not hasattr(cls, '_last_ball_log') or current_time - cls._last_ball_log >= 5:
-            # Debug message disabled
-            # print(f"[DEBUG] Ball position - x: {ball['x']:.1f}, y: {ball['y']:.1f}, dx: {ball['dx']}, dy: {ball['dy']}")
-            cls._last_ball_log = current_time
-
-        # Update ball position
-        ball['x'] += ball['dx']
-        ball['y'] += ball['dy']
-
-        # Wall collisions (top/bottom)
-        if ball['y'] - ball['radius'] <= 0 or ball['y'] + ball['radius'] >= game_state['canvas']['height']:
-            ball['dy'] *= -1
-
-        # Paddle collisions
-        for player_key in ['player1', 'player2']:
-            paddle = game_state['paddles'][player_key]
-            if (ball['x'] - ball['radius'] <= paddle['x'] + paddle['width'] and
-                ball['x'] + ball['radius'] >= paddle['x'] and
-                ball['y'] >= paddle['y'] and
-                ball['y'] <= paddle['y'] + paddle['height']):
-                ball['dx'] *= -1.1  # Reduced speed increase on paddle hits from 1.1 to 1.05
-                break
+        # Move the ball, bouncing off walls and paddles along the way
+        sweep_ball(ball, game_state.paddle1, game_state.paddle2, game_state.canvas_height,
+                   step_scale, max_ball_speed())
+
+        cls._score_points(game_id, game_state)
+        return game_state
 
-        # Score points
-        if ball['x'] - ball['radius'] <= 0:
+    @classmethod
+    def _score_points(cls, game_id: str, game_state: GameState):
+        """Score the point of a ball that reached a goal line and serve again, or finish the game"""
+        ball = game_state.ball
+        if ball.x - ball.radius <= 0:
             # Player 2 scores
-            game_state['score']['player2'] += 1
+            game_state.score2 += 1
             cls._reset_ball(game_state)
-        elif ball['x'] + ball['radius'] >= game_state['canvas']['width']:
+        elif ball.x + ball.radius >= game_state.canvas_width:
             # Player 1 scores
-            game_state['score']['player1'] += 1
+            game_state.score1 += 1
             cls._reset_ball(game_state)
 
         # Check for game end
-        if game_state['score']['player1'] >= 5 or game_state['score']['player2'] >= 5:
-            print(f"[DEBUG] Game {game_id} has ended! Scores: {game_state['score']['player1']} - {game_state['score']['player2']}")
-            game_state['status'] = 'finished'
-            # COMMENTED OUT: Centralizing winner determination to end_game method only
-            game_state['winner'] = 'player1' if game_state['score']['player1'] > game_state['score']['player2'] else 'player2'
-            print(f"[DEBUG] Game {game_id} winner: {game_state['winner']}")
+        if game_state.score1 >= WINNING_SCORE or game_state.score2 >= WINNING_SCORE:
+            cls._finish_game(game_id, game_state)
 
-            # Calculate duration
-            if 'start_time' in game_state:
-                duration = int(time.time() - game_state['start_time'])
-                minutes = duration // 60
-                seconds = duration % 60
-                game_state['duration'] = duration
-                game_state['duration_formatted'] = f"{minutes:02d}:{seconds:02d}"
-            else:
-                game_state['duration'] = 0
-                game_state['duration_formatted'] = "00:00"
+    @classmethod
+    def step_games_batch(cls, game_ids, steps, step_scale: float = 1.0):
+        """Advance several games at once with the vectorized NumPy backend.
+
+        `steps` gives the number of physics steps due for each game. The games
+        stay attached to one BatchPhysics between calls, so only the games
+        whose ball reached a goal line are handled one by one: in the order of
+        `game_ids`, each scores its point, serves, and plays the steps it has
+        left with update_ball_position. Games are therefore played as if
+        stepped one after the other, and random serves are drawn in the same
+        order as on the scalar path, whatever the number of steps.
+        """
+        batch = cls.get_batch()
+        slots = [batch.attach(game_id, cls._instances[game_id]) for game_id in game_ids]
+        for i, steps_left in batch.run(slots, steps, step_scale):
+            game_id = game_ids[i]
+            game_state = cls._instances[game_id]
+            cls._score_points(game_id, game_state)
+            for _ in range(steps_left):
+                if cls.update_ball_position(game_id, step_scale) is None:
+                    break
 
-            # Save the game state to the database at the end of the game
-            cls.save_game_state_to_db(game_id, game_state)
+    @classmethod
+    def get_batch(cls):
+        """BatchPhysics holding the games stepped by step_games_batch, created on first use"""
+        if cls._batch is None:
+            from .batch_physics import BatchPhysics
+            cls._batch = BatchPhysics()
+        return cls._batch
 
-            # Mark game for sending end notification
-            game_state['_send_end_notification'] = True
-            print(f"[DEBUG] Game {game_id} marked for end notification")
-
-            # Store end game data for notification
-            winner_key = game_state['winner']
-            winner_id = None
-
-            if 'players' in game_state and winner_key in game_state['players']:
-                if hasattr(game_state['players'][winner_key], 'id'):
-                    winner_id = game_state['players'][winner_key].id
-                    print(f"[DEBUG] Found winner ID from attribute: {winner_id}")
-                elif isinstance(game_state['players'][winner_key], dict) and 'id' in game_state['players'][winner_key]:
-                    winner_id = game_state['players'][winner_key]['id']
-                    print(f"[DEBUG] Found winner ID from dict: {winner_id}")
-            else:
-                print(f"[DEBUG] Could not find winner ID. Players: {game_state.get('players', 'None')}")
-
-            # Store notification data
-            game_state['_end_notification_data'] = {
-                'type': 'game_end_message',
-                'game_id': game_id,  # Add game_id to the notification data
-                'winner': winner_key,
-                'winner_id': winner_id,
-                'duration': game_state.get('duration', 0),
-                'duration_formatted': game_state.get('duration_formatted', '00:00'),
-                'final_score': {
-                    'player1': game_state['score']['player1'],
-                    'player2': game_state['score']['player2']
-                }
-            }
-            print(f"[DEBUG] End notification data prepared: {game_state['_end_notification_data']}")
+    @classmethod
+    def release_batch_slot(cls, game_id: str):
+        """Take a game that stopped playing or left memory out of the batch backend"""
+        if cls._batch is not None:
+            cls._batch.release(game_id)
 
-        return cls._serialize_game_state(game_state)
+    @classmethod
+    def _finish_game(cls, game_id: str, game_state: GameState):
+        """Mark a game whose winning score was reached as finished and prepare the end notification"""
+        print(f"[DEBUG] Game {game_id} has ended! Scores: {game_state.score1} - {game_state.score2}")
+        game_state.status = 'finished'
+        game_state.winner = 'player1' if game_state.score1 > game_state.score2 else 'player2'
+        winner = game_state.get_player(game_state.winner)
+        game_state.winner_id = winner.id if winner else None
+        print(f"[DEBUG] Game {game_id} winner: {game_state.winner}")
+
+        # Calculate duration
+        cls._set_duration(game_state)
+
+        # Save the game state to the database at the end of the game
+        cls.save_game_state_to_db(game_id, game_state)
+
+        # Mark game for sending end notification
+        game_state.send_end_notification = True
+        print(f"[DEBUG] Game {game_id} marked for end notification")
+
+        # Store notification data
+        game_state.end_notification_data = {
+            'type': 'game_end_message',
+            'game_id': game_id,  # Add game_id to the notification data
+            'winner': game_state.winner,
+            'winner_id': game_state.winner_id,
+            'duration': game_state.duration,
+            'duration_formatted': game_state.duration_formatted,
+            'final_score': {
+                'player1': game_state.score1,
+                'player2': game_state.score2
+            }
+        }
+        print(f"[DEBUG] End notification data prepared: {game_state.end_notification_data}")
 
     @classmethod
     def end_game(cls, game_id: str, reason: str = 'finished') -> Optional[Dict]:
         """End the game and determine winner"""
         if game_id in cls._instances:
             game_state = cls._instances[game_id]
-            game_state['status'] = 'finished'
-            game_state['end_reason'] = reason
+            game_state.status = 'finished'
+            game_state.end_reason = reason
 
             # Calculate duration
-            if game_state['start_time']:
-                duration = int(time.time() - game_state['start_time'])
-                minutes = duration // 60
-                seconds = duration % 60
-                game_state['duration'] = duration
-                game_state['duration_formatted'] = f"{minutes:02d}:{seconds:02d}"
-            else:
-                game_state['duration'] = 0
-                game_state['duration_formatted'] = "00:00"
+            cls._set_duration(game_state)
 
             # Determine winner if not already set
-            if 'winner' not in game_state:
-                if game_state['score']['player1'] > game_state['score']['player2']:
-                    game_state['winner'] = 'player1'
-                    game_state['winner_id'] = game_state['players']['player1'].id
-                    game_state['score_player1'] = game_state['score']['player1']
-                    game_state['score_player2'] = game_state['score']['player2']
-                elif game_state['score']['player2'] > game_state['score']['player1']:
-                    game_state['winner'] = 'player2'
-                    game_state['winner_id'] = game_state['players']['player2'].id
-                    game_state['score_player1'] = game_state['score']['player1']
-                    game_state['score_player2'] = game_state['score']['player2']
+            if game_state.winner is None:
+                if game_state.score1 > game_state.score2:
+                    game_state.winner = 'player1'
+                    game_state.winner_id = game_state.player1.id
+                elif game_state.score2 > game_state.score1:
+                    game_state.winner = 'player2'
+                    game_state.winner_id = game_state.player2.id
                 else:
-                    game_state['winner'] = None
-                    game_state['winner_id'] = None
-                    game_state['score_player1'] = game_state['score']['player1']
-                    game_state['score_player2'] = game_state['score']['player2']
+                    game_state.winner = None
+                    game_state.winner_id = None
 
             # Save the complete game state to the database
             cls.save_game_state_to_db(game_id, game_state)
 
-            return cls._serialize_game_state(game_state)
+            return game_state.to_wire()
         return None
 
     @classmethod
-    def _reset_ball(cls, game_state: Dict):
+    def _set_duration(cls, game_state: GameState):
+        """Compute the game duration from its start time"""
+        if game_state.start_time:
+            duration = int(time.time() - game_state.start_time)
+            minutes = duration // 60
+            seconds = duration % 60
+            game_state.duration = duration
+            game_state.duration_formatted = f"{minutes:02d}:{seconds:02d}"
+        else:
+            game_state.duration = 0
+            game_state.duration_formatted = "00:00"
+
+    @classmethod
+    def _reset_ball(cls, game_state: GameState):
         """Reset ball to center after point scored"""
-        game_state['ball'].update({
-            'x': game_state['canvas']['width'] / 2,
-            'y': game_state['canvas']['height'] / 2,
-            'dx': 6 * (1 if random.random() > 0.5 else -1),
-            'dy': 6 * (1 if random.random() > 0.5 else -1)
-        })
+        ball = game_state.ball
+        ball.x = game_state.canvas_width / 2
+        ball.y = game_state.canvas_height / 2
+        ball.dx = 6 * (1 if random.random() > 0.5 else -1)
+        ball.dy = 6 * (1 if random.random() > 0.5 else -1)
 
     @classmethod
     def get_game_state(cls, game_id: str) -> Optional[Dict]:
         """Get the current game state"""
         state = cls._instances.get(game_id)
         if state:
-            return cls._serialize_game_state(state)
+            return state.to_wire()
         return None
 
     @classmethod
-    def game_exists(cls, game_id: str) -> bool:
-        """Check if a game exists in memory"""
-        return game_id in cls._instances
+    def state_update_event(cls, game_id: str, keyframe: bool = False) -> Optional[Dict]:
+        """Build the next game_state_update event to broadcast to the game group.
+
+        Returns a delta against the previous broadcast unless `keyframe` is set
+        or a periodic keyframe is due. Deltas also carry the packed binary
+        `frame` for clients that negotiated the binary subprotocol.
+        """
+        game_state = cls._instances.get(game_id)
+        if game_state is None:
+            return None
+        if game_state.encoder is None:
+            game_state.encoder = DeltaEncoder()
+        event = game_state.encoder.encode(game_state.to_wire(), keyframe)
+        if event['update_type'] == 'delta' and wire.binary_enabled():
+            event['frame'] = wire.pack_state(game_state, event['seq'])
+        return event
 
     @classmethod
-    def save_game_state_to_db(cls, game_id: str, game_state: Dict):
-        """Save the complete game state to the database"""
-        # Print debug message showing the game_state data
-        # Debug message disabled
-        # print(f"[DEBUG] Game state data received: {game_state}")
-
-        # Use sync_to_async to handle database operations from async context
-        import asyncio
-        from asgiref.sync import sync_to_async
+    def keyframe_event(cls, game_id: str) -> Optional[Dict]:
+        """Keyframe for a single client that missed a delta.
+
+        Carries the state of the last broadcast with its sequence number, so
+        the group's next delta applies on top of it and the other members are
+        not sent anything. Before the first broadcast it is the current state.
+        """
+        game_state = cls._instances.get(game_id)
+        if game_state is None:
+            return None
+        if game_state.encoder is not None:
+            event = game_state.encoder.baseline()
+            if event is not None:
+                return event
+        return {'type': 'game_state_update', 'update_type': 'all', 'seq': 0, 'game_state': game_state.to_wire()}
 
-        # Check if we're in an async context
-        try:
-            asyncio.get_running_loop()
-            is_async = True
-        except RuntimeError:
-            is_async = False
-
-        if is_async:
-            # We're in an async context, use the async version
-            asyncio.create_task(cls._save_game_state_to_db_async(game_id, game_state))
-        else:
-            # We're in a sync context, use the sync version directly
-            cls._save_game_state_to_db_sync(game_id, game_state)
+    @classmethod
+    def get_player_ids(cls, game_id: str) -> tuple:
+        """IDs of the players in a game, None for an empty slot"""
+        game_state = cls._instances.get(game_id)
+        if game_state is None:
+            return ()
+        return game_state.player_ids()
 
     @classmethod
-    async def _save_game_state_to_db_async(cls, game_id: str, game_state: Dict):
-        """Async version of save_game_state_to_db"""
-        from asgiref.sync import sync_to_async
-        try:
-            await sync_to_async(cls._save_game_state_to_db_sync)(game_id, game_state)
-        except Exception as e:
-            print(f"[ERROR] Failed to save game state to database (async): {str(e)}")
+    def game_exists(cls, game_id: str) -> bool:
+        """Check if a game exists in memory"""
+        return game_id in cls._instances
 
     @classmethod
-    def _save_game_state_to_db_sync(cls, game_id: str, game_state: Dict):
-        """Synchronous implementation of saving game state to database"""
-        try:
-            from django.apps import apps
-            Game = apps.get_model('game', 'Game')
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-
-            # Get the game from the database
-            game = Game.objects.get(id=game_id)
-
-            # Update the game state field with the complete state
-            game.game_state = cls._serialize_game_state(game_state)
-
-            # Update other relevant fields
-            if 'score_player1' in game_state:
-                game.score_player1 = game_state['score_player1']
-                print(f"[DEBUG] Setting score_player1 from direct field: {game.score_player1}")
-            elif 'score' in game_state and 'player1' in game_state['score']:
-                game.score_player1 = game_state['score']['player1']
-                print(f"[DEBUG] Setting score_player1 from score.player1: {game.score_player1}")
-
-            if 'score_player2' in game_state:
-                game.score_player2 = game_state['score_player2']
-                print(f"[DEBUG] Setting score_player2 from direct field: {game.score_player2}")
-            elif 'score' in game_state and 'player2' in game_state['score']:
-                game.score_player2 = game_state['score']['player2']
-                print(f"[DEBUG] Setting score_player2 from score.player2: {game.score_player2}")
-
-            # Calculate and set duration if the game is finished
-            if 'status' in game_state and game_state['status'] == 'finished' and 'start_time' in game_state:
-                import time
-                from datetime import timedelta
-
-                # Calculate duration in seconds
-                end_time = time.time()
-                start_time = game_state['start_time']
-                duration_seconds = end_time - start_time
-
-                # Set duration in seconds
-                game.duration = duration_seconds
-                print(f"[DEBUG] Setting game duration: {duration_seconds} seconds")
-
-                # Format duration as mm:ss
-                duration_td = timedelta(seconds=duration_seconds)
-                minutes, seconds = divmod(duration_td.seconds, 60)
-                duration_formatted = f"{minutes:02d}:{seconds:02d}"
-
-                # Set formatted duration
-                game.duration_formatted = duration_formatted
-                print(f"[DEBUG] Setting formatted duration: {duration_formatted}")
-            elif 'duration' in game_state:
-                game.duration = game_state['duration']
-                print(f"[DEBUG] Setting duration from game_state: {game_state['duration']}")
-
-            if 'duration_formatted' in game_state and not (game.duration_formatted):
-                game.duration_formatted = game_state['duration_formatted']
-                print(f"[DEBUG] Setting duration_formatted from game_state: {game_state['duration_formatted']}")
-
-            # Set status to finished
-            if 'status' in game_state and game_state['status'] == 'finished':
-                game.status = 'finished'
-                print(f"[DEBUG] Setting game status to finished")
-
-            # Set winner if available - COMMENTED OUT TO CENTRALIZE WINNER DETERMINATION
-            # Only the score comparison in end_game method will set the winner
-            if 'winner' in game_state:
-                print(f"[DEBUG] Winner found in game_state: {game_state['winner']}")
-                winner_id = None
-
-                if game_state['winner'] == 'player1' and 'players' in game_state and 'player1' in game_state['players']:
-                    if hasattr(game_state['players']['player1'], 'id'):
-                        winner_id = game_state['players']['player1'].id
-                    elif isinstance(game_state['players']['player1'], dict) and 'id' in game_state['players']['player1']:
-                        winner_id = game_state['players']['player1']['id']
-
-                elif game_state['winner'] == 'player2' and 'players' in game_state and 'player2' in game_state['players']:
-                    if hasattr(game_state['players']['player2'], 'id'):
-                        winner_id = game_state['players']['player2'].id
-                    elif isinstance(game_state['players']['player2'], dict) and 'id' in game_state['players']['player2']:
-                        winner_id = game_state['players']['player2']['id']
-
-                if winner_id:
-                    try:
-                        print(f"[DEBUG] Setting winner with ID: {winner_id}")
-                        game.winner = User.objects.get(id=winner_id)
-                    except Exception as e:
-                        print(f"[ERROR] Failed to set winner: {str(e)}")
-
-            # Save the game
-            game.save()
-            print(f"[DEBUG] Game state saved to database for game {game_id} with scores: player1={game.score_player1}, player2={game.score_player2}, status={game.status}, winner={game.winner_id if hasattr(game, 'winner_id') else None}")
-
-            # Si le jeu est terminé, nettoyer les parties inactives
-            if game.status == 'finished':
-                try:
-                    print("[DEBUG] DÉBUT DU NETTOYAGE DES PARTIES INACTIVES")
-                    from .utils import cleanup_inactive_games
-                    result = cleanup_inactive_games()
-                    print(f"[DEBUG] FIN DU NETTOYAGE DES PARTIES INACTIVES: {result}")
-                except Exception as e:
-                    print(f"[ERROR] Erreur lors du nettoyage des parties inactives: {str(e)}")
-
-        except Exception as e:
-            print(f"[ERROR] Failed to save game state to database (sync): {str(e)}")
+    def save_game_state_to_db(cls, game_id: str, game_state: GameState):
+        """Save the complete game state to the database.
+
+        The write goes through the write-behind PersistenceQueue, so callers in
+        the tick loop never wait on the database.
+        """
+        # Snapshot the state now; the live object keeps changing while the write is pending
+        PersistenceQueue.enqueue(game_id, game_state.to_wire())
 
     @classmethod
     def remove_game(cls, game_id: str):
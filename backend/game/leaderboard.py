@@ -0,0 +1,192 @@
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from django.conf import settings
+from django.db.models import Q
+
+try:
+    import redis
+except ImportError:  # Only the database leaderboard is available without the redis client
+    redis = None
+
+logger = logging.getLogger('game')
+
+LEADERBOARD_KEY = 'game:leaderboard'  # Sorted set of user ids scored by rating
+LOADED_KEY = 'game:leaderboard:loaded'  # Set once the sorted set holds every PlayerStats row
+
+
+class DatabaseLeaderboard:
+    """Ranks read from PlayerStats through its rating index.
+
+    Players with the same rating are ordered by user id, in `top` and in
+    `rank` alike, so a player's rank is their position in the pages.
+    """
+
+    def update(self, ratings: Dict[int, float]):
+        pass  # PlayerStats is the leaderboard
+
+    def reset(self):
+        pass
+
+    def top(self, offset: int, limit: int) -> List[Tuple[int, float]]:
+        from .models import PlayerStats
+        return list(
+            PlayerStats.objects.order_by('-rating', 'user_id')
+            .values_list('user_id', 'rating')[offset:offset + limit]
+        )
+
+    def rank(self, user_id: int) -> Optional[int]:
+        from .models import PlayerStats
+        rating = PlayerStats.objects.filter(user_id=user_id).values_list('rating', flat=True).first()
+        if rating is None:
+            return None
+        ahead = Q(rating__gt=rating) | Q(rating=rating, user_id__lt=user_id)
+        return PlayerStats.objects.filter(ahead).count() + 1
+
+    def size(self) -> int:
+        from .models import PlayerStats
+        return PlayerStats.objects.count()
+
+
+class RedisLeaderboard:
+    """Ratings mirrored in a Redis sorted set: O(log n) ranks and top-N pages.
+
+    The set is loaded from PlayerStats the first time it is read after Redis
+    was emptied (or on a fresh deployment), so nothing is lost with it.
+    """
+
+    def __init__(self, url: Optional[str] = None):
+        if redis is None:
+            raise RuntimeError("The redis package is required for GAME_LEADERBOARD_BACKEND = 'redis'")
+        self.client = redis.Redis.from_url(
+            url or settings.GAME_LEADERBOARD_REDIS_URL,
+            socket_timeout=1, socket_connect_timeout=1, decode_responses=True
+        )
+        self._load_lock = threading.Lock()
+        self._checked_at = None  # When the set was last seen loaded
+
+    # Seconds between checks that the sorted set was not emptied
+    LOADED_CHECK_INTERVAL = 60.0
+
+    def update(self, ratings: Dict[int, float]):
+        if ratings:
+            self.client.zadd(LEADERBOARD_KEY, {str(user_id): rating for user_id, rating in ratings.items()})
+
+    def reset(self):
+        self.client.delete(LEADERBOARD_KEY, LOADED_KEY)
+        self._checked_at = None
+
+    def top(self, offset: int, limit: int) -> List[Tuple[int, float]]:
+        self._ensure_loaded()
+        entries = self.client.zrevrange(LEADERBOARD_KEY, offset, offset + limit - 1, withscores=True)
+        return [(int(user_id), rating) for user_id, rating in entries]
+
+    def rank(self, user_id: int) -> Optional[int]:
+        self._ensure_loaded()
+        rank = self.client.zrevrank(LEADERBOARD_KEY, str(user_id))
+        return None if rank is None else rank + 1
+
+    def size(self) -> int:
+        self._ensure_loaded()
+        return self.client.zcard(LEADERBOARD_KEY)
+
+    def _ensure_loaded(self):
+        if self._loaded():
+            return
+        with self._load_lock:
+            if self._loaded():
+                return
+            from .models import PlayerStats
+            ratings = PlayerStats.objects.values_list('user_id', 'rating').iterator(chunk_size=5000)
+            batch = {}
+            for user_id, rating in ratings:
+                batch[str(user_id)] = rating
+                if len(batch) >= 5000:
+                    self.client.zadd(LEADERBOARD_KEY, batch)
+                    batch = {}
+            if batch:
+                self.client.zadd(LEADERBOARD_KEY, batch)
+            self.client.set(LOADED_KEY, 1)
+            self._checked_at = time.monotonic()
+            logger.info("Leaderboard loaded from PlayerStats")
+
+    def _loaded(self) -> bool:
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.LOADED_CHECK_INTERVAL:
+            return True
+        if self.client.exists(LOADED_KEY):
+            self._checked_at = now
+            return True
+        return False
+
+
+LEADERBOARD_BACKENDS = {
+    'database': DatabaseLeaderboard,
+    'redis': RedisLeaderboard,
+}
+
+
+class Leaderboard:
+    """Players ordered by rating.
+
+    PlayerStats holds the ratings; game.ratings pushes every change here once
+    it is committed. With GAME_LEADERBOARD_BACKEND = 'redis' the ranking is
+    also kept in a sorted set, so a rank is a ZREVRANK and a page a
+    ZREVRANGE whatever the number of players; if Redis cannot be reached,
+    reads fall back to the database, which can answer the same queries from
+    its rating index. Nothing here reads Game rows.
+
+    Ranks start at 1. Methods are synchronous.
+    """
+    _backend = None
+    _fallback = DatabaseLeaderboard()
+
+    @classmethod
+    def get_backend(cls):
+        if cls._backend is None:
+            name = getattr(settings, 'GAME_LEADERBOARD_BACKEND', 'database')
+            if name not in LEADERBOARD_BACKENDS:
+                raise ValueError(f"Unknown GAME_LEADERBOARD_BACKEND {name!r}, expected one of {sorted(LEADERBOARD_BACKENDS)}")
+            cls._backend = LEADERBOARD_BACKENDS[name]()
+        return cls._backend
+
+    @classmethod
+    def _read(cls, method: str, *args):
+        try:
+            return getattr(cls.get_backend(), method)(*args)
+        except Exception as e:
+            if cls.get_backend() is cls._fallback:
+                raise
+            logger.error(f"Leaderboard {method} failed, reading from the database: {str(e)}")
+            return getattr(cls._fallback, method)(*args)
+
+    @classmethod
+    def update(cls, ratings: Dict[int, float]):
+        """Record the new ratings of {user_id: rating}"""
+        try:
+            cls.get_backend().update(ratings)
+        except Exception as e:
+            logger.error(f"Failed to update the leaderboard for {len(ratings)} players: {str(e)}")
+
+    @classmethod
+    def reset(cls):
+        """Forget the ranking so it is reloaded from PlayerStats, after they were recomputed"""
+        try:
+            cls.get_backend().reset()
+        except Exception as e:
+            logger.error(f"Failed to reset the leaderboard: {str(e)}")
+
+    @classmethod
+    def top(cls, offset: int = 0, limit: int = 20) -> List[Tuple[int, float]]:
+        """(user_id, rating) of the players ranked offset + 1 to offset + limit"""
+        return cls._read('top', offset, limit)
+
+    @classmethod
+    def rank(cls, user_id) -> Optional[int]:
+        """Rank of `user_id`, None if they have not played a rated game"""
+        return cls._read('rank', int(user_id))
+
+    @classmethod
+    def size(cls) -> int:
+        return cls._read('size')
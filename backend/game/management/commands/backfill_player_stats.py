@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from game.leaderboard import Leaderboard
+from game.models import Game, PlayerStats, RatingChange
+from game.ratings import RESULT_FIELDS, apply_result, initial_rating, is_counted
+
+
+class Command(BaseCommand):
+    help = 'Recompute every PlayerStats row and rating by replaying the finished games in order'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per bulk INSERT')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        stats = {}  # user_id -> PlayerStats
+        changes = []
+
+        # Results finishing while this runs may fail to be counted; run it when no games are played
+        with transaction.atomic():
+            games = (
+                Game.objects.filter(status='finished', player2__isnull=False, winner__isnull=False)
+                .order_by('created_at', 'id')
+                .only(*RESULT_FIELDS)
+            )
+            for game in games.iterator(chunk_size=batch_size):
+                if not is_counted(game):
+                    continue
+                for user_id in (game.player1_id, game.player2_id):
+                    if user_id not in stats:
+                        stats[user_id] = PlayerStats(user_id=user_id, rating=initial_rating())
+                changes.append(RatingChange(game_id=game.id, delta=apply_result(game, stats)))
+
+            RatingChange.objects.all().delete()
+            PlayerStats.objects.all().delete()
+            RatingChange.objects.bulk_create(changes, batch_size=batch_size)
+            PlayerStats.objects.bulk_create(stats.values(), batch_size=batch_size)
+            transaction.on_commit(Leaderboard.reset)
+
+        self.stdout.write(f"Counted {len(changes)} games for {len(stats)} players")
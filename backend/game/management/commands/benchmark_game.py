@@ -0,0 +1,245 @@
+import json
+import random
+import time
+import tracemalloc
+from django.core.management.base import BaseCommand, CommandError
+from game.game_state_manager import GameStateManager
+from game.game_state import PlayerState, Ball, Paddle
+from game.collision import sweep_ball, bounce_dx
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the in-memory game engine (no database or channel layer needed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', choices=['physics', 'memory', 'wire', 'collision', 'sharding'], help='Benchmark to run')
+        parser.add_argument('--games', type=int, nargs='+', default=[10, 1000, 10000],
+                            help='Number of concurrent games to simulate')
+        parser.add_argument('--steps', type=int, default=100, help='Physics steps per run')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--cases', type=int, default=20000, help='Random cases for the collision and sharding runs')
+        parser.add_argument('--workers', type=int, nargs='+', default=[2, 4, 8, 16],
+                            help='Worker counts for the sharding checks')
+
+    def handle(self, *args, **options):
+        getattr(self, f"bench_{options['suite']}")(options)
+
+    def make_games(self, count, seed):
+        """Build `count` playing games with randomized ball and paddle positions"""
+        rng = random.Random(seed)
+        instances = {}
+        for i in range(count):
+            game_id = str(i)
+            GameStateManager._instances = instances
+            GameStateManager.create_game(game_id, f"{i}a", 'player1')
+            game_state = instances[game_id]
+            game_state.player2 = PlayerState(id=f"{i}b", username='player2')
+            game_state.status = 'playing'
+            game_state.ball.x = rng.uniform(100, 700)
+            game_state.ball.y = rng.uniform(50, 550)
+            game_state.ball.dx = 6 * rng.choice((1, -1))
+            game_state.ball.dy = 6 * rng.choice((1, -1))
+            game_state.paddle1.y = rng.uniform(0, 500)
+            game_state.paddle2.y = rng.uniform(0, 500)
+        return instances
+
+    def physics_state(self, game_state):
+        wire = game_state.to_wire()
+        return wire['ball'], wire['score'], wire['status']
+
+    def bench_physics(self, options):
+        from game import batch_physics
+        if not batch_physics.is_available():
+            raise CommandError('NumPy is not installed')
+
+        saved_instances, saved_batch = GameStateManager._instances, GameStateManager._batch
+        try:
+            for count in options['games']:
+                steps = options['steps']
+
+                scalar_games = self.make_games(count, options['seed'])
+                GameStateManager._instances = scalar_games
+                game_ids = list(scalar_games)
+                random.seed(options['seed'])
+                started = time.perf_counter()
+                for _ in range(steps):
+                    for game_id in game_ids:
+                        GameStateManager.update_ball_position(game_id)
+                scalar_time = time.perf_counter() - started
+
+                batch_games = self.make_games(count, options['seed'])
+                GameStateManager._instances = batch_games
+                GameStateManager._batch = None
+                random.seed(options['seed'])
+                started = time.perf_counter()
+                for _ in range(steps):
+                    GameStateManager.step_games_batch(game_ids, [1] * count)
+                batch_time = time.perf_counter() - started
+
+                # Pure vectorized stepping, without scoring points
+                batch = batch_physics.BatchPhysics()
+                for game_id, game_state in self.make_games(count, options['seed']).items():
+                    batch.attach(game_id, game_state)
+                started = time.perf_counter()
+                for _ in range(steps):
+                    batch.step()
+                kernel_time = time.perf_counter() - started
+
+                mismatches = sum(
+                    1 for game_id in game_ids
+                    if self.physics_state(scalar_games[game_id]) != self.physics_state(batch_games[game_id])
+                )
+
+                self.stdout.write(
+                    f"{count:>6} games x {steps} steps: "
+                    f"scalar {scalar_time * 1000:9.2f}ms | "
+                    f"batch {batch_time * 1000:9.2f}ms | "
+                    f"batch kernel only {kernel_time * 1000:9.2f}ms | "
+                    f"kernel speedup {scalar_time / kernel_time if kernel_time else 0:6.1f}x | "
+                    f"mismatches {mismatches}"
+                )
+                if mismatches:
+                    raise CommandError(f'Batch backend disagrees with the scalar rules on {mismatches} games')
+        finally:
+            GameStateManager._instances = saved_instances
+            GameStateManager._batch = saved_batch
+
+    def bench_memory(self, options):
+        for count in options['games']:
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            legacy = [game_state.to_wire() for game_state in self.make_games(count, options['seed']).values()]
+            legacy_size = self.allocated_since(before)
+            tracemalloc.stop()
+            del legacy
+
+            tracemalloc.start()
+            before = tracemalloc.take_snapshot()
+            games = self.make_games(count, options['seed'])
+            slotted_size = self.allocated_since(before)
+            tracemalloc.stop()
+            del games
+
+            self.stdout.write(
+                f"{count:>6} games: nested dicts {legacy_size / count:7.0f} B/game "
+                f"({legacy_size / 1024 / 1024:7.2f} MiB) | "
+                f"slotted objects {slotted_size / count:7.0f} B/game "
+                f"({slotted_size / 1024 / 1024:7.2f} MiB)"
+            )
+
+    def allocated_since(self, snapshot):
+        """Bytes still allocated compared to an earlier tracemalloc snapshot"""
+        stats = tracemalloc.take_snapshot().compare_to(snapshot, 'filename')
+        return sum(stat.size_diff for stat in stats)
+
+    def bench_wire(self, options):
+        from game import wire
+        for count in options['games']:
+            games = list(self.make_games(count, options['seed']).values())
+
+            started = time.perf_counter()
+            texts = [json.dumps(game_state.to_wire()) for game_state in games]
+            json_encode = time.perf_counter() - started
+            started = time.perf_counter()
+            for text in texts:
+                json.loads(text)
+            json_decode = time.perf_counter() - started
+
+            started = time.perf_counter()
+            frames = [wire.pack_state(game_state, seq) for seq, game_state in enumerate(games)]
+            binary_encode = time.perf_counter() - started
+            started = time.perf_counter()
+            decoded = [wire.unpack_state(frame) for frame in frames]
+            binary_decode = time.perf_counter() - started
+
+            # float32 positions must round-trip closely enough for rendering
+            for game_state, frame in zip(games, decoded):
+                ball = frame['game_state']['ball']
+                if abs(ball['x'] - game_state.ball.x) > 0.01 or abs(ball['y'] - game_state.ball.y) > 0.01:
+                    raise CommandError('Binary frame does not round-trip the ball position')
+
+            json_size = sum(len(text.encode()) for text in texts) / count
+            self.stdout.write(
+                f"{count:>6} frames: "
+                f"json {json_size:5.0f} B, encode {json_encode / count * 1e6:6.2f}us, decode {json_decode / count * 1e6:6.2f}us | "
+                f"binary {wire.FRAME.size:3d} B, encode {binary_encode / count * 1e6:6.2f}us, decode {binary_decode / count * 1e6:6.2f}us"
+            )
+
+    def discrete_step(self, ball, paddle1, paddle2, canvas_height, step_scale):
+        """The former single overlap test per step, for comparison"""
+        ball.x += ball.dx * step_scale
+        ball.y += ball.dy * step_scale
+        if ball.y - ball.radius <= 0 or ball.y + ball.radius >= canvas_height:
+            ball.dy *= -1
+        for paddle in (paddle1, paddle2):
+            if (ball.x - ball.radius <= paddle.x + paddle.width and ball.x + ball.radius >= paddle.x and
+                    paddle.y <= ball.y <= paddle.y + paddle.height):
+                ball.dx = bounce_dx(ball.dx)
+                break
+
+    def bench_collision(self, options):
+        """Cost of the swept collision step against the former discrete test.
+
+        Its correctness is checked against a sub-stepped reference by
+        game.tests.SweptCollisionTests.
+        """
+        canvas_height = 600
+        rng = random.Random(options['seed'])
+        # step_scale 1, 2 and 4 correspond to 60, 30 and 15 Hz tick rates
+        for step_scale in (1, 2, 4):
+            cases = []
+            for _ in range(options['cases']):
+                speed = rng.uniform(2, 120)
+                cases.append((
+                    Ball(rng.uniform(80, 720), rng.uniform(20, 580),
+                         speed * rng.choice((1, -1)), rng.uniform(-speed, speed) / 2),
+                    Paddle(x=50, y=rng.uniform(0, 500)),
+                    Paddle(x=730, y=rng.uniform(0, 500))
+                ))
+
+            timings = {}
+            for name, step in (('swept', lambda b, p1, p2: sweep_ball(b, p1, p2, canvas_height, step_scale)),
+                               ('discrete', lambda b, p1, p2: self.discrete_step(b, p1, p2, canvas_height, step_scale))):
+                balls = [Ball(ball.x, ball.y, ball.dx, ball.dy) for ball, _, _ in cases]
+                started = time.perf_counter()
+                for ball, (_, paddle1, paddle2) in zip(balls, cases):
+                    step(ball, paddle1, paddle2)
+                timings[name] = (time.perf_counter() - started) / len(cases)
+
+            self.stdout.write(
+                f"step scale {step_scale}: {len(cases)} steps | "
+                f"swept {timings['swept'] * 1e6:5.2f}us/step | "
+                f"former discrete test {timings['discrete'] * 1e6:5.2f}us/step"
+            )
+
+    def bench_sharding(self, options):
+        """Balance of the hash ring and how many games move when a worker joins or leaves"""
+        from game.sharding import HashRing
+        game_ids = [str(i) for i in range(options['cases'])]
+        for count in options['workers']:
+            workers = [f"worker-{i}" for i in range(count)]
+            ring = HashRing(workers)
+            started = time.perf_counter()
+            before = {game_id: ring.get_node(game_id) for game_id in game_ids}
+            lookup = (time.perf_counter() - started) / len(game_ids)
+            loads = [list(before.values()).count(worker) for worker in workers]
+
+            ring.add('worker-new')
+            joined = {game_id: ring.get_node(game_id) for game_id in game_ids}
+            moved_on_join = [game_id for game_id in game_ids if joined[game_id] != before[game_id]]
+            if any(joined[game_id] != 'worker-new' for game_id in moved_on_join):
+                raise CommandError('A game moved between two existing workers when a worker joined')
+
+            ring.remove('worker-new')
+            ring.remove(workers[0])
+            left = {game_id: ring.get_node(game_id) for game_id in game_ids}
+            moved_on_leave = [game_id for game_id in game_ids if left[game_id] != before[game_id]]
+            if any(before[game_id] != workers[0] for game_id in moved_on_leave):
+                raise CommandError('A game of a remaining worker moved when another worker left')
+
+            self.stdout.write(
+                f"{count:>3} workers: load max/mean {max(loads) / (len(game_ids) / count):4.2f} | "
+                f"join moves {len(moved_on_join) / len(game_ids):6.2%} (ideal {1 / (count + 1):6.2%}) | "
+                f"leave moves {len(moved_on_leave) / len(game_ids):6.2%} (ideal {1 / count:6.2%}) | "
+                f"lookup {lookup * 1e6:5.2f}us"
+            )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from game.utils import cleanup_inactive_games
+
+
+class Command(BaseCommand):
+    help = 'Delete or finish games left waiting or playing for too long'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=int, default=5,
+                            help='Age after which a waiting or playing game is considered inactive')
+
+    def handle(self, *args, **options):
+        result = cleanup_inactive_games(options['minutes'])
+        self.stdout.write(
+            f"Deleted {result['deleted']} empty games, finished {result['finished']} games"
+        )
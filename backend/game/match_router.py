@@ -0,0 +1,313 @@
+import asyncio
+import logging
+import time
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .game_state_manager import GameStateManager
+from .fanout import LocalFanout
+from .checkpoint import Checkpoints, pack_checkpoint, unpack_checkpoint
+from .sharding import WorkerRegistry
+from .state_store import get_state_store, lease_ttl
+
+logger = logging.getLogger('game')
+
+
+class MatchRouter:
+    """Runs game commands on the worker that owns the match.
+
+    Each live game is kept in the GameStateManager of one worker, which holds
+    its lease in the state store (see state_store.BaseStateStore). Consumers
+    go through `call` instead of calling GameStateManager directly: commands
+    for a game owned by this process run locally, commands for a game owned
+    by another worker are forwarded to that worker's channel and, unless
+    `expect_reply` is False, wait for its answer. With the default in-memory
+    store every game is local and `call` is a plain method call.
+
+    New games are created on the worker their id hashes to on the
+    sharding.HashRing of live workers, so the inputs and the tick loop of a
+    match run on its shard. When a worker joins, the others hand over the
+    games whose shard moved to it (packed with pack_checkpoint); when one
+    leaves, its games are rehydrated from its checkpoints by their new shard.
+
+    `ensure_running` starts the lease renewal loop and, with a shared store,
+    the listener of this worker's channel. Every game is created through
+    `call`, consumers, HTTP views and tournaments alike, so it is created on
+    its shard and leased at once; games rehydrated from checkpoints are leased
+    as they are loaded.
+    """
+    _store = None
+    _channel = None  # This worker's channel name, the value of its leases
+    _channel_layer = None
+    _started = None
+    _listener = None
+    _renewer = None
+    _replies = {}  # request_id -> Future of a forwarded call
+    _next_request = 0
+    _rehydrate_until = 0.0
+    _stats = {'local': 0, 'forwarded': 0, 'received': 0, 'timeouts': 0, 'leases_lost': 0,
+              'handed_off': 0, 'adopted': 0}
+
+    # Seconds after startup or a worker leaving during which orphaned checkpoints are looked for
+    REHYDRATE_WINDOW = 10.0
+
+    # GameStateManager methods (plus broadcast_state and adopt_game) that may be run for another worker
+    COMMANDS = frozenset({
+        'create_game', 'join_game', 'set_player_ready', 'queue_input', 'end_game', 'remove_game',
+        'get_game_state', 'game_exists', 'get_player_ids', 'keyframe_event', 'broadcast_state', 'adopt_game',
+    })
+
+    # Commands that may find a game being handed off before its new owner takes the lease;
+    # the others go straight to the game's shard rather than stall the consumer
+    LEASE_WAIT_COMMANDS = frozenset({'join_game', 'set_player_ready'})
+
+    @classmethod
+    def get_store(cls):
+        if cls._store is None:
+            cls._store = get_state_store()
+        return cls._store
+
+    @classmethod
+    def owner_name(cls) -> str:
+        return cls._channel or 'local'
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        stats = dict(cls._stats)
+        stats['worker'] = cls.owner_name()
+        stats['workers'] = len(WorkerRegistry.workers())
+        return stats
+
+    @classmethod
+    async def ensure_running(cls, channel_layer=None):
+        """Start the router once per process.
+
+        The first call also rehydrates the games orphaned by a previous
+        process before returning, so a reconnecting player finds their game.
+        """
+        if cls._started is None:
+            cls._started = asyncio.get_running_loop().create_task(cls._start(channel_layer))
+        await asyncio.shield(cls._started)
+
+    @classmethod
+    async def _start(cls, channel_layer):
+        loop = asyncio.get_running_loop()
+        cls._channel_layer = channel_layer or get_channel_layer()
+        try:
+            if cls.get_store().shared:
+                cls._channel = await cls._channel_layer.new_channel('game-worker')
+                cls._listener = loop.create_task(cls._listen())
+                logger.info(f"Match router listening on {cls._channel}")
+            cls._rehydrate_until = time.monotonic() + cls.REHYDRATE_WINDOW
+            await cls._maintain()
+        except Exception as e:
+            logger.error(f"Failed to start the match router: {str(e)}", exc_info=True)
+        cls._renewer = loop.create_task(cls._renew())
+
+    @classmethod
+    async def claim(cls, game_id: str) -> bool:
+        """Take the lease of a game just created in this process"""
+        try:
+            return await cls.get_store().acquire(str(game_id), cls.owner_name()) == cls.owner_name()
+        except Exception as e:
+            logger.error(f"Failed to claim game {game_id}: {str(e)}")
+            return False
+
+    @classmethod
+    async def call(cls, game_id, command: str, *args, expect_reply: bool = True):
+        """Run `command` for `game_id` on its owner and return the result"""
+        game_id = str(game_id)
+        store = cls.get_store()
+        if not store.shared or game_id in GameStateManager._instances:
+            return await cls._execute(command, game_id, args)
+
+        try:
+            owner = await store.get_owner(game_id)
+            if owner is None and command in cls.LEASE_WAIT_COMMANDS:
+                # Games being handed off get their lease back as soon as they are adopted
+                await asyncio.sleep(lease_ttl() / 3)
+                owner = await store.get_owner(game_id)
+        except Exception as e:
+            logger.error(f"Failed to look up the owner of game {game_id}: {str(e)}")
+            owner = None
+        if owner is None:
+            # New games go to the worker their id hashes to
+            owner = WorkerRegistry.owner_for(game_id)
+        if owner is None or owner == cls._channel:
+            return await cls._execute(command, game_id, args)
+        return await cls._forward(owner, command, game_id, args, expect_reply)
+
+    @classmethod
+    async def _execute(cls, command: str, game_id: str, args):
+        cls._stats['local'] += 1
+        if command == 'broadcast_state':
+            return await cls._broadcast_state(game_id, *args)
+        if command == 'adopt_game':
+            return await cls._adopt(game_id, *args)
+        result = getattr(GameStateManager, command)(game_id, *args)
+
+        # Forwarded ready commands start the game here, on the owner
+        if command == 'set_player_ready' and result and result['status'] == 'playing':
+            from .tick_scheduler import TickScheduler
+            TickScheduler.ensure_running()
+        elif command == 'create_game':
+            await cls.claim(game_id)
+        elif command == 'remove_game':
+            try:
+                await cls.get_store().release(game_id, cls.owner_name())
+            except Exception as e:
+                logger.error(f"Failed to release the lease of game {game_id}: {str(e)}")
+        return result
+
+    @classmethod
+    async def _broadcast_state(cls, game_id: str, keyframe: bool = False):
+        """Send the next game_state_update of a local game to its group"""
+        event = GameStateManager.state_update_event(game_id, keyframe)
+        if event:
+            await LocalFanout.broadcast(
+                cls._channel_layer or get_channel_layer(), game_id, event,
+                GameStateManager.get_player_ids(game_id)
+            )
+        return event is not None
+
+    @classmethod
+    async def _forward(cls, owner: str, command: str, game_id: str, args, expect_reply: bool):
+        cls._stats['forwarded'] += 1
+        message = {'type': 'game.command', 'command': command, 'game_id': game_id, 'args': list(args)}
+        if not expect_reply:
+            await cls._channel_layer.send(owner, message)
+            return None
+
+        cls._next_request += 1
+        request_id = cls._next_request
+        future = asyncio.get_running_loop().create_future()
+        cls._replies[request_id] = future
+        message.update({'reply_to': cls._channel, 'request_id': request_id})
+        try:
+            await cls._channel_layer.send(owner, message)
+            return await asyncio.wait_for(future, getattr(settings, 'GAME_FORWARD_TIMEOUT', 2.0))
+        except asyncio.TimeoutError:
+            cls._stats['timeouts'] += 1
+            logger.warning(f"Worker {owner} did not answer {command} for game {game_id}")
+            return None
+        finally:
+            cls._replies.pop(request_id, None)
+
+    @classmethod
+    async def _listen(cls):
+        """Handle commands forwarded by other workers and the replies to ours"""
+        layer = cls._channel_layer
+        while True:
+            message = await layer.receive(cls._channel)
+            try:
+                if message.get('type') == 'game.reply':
+                    future = cls._replies.get(message.get('request_id'))
+                    if future is not None and not future.done():
+                        future.set_result(message.get('result'))
+                    continue
+
+                if message.get('type') != 'game.command' or message.get('command') not in cls.COMMANDS:
+                    logger.warning(f"Ignoring unexpected message on {cls._channel}: {message.get('type')}")
+                    continue
+                cls._stats['received'] += 1
+                result = await cls._execute(message['command'], message['game_id'], message.get('args', []))
+                if message.get('reply_to'):
+                    await layer.send(message['reply_to'], {
+                        'type': 'game.reply',
+                        'request_id': message['request_id'],
+                        'result': result
+                    })
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error handling forwarded message: {str(e)}", exc_info=True)
+
+    @classmethod
+    async def _renew(cls):
+        """Run `_maintain` every third of the lease TTL"""
+        while True:
+            await asyncio.sleep(lease_ttl() / 3)
+            try:
+                await cls._maintain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to renew game leases: {str(e)}")
+
+    @classmethod
+    async def _maintain(cls):
+        """Heartbeat, keep the leases of the local games and follow changes of the worker set"""
+        store = cls.get_store()
+        me = cls.owner_name()
+        joined, left = await WorkerRegistry.refresh(store, me)
+
+        lost = await store.renew(list(GameStateManager._instances), me)
+        for game_id in lost:
+            cls._stats['leases_lost'] += 1
+            logger.warning(f"Lease of game {game_id} is held by another worker, dropping the local copy")
+            GameStateManager._instances.pop(game_id, None)
+
+        if joined - {me} or left:
+            logger.info(f"Workers changed (joined: {sorted(joined - {me})}, left: {sorted(left)}), rebalancing games")
+            await cls._rebalance()
+            # Hand-offs may have waited on other workers; keep the leases of the games that stayed
+            await store.renew(list(GameStateManager._instances), me)
+        if left:
+            cls._rehydrate_until = time.monotonic() + cls.REHYDRATE_WINDOW
+
+        # A dead worker's checkpoints become claimable once its heartbeat key expires
+        if time.monotonic() < cls._rehydrate_until:
+            restored = await Checkpoints.rehydrate(owns=lambda game_id: WorkerRegistry.owner_for(game_id) == me)
+            if restored:
+                await store.renew(restored, me)
+                from .tick_scheduler import TickScheduler
+                TickScheduler.ensure_running()
+
+    @classmethod
+    async def _rebalance(cls):
+        """Hand the local games whose shard is now another worker over to that worker"""
+        moves = []
+        for game_id in list(GameStateManager._instances):
+            target = WorkerRegistry.owner_for(game_id)
+            if target is not None and target != cls.owner_name():
+                moves.append(cls._hand_off(game_id, target))
+        # Concurrently, so that an unresponsive worker delays the rebalance by one timeout at most
+        results = await asyncio.gather(*moves, return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error handing off a game: {str(result)}")
+
+    @classmethod
+    async def _hand_off(cls, game_id: str, target: str):
+        game_state = GameStateManager._instances.get(game_id)
+        if game_state is None or game_state.status == 'finished':
+            return
+        blob = pack_checkpoint(game_state)
+        # Stop simulating the game here before the target takes its lease
+        del GameStateManager._instances[game_id]
+        await cls.get_store().release(game_id, cls.owner_name())
+        if await cls._forward(target, 'adopt_game', game_id, (blob,), True):
+            cls._stats['handed_off'] += 1
+            logger.info(f"Game {game_id} handed off to {target}")
+            return
+        logger.warning(f"Worker {target} did not adopt game {game_id}, keeping it")
+        GameStateManager._instances[game_id] = game_state
+        await cls.claim(game_id)
+
+    @classmethod
+    async def _adopt(cls, game_id: str, blob: bytes) -> bool:
+        """Take over a game handed off by another worker"""
+        if game_id in GameStateManager._instances:
+            return True
+        try:
+            game_state = unpack_checkpoint(blob)
+        except (ValueError, UnicodeDecodeError) as e:
+            logger.error(f"Invalid hand-off of game {game_id}: {str(e)}")
+            return False
+        if not await cls.claim(game_id):
+            return False
+        GameStateManager._instances[game_id] = game_state
+        cls._stats['adopted'] += 1
+        if game_state.status == 'playing':
+            from .tick_scheduler import TickScheduler
+            TickScheduler.ensure_running()
+        return True
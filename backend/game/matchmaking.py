@@ -0,0 +1,188 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from django.conf import settings
+
+try:
+    import redis
+except ImportError:  # Only the in-memory queue is available without the redis client
+    redis = None
+
+DEFAULT_BUCKET = 'default'
+
+QUEUE_KEY = 'game:matchmaking:{bucket}'  # Sorted set of game ids scored by enqueue time
+HOSTS_KEY = 'game:matchmaking:hosts'  # Hash of game_id -> "player_id:bucket"
+
+# Pop the oldest live game of a bucket not hosted by ARGV[1], dropping expired ones on the way
+POP_SCRIPT = """
+local cutoff = tonumber(ARGV[2])
+local offset = 0
+while true do
+    local entries = redis.call('ZRANGE', KEYS[1], offset, offset + 31, 'WITHSCORES')
+    if #entries == 0 then
+        return false
+    end
+    for i = 1, #entries, 2 do
+        local game_id, queued_at = entries[i], tonumber(entries[i + 1])
+        local host = redis.call('HGET', KEYS[2], game_id)
+        if queued_at < cutoff or not host then
+            redis.call('ZREM', KEYS[1], game_id)
+            redis.call('HDEL', KEYS[2], game_id)
+            offset = offset - 1
+        elseif string.sub(host, 1, #ARGV[1] + 1) ~= ARGV[1] .. ':' then
+            if ARGV[3] == '1' then
+                redis.call('ZREM', KEYS[1], game_id)
+                redis.call('HDEL', KEYS[2], game_id)
+            end
+            return game_id
+        end
+        offset = offset + 1
+    end
+end
+"""
+
+
+def matchmaking_timeout() -> float:
+    """GAME_MATCHMAKING_TIMEOUT, seconds a waiting game stays in the queue"""
+    return getattr(settings, 'GAME_MATCHMAKING_TIMEOUT', 60)
+
+
+def normalize_bucket(bucket) -> str:
+    return str(bucket) if bucket not in (None, '') else DEFAULT_BUCKET
+
+
+class InMemoryMatchmakingQueue:
+    """Waiting games per bucket in insertion order, for single-worker deployments"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: Dict[str, OrderedDict] = {}  # bucket -> game_id -> (player_id, queued_at)
+        self._index: Dict[str, str] = {}  # game_id -> bucket
+
+    def enqueue(self, game_id: str, player_id: str, bucket: str):
+        with self._lock:
+            self._remove(game_id)
+            self._buckets.setdefault(bucket, OrderedDict())[game_id] = (player_id, time.time())
+            self._index[game_id] = bucket
+
+    def pop(self, player_id: str, bucket: str, remove: bool = True) -> Optional[str]:
+        cutoff = time.time() - matchmaking_timeout()
+        with self._lock:
+            queue = self._buckets.get(bucket)
+            if not queue:
+                return None
+            for game_id, (host_id, queued_at) in list(queue.items()):
+                if queued_at < cutoff:
+                    self._remove(game_id)
+                elif host_id != player_id:
+                    if remove:
+                        self._remove(game_id)
+                    return game_id
+            return None
+
+    def remove(self, game_id: str):
+        with self._lock:
+            self._remove(game_id)
+
+    def _remove(self, game_id: str):
+        bucket = self._index.pop(game_id, None)
+        if bucket is not None:
+            self._buckets[bucket].pop(game_id, None)
+
+    def __len__(self):
+        return len(self._index)
+
+
+class RedisMatchmakingQueue:
+    """Waiting games kept in Redis and shared by every worker; pops are atomic Lua scripts"""
+
+    def __init__(self, url: Optional[str] = None):
+        if redis is None:
+            raise RuntimeError("The redis package is required for GAME_MATCHMAKING_BACKEND = 'redis'")
+        self.client = redis.Redis.from_url(
+            url or settings.GAME_MATCHMAKING_REDIS_URL,
+            socket_timeout=1, socket_connect_timeout=1, decode_responses=True
+        )
+        self._pop_script = self.client.register_script(POP_SCRIPT)
+
+    def enqueue(self, game_id: str, player_id: str, bucket: str):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zadd(QUEUE_KEY.format(bucket=bucket), {game_id: time.time()})
+        pipe.hset(HOSTS_KEY, game_id, f"{player_id}:{bucket}")
+        pipe.execute()
+
+    def pop(self, player_id: str, bucket: str, remove: bool = True) -> Optional[str]:
+        return self._pop_script(
+            keys=[QUEUE_KEY.format(bucket=bucket), HOSTS_KEY],
+            args=[player_id, time.time() - matchmaking_timeout(), '1' if remove else '0']
+        ) or None
+
+    def remove(self, game_id: str):
+        host = self.client.hget(HOSTS_KEY, game_id)
+        if host is None:
+            return
+        pipe = self.client.pipeline(transaction=True)
+        pipe.zrem(QUEUE_KEY.format(bucket=host.split(':', 1)[1]), game_id)
+        pipe.hdel(HOSTS_KEY, game_id)
+        pipe.execute()
+
+    def __len__(self):
+        return self.client.hlen(HOSTS_KEY)
+
+
+MATCHMAKING_BACKENDS = {
+    'memory': InMemoryMatchmakingQueue,
+    'redis': RedisMatchmakingQueue,
+}
+
+
+class MatchmakingQueue:
+    """Queue of games waiting for a second player.
+
+    Games are queued when they are created and leave the queue when a player
+    takes them, when they end, or GAME_MATCHMAKING_TIMEOUT seconds after they
+    were queued. `pop` atomically removes and returns the oldest game of a
+    bucket that was not created by the searching player, so two players
+    searching at the same time never get the same game; the caller then takes
+    the player2 slot with a conditional UPDATE, which also guards the games
+    joined by id. Buckets are free-form labels (skill tier, region) that only
+    match players within the same bucket.
+
+    The backend is picked by GAME_MATCHMAKING_BACKEND ('memory' or 'redis').
+    Methods are synchronous and safe to call from threads.
+    """
+    _backend = None
+
+    @classmethod
+    def get_backend(cls):
+        if cls._backend is None:
+            name = getattr(settings, 'GAME_MATCHMAKING_BACKEND', 'memory')
+            if name not in MATCHMAKING_BACKENDS:
+                raise ValueError(f"Unknown GAME_MATCHMAKING_BACKEND {name!r}, expected one of {sorted(MATCHMAKING_BACKENDS)}")
+            cls._backend = MATCHMAKING_BACKENDS[name]()
+        return cls._backend
+
+    @classmethod
+    def enqueue(cls, game_id, player_id, bucket=None):
+        """Make a waiting game available to other players of `bucket`"""
+        cls.get_backend().enqueue(str(game_id), str(player_id), normalize_bucket(bucket))
+
+    @classmethod
+    def pop(cls, player_id, bucket=None) -> Optional[str]:
+        """Take the oldest available game of `bucket` for `player_id`, None if there is none"""
+        return cls.get_backend().pop(str(player_id), normalize_bucket(bucket))
+
+    @classmethod
+    def peek(cls, player_id, bucket=None) -> Optional[str]:
+        """The game `pop` would return, left in the queue"""
+        return cls.get_backend().pop(str(player_id), normalize_bucket(bucket), remove=False)
+
+    @classmethod
+    def remove(cls, game_id):
+        """Withdraw a game that was joined or ended"""
+        cls.get_backend().remove(str(game_id))
+
+    @classmethod
+    def size(cls) -> int:
+        return len(cls.get_backend())
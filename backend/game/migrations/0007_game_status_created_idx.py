@@ -0,0 +1,19 @@
+# Generated by Django 4.2.19 on 2026-10-18 05:23
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0006_game_duration_game_duration_formatted_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['status', 'created_at'], name='game_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.19 on 2026-10-18 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0008_playerstats_ratingchange'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='playerstats',
+            name='rated_games',
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='best_streak',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='current_streak',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='games_lost',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='games_played',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='games_won',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='play_time',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='points_against',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='playerstats',
+            name='points_for',
+            field=models.IntegerField(default=0),
+        ),
+    ]
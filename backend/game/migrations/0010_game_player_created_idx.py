@@ -0,0 +1,23 @@
+# Generated by Django 4.2.19 on 2026-10-18 05:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('game', '0009_playerstats_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['player1', 'created_at'], name='game_player1_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['player2', 'created_at'], name='game_player2_created_idx'),
+        ),
+    ]
@@ -45,22 +45,34 @@ class Game(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Used by the inactive games sweeper (game.utils.cleanup_inactive_games)
+            models.Index(fields=['status', 'updated_at'], name='game_status_updated_idx'),
+            # Match history pages of a player (game.views.get_games)
+            models.Index(fields=['player1', 'created_at'], name='game_player1_created_idx'),
+            models.Index(fields=['player2', 'created_at'], name='game_player2_created_idx'),
+        ]
 
     def __str__(self):
         return f"Game {self.id}: {self.player1.username} vs {self.player2.username if self.player2 else 'Waiting'}"
 
+    @staticmethod
+    def default_game_state():
+        """Initial game_state of a new game (also used by bulk_create, which bypasses save)"""
+        return {
+            'ball': {'x': 400, 'y': 300, 'dx': 5, 'dy': 5, 'radius': 10},
+            'paddles': {
+                'player1': {'x': 50, 'y': 250, 'width': 20, 'height': 100},
+                'player2': {'x': 730, 'y': 250, 'width': 20, 'height': 100}
+            },
+            'canvas': {'width': 800, 'height': 600},
+            'score': {'player1': 0, 'player2': 0},
+            'paddle_speed': 25
+        }
+
     def save(self, *args, **kwargs):
         if not self.game_state and self._state.adding:  # Only set default state when creating new game
-            self.game_state = {
-                'ball': {'x': 400, 'y': 300, 'dx': 5, 'dy': 5, 'radius': 10},
-                'paddles': {
-                    'player1': {'x': 50, 'y': 250, 'width': 20, 'height': 100},
-                    'player2': {'x': 730, 'y': 250, 'width': 20, 'height': 100}
-                },
-                'canvas': {'width': 800, 'height': 600},
-                'score': {'player1': 0, 'player2': 0},
-                'paddle_speed': 25
-            }
+            self.game_state = self.default_game_state()
         super().save(*args, **kwargs)
 
     def is_player_in_game(self, user):
@@ -94,3 +106,50 @@ class Game(models.Model):
                 'score': self.score_player2
             } if self.player2 else None
         }
+
+
+class PlayerStats(models.Model):
+    """Per-user aggregates kept up to date when games finish (see game.ratings)"""
+    user = models.OneToOneField(
+        settings.AUTH_USER_MODEL,
+        related_name='player_stats',
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    rating = models.FloatField(default=1000)
+    games_played = models.IntegerField(default=0)
+    games_won = models.IntegerField(default=0)
+    games_lost = models.IntegerField(default=0)
+    points_for = models.IntegerField(default=0)
+    points_against = models.IntegerField(default=0)
+    current_streak = models.IntegerField(default=0)  # Wins in a row since the last defeat
+    best_streak = models.IntegerField(default=0)
+    play_time = models.IntegerField(default=0)  # Seconds
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Leaderboard pages and rank lookups of the database leaderboard backend
+            models.Index(fields=['-rating'], name='game_stats_rating_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.rating:.0f}"
+
+
+class RatingChange(models.Model):
+    """Rating points a finished game moved from its loser to its winner.
+
+    One row per game counted in PlayerStats, so a result is never counted twice.
+    """
+    game = models.OneToOneField(
+        Game,
+        related_name='rating_change',
+        on_delete=models.CASCADE,
+        primary_key=True
+    )
+    delta = models.FloatField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Game {self.game_id}: {self.delta:+.1f}"
@@ -0,0 +1,268 @@
+import atexit
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Dict
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger('game')
+
+
+class PersistenceQueue:
+    """Write-behind stage between the in-memory games and the database.
+
+    The tick loop only records the latest wire state of a game under its id;
+    a background thread wakes up every GAME_PERSIST_INTERVAL seconds and
+    writes everything pending with one bulk UPDATE per batch. Several writes
+    for the same game before a flush coalesce into one. The queue is bounded
+    by GAME_PERSIST_MAX_PENDING, failed batches are retried up to
+    GAME_PERSIST_MAX_RETRIES times, and whatever is left is flushed when the
+    process exits. Finished games are rated (game.ratings) right after they
+    are written. The same thread refreshes the updated_at of the games being
+    played (see `touch`) and runs the inactive games sweeper every
+    GAME_CLEANUP_INTERVAL seconds.
+    """
+    _pending = {}  # game_id -> wire state, latest wins
+    _attempts = {}  # game_id -> failed write attempts
+    _lock = threading.Lock()
+    _wakeup = threading.Event()
+    _thread = None
+    _stopping = False
+    _stats = {'enqueued': 0, 'written': 0, 'batches': 0, 'retries': 0, 'dropped': 0}
+    _last_cleanup = 0.0
+    _active = set()  # ids of games being played, whose updated_at is refreshed by the writer thread
+    _last_touch = 0.0
+
+    FIELDS = ['game_state', 'score_player1', 'score_player2', 'status',
+              'duration', 'duration_formatted', 'winner', 'updated_at']
+
+    @classmethod
+    def enqueue(cls, game_id: str, wire: Dict):
+        """Schedule `wire` to be written to Game `game_id`; never touches the database"""
+        game_id = str(game_id)
+        with cls._lock:
+            if game_id not in cls._pending and len(cls._pending) >= cls._max_pending():
+                if not cls._evict_checkpoint(wire):
+                    cls._stats['dropped'] += 1
+                    logger.error(f"Persistence queue full, dropping write for game {game_id}")
+                    return
+            cls._pending[game_id] = wire
+            cls._stats['enqueued'] += 1
+        if wire.get('status') == 'finished':
+            cls._wakeup.set()
+        cls.ensure_running()
+
+    @classmethod
+    def touch(cls, game_ids, now=None):
+        """Record that games are being played, so the inactive games sweeper leaves them alone.
+
+        Called by the tick scheduler after every tick; every
+        GAME_ACTIVITY_INTERVAL seconds the ids are handed to the writer
+        thread, which sets their updated_at with one UPDATE per batch.
+        """
+        if now is None:
+            now = time.monotonic()
+        if now - cls._last_touch < getattr(settings, 'GAME_ACTIVITY_INTERVAL', 60):
+            return
+        cls._last_touch = now
+        with cls._lock:
+            cls._active.update(game_ids)
+        cls.ensure_running()
+
+    @classmethod
+    def _write_activity(cls):
+        """Set updated_at of the games recorded by `touch`, in batches of GAME_PERSIST_BATCH_SIZE"""
+        from .models import Game
+
+        with cls._lock:
+            if not cls._active:
+                return
+            game_ids = [int(game_id) for game_id in cls._active]
+            cls._active = set()
+        batch_size = getattr(settings, 'GAME_PERSIST_BATCH_SIZE', 500)
+        close_old_connections()
+        try:
+            now = timezone.now()
+            for start in range(0, len(game_ids), batch_size):
+                Game.objects.filter(id__in=game_ids[start:start + batch_size]).exclude(status='finished').update(updated_at=now)
+        except Exception as e:
+            logger.error(f"Failed to record the activity of {len(game_ids)} games: {str(e)}")
+        finally:
+            close_old_connections()
+
+    @classmethod
+    def _evict_checkpoint(cls, wire: Dict) -> bool:
+        """Make room by dropping a pending write of an unfinished game (caller holds the lock)"""
+        for game_id, pending in cls._pending.items():
+            if pending.get('status') != 'finished':
+                del cls._pending[game_id]
+                cls._attempts.pop(game_id, None)
+                cls._stats['dropped'] += 1
+                return True
+        return False
+
+    @classmethod
+    def ensure_running(cls):
+        """Start the writer thread if it is not already running"""
+        if cls._thread is not None and cls._thread.is_alive():
+            return
+        with cls._lock:
+            if cls._thread is not None and cls._thread.is_alive():
+                return
+            cls._stopping = False
+            cls._thread = threading.Thread(target=cls._run, name='game-persistence', daemon=True)
+            cls._thread.start()
+
+    @classmethod
+    def get_stats(cls) -> Dict:
+        with cls._lock:
+            stats = dict(cls._stats)
+            stats['pending'] = len(cls._pending)
+        return stats
+
+    @classmethod
+    def _max_pending(cls) -> int:
+        return getattr(settings, 'GAME_PERSIST_MAX_PENDING', 10000)
+
+    @classmethod
+    def _run(cls):
+        interval = getattr(settings, 'GAME_PERSIST_INTERVAL', 0.5)
+        while not cls._stopping:
+            cls._wakeup.wait(interval)
+            cls._wakeup.clear()
+            cls.flush()
+            cls._write_activity()
+            cls._maybe_cleanup()
+
+    @classmethod
+    def flush(cls):
+        """Write everything pending now, in batches of GAME_PERSIST_BATCH_SIZE"""
+        batch_size = getattr(settings, 'GAME_PERSIST_BATCH_SIZE', 500)
+        while True:
+            with cls._lock:
+                if not cls._pending:
+                    return
+                batch = {}
+                for game_id in list(cls._pending)[:batch_size]:
+                    batch[game_id] = cls._pending.pop(game_id)
+            close_old_connections()
+            try:
+                cls._write_batch(batch)
+            except Exception as e:
+                logger.error(f"Failed to persist {len(batch)} games: {str(e)}", exc_info=True)
+                cls._requeue(batch)
+                return
+            finally:
+                close_old_connections()
+
+    @classmethod
+    def _requeue(cls, batch: Dict):
+        """Put a failed batch back, unless newer states arrived meanwhile or retries ran out"""
+        max_retries = getattr(settings, 'GAME_PERSIST_MAX_RETRIES', 3)
+        with cls._lock:
+            for game_id, wire in batch.items():
+                attempts = cls._attempts.get(game_id, 0) + 1
+                if attempts > max_retries:
+                    cls._attempts.pop(game_id, None)
+                    cls._stats['dropped'] += 1
+                    logger.error(f"Giving up persisting game {game_id} after {max_retries} retries")
+                    continue
+                cls._attempts[game_id] = attempts
+                cls._stats['retries'] += 1
+                cls._pending.setdefault(game_id, wire)
+
+    @classmethod
+    def _write_batch(cls, batch: Dict):
+        from .models import Game
+
+        games = Game.objects.in_bulk([int(game_id) for game_id in batch])
+        now = timezone.now()
+        updated = []
+        for game_id, wire in batch.items():
+            game = games.get(int(game_id))
+            if game is None:
+                logger.warning(f"Game {game_id} no longer exists, dropping its state")
+                continue
+            cls._apply_wire(game, wire)
+            game.updated_at = now
+            updated.append(game)
+
+        if updated:
+            Game.objects.bulk_update(updated, cls.FIELDS)
+        with cls._lock:
+            for game_id in batch:
+                cls._attempts.pop(game_id, None)
+            cls._stats['written'] += len(updated)
+            cls._stats['batches'] += 1
+
+        finished = [game.id for game in updated if game.status == 'finished' and game.winner_id]
+        if finished:
+            cls._rate(finished)
+
+    @classmethod
+    def _rate(cls, game_ids):
+        """Update the ratings of the games that just finished; the states are already written"""
+        from .ratings import record_results
+        try:
+            record_results(game_ids)
+        except Exception as e:
+            logger.error(f"Failed to rate games {game_ids}: {str(e)}", exc_info=True)
+
+    @classmethod
+    def _apply_wire(cls, game, wire: Dict):
+        """Copy a wire-format state onto a Game row"""
+        game.game_state = wire
+        game.score_player1 = wire['score']['player1']
+        game.score_player2 = wire['score']['player2']
+
+        if wire['status'] == 'finished':
+            game.status = 'finished'
+            if wire.get('duration') is not None:
+                game.duration = wire['duration']
+            elif wire.get('start_time'):
+                game.duration = time.time() - wire['start_time']
+            if wire.get('duration_formatted'):
+                game.duration_formatted = wire['duration_formatted']
+            elif game.duration is not None:
+                minutes, seconds = divmod(timedelta(seconds=game.duration).seconds, 60)
+                game.duration_formatted = f"{minutes:02d}:{seconds:02d}"
+        elif wire.get('duration') is not None:
+            game.duration = wire['duration']
+
+        # Assign the foreign key directly instead of loading the winner
+        if wire.get('winner_id'):
+            game.winner_id = int(wire['winner_id'])
+
+    @classmethod
+    def _maybe_cleanup(cls):
+        """Clean up the inactive games if GAME_CLEANUP_INTERVAL has elapsed (0 disables it)"""
+        cleanup_interval = getattr(settings, 'GAME_CLEANUP_INTERVAL', 300)
+        if not cleanup_interval or time.monotonic() - cls._last_cleanup < cleanup_interval:
+            return
+        cls._last_cleanup = time.monotonic()
+        close_old_connections()
+        try:
+            from .utils import cleanup_inactive_games
+            result = cleanup_inactive_games()
+            if result['total_processed']:
+                logger.info(f"Inactive games cleanup: {result}")
+        except Exception as e:
+            logger.error(f"Inactive games cleanup failed: {str(e)}")
+        finally:
+            close_old_connections()
+
+    @classmethod
+    def shutdown(cls):
+        """Stop the writer thread and flush what is left"""
+        cls._stopping = True
+        cls._wakeup.set()
+        thread = cls._thread
+        if thread is not None and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        cls.flush()
+
+
+atexit.register(PersistenceQueue.shutdown)
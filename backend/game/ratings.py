@@ -0,0 +1,130 @@
+import logging
+from typing import Dict, Iterable, List
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+logger = logging.getLogger('game')
+
+# PlayerStats columns written when results are counted
+STATS_FIELDS = ['rating', 'games_played', 'games_won', 'games_lost', 'points_for',
+                'points_against', 'current_streak', 'best_streak', 'play_time', 'updated_at']
+
+# Game columns needed to count a result
+RESULT_FIELDS = ('id', 'player1_id', 'player2_id', 'winner_id', 'score_player1', 'score_player2', 'duration')
+
+
+def initial_rating() -> float:
+    """GAME_ELO_INITIAL_RATING, rating of a player before their first rated game"""
+    return getattr(settings, 'GAME_ELO_INITIAL_RATING', 1000)
+
+
+def expected_score(rating: float, opponent_rating: float) -> float:
+    """Probability that a player rated `rating` beats one rated `opponent_rating`"""
+    return 1.0 / (1.0 + 10 ** ((opponent_rating - rating) / 400.0))
+
+
+def elo_delta(winner_rating: float, loser_rating: float) -> float:
+    """Points the winner takes from the loser, at most GAME_ELO_K_FACTOR"""
+    k_factor = getattr(settings, 'GAME_ELO_K_FACTOR', 32)
+    return k_factor * (1.0 - expected_score(winner_rating, loser_rating))
+
+
+def is_counted(game) -> bool:
+    """Whether a finished game counts in PlayerStats: two players and one of them won"""
+    return game.player2_id is not None and game.winner_id in (game.player1_id, game.player2_id)
+
+
+def apply_result(game, stats: Dict) -> float:
+    """Count a finished game in the PlayerStats of {user_id: PlayerStats}. Returns the rating delta."""
+    if game.winner_id == game.player1_id:
+        winner, loser = stats[game.player1_id], stats[game.player2_id]
+        winner_points, loser_points = game.score_player1, game.score_player2
+    else:
+        winner, loser = stats[game.player2_id], stats[game.player1_id]
+        winner_points, loser_points = game.score_player2, game.score_player1
+
+    delta = elo_delta(winner.rating, loser.rating)
+    winner.rating += delta
+    loser.rating -= delta
+    winner.games_won += 1
+    loser.games_lost += 1
+    winner.current_streak += 1
+    winner.best_streak = max(winner.best_streak, winner.current_streak)
+    loser.current_streak = 0
+    for player_stats, points_for, points_against in ((winner, winner_points, loser_points),
+                                                     (loser, loser_points, winner_points)):
+        player_stats.games_played += 1
+        player_stats.points_for += points_for
+        player_stats.points_against += points_against
+        player_stats.play_time += game.duration or 0
+    return delta
+
+
+def record_results(game_ids: Iterable) -> List[int]:
+    """Count the finished games among `game_ids` in their players' PlayerStats.
+
+    Called by every path that finishes a game; only games that are finished,
+    have two players and a winner, and were not counted yet are, so it is
+    safe to call it several times for the same game. Each counted game gets
+    a RatingChange row and both players' ratings and totals are updated in
+    the same transaction; the new ratings go to the Leaderboard once it
+    commits. Returns the ids of the games counted by this call.
+    """
+    from .leaderboard import Leaderboard
+    from .models import Game, PlayerStats, RatingChange
+
+    ids = sorted({int(game_id) for game_id in game_ids})
+    if not ids:
+        return []
+
+    with transaction.atomic():
+        # Lock the games first so that concurrent calls for the same game rate it once
+        games = list(
+            Game.objects.select_for_update()
+            .filter(id__in=ids, status='finished', player2__isnull=False, winner__isnull=False)
+            .order_by('id')
+            .only(*RESULT_FIELDS)
+        )
+        counted = set(RatingChange.objects.filter(game_id__in=[game.id for game in games])
+                      .values_list('game_id', flat=True))
+        games = [game for game in games if game.id not in counted and is_counted(game)]
+        if not games:
+            return []
+
+        user_ids = sorted({game.player1_id for game in games} | {game.player2_id for game in games})
+        PlayerStats.objects.bulk_create(
+            [PlayerStats(user_id=user_id, rating=initial_rating()) for user_id in user_ids],
+            ignore_conflicts=True
+        )
+        stats = PlayerStats.objects.select_for_update().order_by('user_id').in_bulk(user_ids)
+
+        changes = [RatingChange(game_id=game.id, delta=apply_result(game, stats)) for game in games]
+
+        now = timezone.now()
+        for player_stats in stats.values():
+            player_stats.updated_at = now
+        RatingChange.objects.bulk_create(changes)
+        PlayerStats.objects.bulk_update(list(stats.values()), STATS_FIELDS)
+
+        ratings = {user_id: player_stats.rating for user_id, player_stats in stats.items()}
+        transaction.on_commit(lambda: Leaderboard.update(ratings))
+
+    logger.info(f"Counted {len(changes)} finished games in player stats")
+    return [game.id for game in games]
+
+
+def record_result(game_id) -> bool:
+    """Count one game if it needs it, see record_results"""
+    return bool(record_results([game_id]))
+
+
+def get_stats(user_id) -> Dict:
+    """PlayerStats of a user as a dict, a single primary key lookup"""
+    from .models import PlayerStats
+
+    row = PlayerStats.objects.filter(user_id=user_id).values(*STATS_FIELDS[:-1]).first()
+    if row is None:
+        row = {field: 0 for field in STATS_FIELDS[:-1]}
+        row['rating'] = initial_rating()
+    return row
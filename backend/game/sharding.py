@@ -0,0 +1,93 @@
+import bisect
+import hashlib
+from typing import Iterable, List, Optional, Set, Tuple
+from django.conf import settings
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent hash ring mapping game ids to workers.
+
+    Each worker is placed on the ring at GAME_SHARD_VNODES points (virtual
+    nodes) and a game belongs to the first worker point at or after the hash
+    of its id. Adding or removing a worker only moves the games on the arcs
+    that worker gains or loses, about 1/N of them, and the virtual nodes keep
+    the load even between workers.
+    """
+    __slots__ = ('vnodes', 'points', 'owners', 'nodes')
+
+    def __init__(self, nodes: Iterable[str] = (), vnodes: Optional[int] = None):
+        self.vnodes = vnodes or getattr(settings, 'GAME_SHARD_VNODES', 100)
+        self.points: List[int] = []  # Sorted hashes of the virtual nodes
+        self.owners: List[str] = []  # Worker of each point
+        self.nodes: Set[str] = set()
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.vnodes):
+            point = _hash(f"{node}#{i}")
+            index = bisect.bisect(self.points, point)
+            self.points.insert(index, point)
+            self.owners.insert(index, node)
+
+    def remove(self, node: str):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        kept = [(point, owner) for point, owner in zip(self.points, self.owners) if owner != node]
+        self.points = [point for point, _ in kept]
+        self.owners = [owner for _, owner in kept]
+
+    def get_node(self, key) -> Optional[str]:
+        """Worker owning `key`, None if the ring is empty"""
+        if not self.points:
+            return None
+        index = bisect.bisect_left(self.points, _hash(str(key)))
+        if index == len(self.points):
+            index = 0
+        return self.owners[index]
+
+
+class WorkerRegistry:
+    """Live workers of the deployment and the hash ring built from them.
+
+    Each worker records a heartbeat in the state store on every lease renewal
+    (see MatchRouter); workers whose heartbeat is older than GAME_LEASE_TTL
+    are considered gone, at the same moment their leases expire. `refresh`
+    updates the ring and reports which workers joined or left since the last
+    call, so the router can rebalance.
+    """
+    _ring = HashRing()
+
+    @classmethod
+    def get_ring(cls) -> HashRing:
+        return cls._ring
+
+    @classmethod
+    def workers(cls) -> Set[str]:
+        return set(cls._ring.nodes)
+
+    @classmethod
+    def owner_for(cls, game_id) -> Optional[str]:
+        """Worker the ring assigns `game_id` to"""
+        return cls._ring.get_node(str(game_id))
+
+    @classmethod
+    async def refresh(cls, store, worker: str) -> Tuple[Set[str], Set[str]]:
+        """Heartbeat `worker` and sync the ring with the live workers. Returns (joined, left)."""
+        live = set(await store.heartbeat(worker))
+        live.add(worker)
+        current = cls._ring.nodes
+        joined, left = live - current, current - live
+        for node in left:
+            cls._ring.remove(node)
+        for node in joined:
+            cls._ring.add(node)
+        return joined, left
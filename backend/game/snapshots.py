@@ -0,0 +1,64 @@
+import math
+from array import array
+from typing import Iterator, Optional, Tuple
+from django.conf import settings
+
+# Layout of one snapshot in the ring buffer
+TICK, BALL_X, BALL_Y, BALL_DX, BALL_DY, PADDLE1_Y, PADDLE2_Y = range(7)
+FIELDS = 7
+
+
+def max_rewind_ticks() -> int:
+    """GAME_MAX_REWIND_MS expressed in physics steps"""
+    tick_rate = getattr(settings, 'GAME_TICK_RATE', 60)
+    return int(getattr(settings, 'GAME_MAX_REWIND_MS', 200) * tick_rate / 1000)
+
+
+def round_trip_ticks(rtt: float) -> int:
+    """Ticks a displayed state can be old when an input made on it arrives, over a connection with round trip `rtt`"""
+    tick_rate = getattr(settings, 'GAME_TICK_RATE', 60)
+    broadcast_rate = getattr(settings, 'GAME_BROADCAST_RATE', tick_rate)
+    return int(math.ceil((rtt + 1.0 / broadcast_rate) * tick_rate))
+
+
+class SnapshotHistory:
+    """Fixed-size ring buffer of recent ball and paddle positions for one game.
+
+    Backed by a single preallocated array('d') of `capacity * FIELDS` doubles,
+    so a game's history costs capacity * 56 bytes and recording a snapshot
+    does not allocate.
+    """
+    __slots__ = ('capacity', 'data', 'head', 'count')
+
+    def __init__(self, capacity: Optional[int] = None):
+        self.capacity = capacity or getattr(settings, 'GAME_SNAPSHOT_HISTORY', 32)
+        self.data = array('d', bytes(8 * self.capacity * FIELDS))
+        self.head = 0  # Slot the next snapshot is written to
+        self.count = 0
+
+    def record(self, tick: int, game_state):
+        """Store the current ball and paddle positions of `game_state` for `tick`"""
+        ball = game_state.ball
+        base = self.head * FIELDS
+        data = self.data
+        data[base + TICK] = tick
+        data[base + BALL_X] = ball.x
+        data[base + BALL_Y] = ball.y
+        data[base + BALL_DX] = ball.dx
+        data[base + BALL_DY] = ball.dy
+        data[base + PADDLE1_Y] = game_state.paddle1.y
+        data[base + PADDLE2_Y] = game_state.paddle2.y
+        self.head = (self.head + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+
+    def newest_first(self) -> Iterator[Tuple[float, ...]]:
+        """Yield stored snapshots from the most recent to the oldest"""
+        data = self.data
+        for i in range(1, self.count + 1):
+            base = ((self.head - i) % self.capacity) * FIELDS
+            yield tuple(data[base:base + FIELDS])
@@ -0,0 +1,188 @@
+import asyncio
+import time
+from typing import Dict, List, Optional
+from django.conf import settings
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # Only the in-memory store is available without the redis client
+    aioredis = None
+
+LEASE_KEY = 'game:lease:{game_id}'
+WORKERS_KEY = 'game:workers'  # Sorted set of worker channel names scored by their last heartbeat
+
+# Renew the lease if we hold it, take it if it expired, report it lost otherwise
+RENEW_SCRIPT = """
+local lost = {}
+for i, key in ipairs(KEYS) do
+    local owner = redis.call('GET', key)
+    if owner == ARGV[1] then
+        redis.call('PEXPIRE', key, ARGV[2])
+    elseif not owner then
+        redis.call('SET', key, ARGV[1], 'PX', ARGV[2])
+    else
+        table.insert(lost, i)
+    end
+end
+return lost
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def lease_ttl() -> float:
+    """GAME_LEASE_TTL, seconds a worker keeps a game without renewing its lease"""
+    return getattr(settings, 'GAME_LEASE_TTL', 3.0)
+
+
+class BaseStateStore:
+    """Where the ownership of live games is recorded.
+
+    A game's state lives in the memory of a single worker, the owner, which
+    holds a lease on it. The lease value is the owner's channel name, so other
+    workers know where to forward commands for that game. Owners renew the
+    leases of all their games periodically; a lease that is not renewed
+    within GAME_LEASE_TTL seconds expires and the game can be taken over.
+    Workers also record a heartbeat, from which the hash ring of
+    sharding.WorkerRegistry is built.
+    """
+    # Whether several processes share this store (and commands may need forwarding)
+    shared = False
+
+    async def acquire(self, game_id: str, owner: str) -> Optional[str]:
+        """Try to take the lease of `game_id`. Returns the owner after the attempt."""
+        raise NotImplementedError
+
+    async def get_owner(self, game_id: str) -> Optional[str]:
+        """Channel name of the worker owning `game_id`, None if nobody holds the lease"""
+        raise NotImplementedError
+
+    async def renew(self, game_ids: List[str], owner: str) -> List[str]:
+        """Renew (or take) the leases of `game_ids`. Returns the ids now held by another owner."""
+        raise NotImplementedError
+
+    async def release(self, game_id: str, owner: str):
+        """Give up the lease of `game_id` if `owner` holds it"""
+        raise NotImplementedError
+
+    async def heartbeat(self, worker: str) -> List[str]:
+        """Record that `worker` is alive and return every live worker"""
+        raise NotImplementedError
+
+
+class InMemoryStateStore(BaseStateStore):
+    """Leases kept in the process, for single-worker deployments"""
+
+    def __init__(self):
+        self._leases: Dict[str, tuple] = {}  # game_id -> (owner, expires_at)
+
+    def _current(self, game_id: str) -> Optional[str]:
+        lease = self._leases.get(game_id)
+        if lease is None or lease[1] < time.monotonic():
+            return None
+        return lease[0]
+
+    async def acquire(self, game_id: str, owner: str) -> Optional[str]:
+        current = self._current(game_id)
+        if current is None or current == owner:
+            self._leases[game_id] = (owner, time.monotonic() + lease_ttl())
+            return owner
+        return current
+
+    async def get_owner(self, game_id: str) -> Optional[str]:
+        return self._current(game_id)
+
+    async def renew(self, game_ids: List[str], owner: str) -> List[str]:
+        lost = []
+        for game_id in game_ids:
+            if await self.acquire(game_id, owner) != owner:
+                lost.append(game_id)
+        return lost
+
+    async def release(self, game_id: str, owner: str):
+        if self._current(game_id) == owner:
+            del self._leases[game_id]
+
+    async def heartbeat(self, worker: str) -> List[str]:
+        return [worker]
+
+
+class RedisStateStore(BaseStateStore):
+    """Leases kept in Redis, shared by every worker of a deployment"""
+    shared = True
+
+    def __init__(self, url: Optional[str] = None):
+        if aioredis is None:
+            raise RuntimeError("The redis package is required for GAME_STATE_STORE = 'redis'")
+        self.url = url or settings.GAME_STATE_STORE_REDIS_URL
+        self._client = None
+        self._client_loop = None
+        self._renew_script = None
+        self._release_script = None
+
+    def get_client(self):
+        """Redis client bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = aioredis.Redis.from_url(
+                self.url, socket_timeout=1, socket_connect_timeout=1, decode_responses=True
+            )
+            self._client_loop = loop
+            self._renew_script = self._client.register_script(RENEW_SCRIPT)
+            self._release_script = self._client.register_script(RELEASE_SCRIPT)
+        return self._client
+
+    async def acquire(self, game_id: str, owner: str) -> Optional[str]:
+        client = self.get_client()
+        key = LEASE_KEY.format(game_id=game_id)
+        ttl_ms = int(lease_ttl() * 1000)
+        if await client.set(key, owner, nx=True, px=ttl_ms):
+            return owner
+        current = await client.get(key)
+        if current == owner:
+            await client.pexpire(key, ttl_ms)
+        return current
+
+    async def get_owner(self, game_id: str) -> Optional[str]:
+        return await self.get_client().get(LEASE_KEY.format(game_id=game_id))
+
+    async def renew(self, game_ids: List[str], owner: str) -> List[str]:
+        if not game_ids:
+            return []
+        self.get_client()
+        lost = await self._renew_script(
+            keys=[LEASE_KEY.format(game_id=game_id) for game_id in game_ids],
+            args=[owner, int(lease_ttl() * 1000)]
+        )
+        return [game_ids[i - 1] for i in lost]
+
+    async def release(self, game_id: str, owner: str):
+        self.get_client()
+        await self._release_script(keys=[LEASE_KEY.format(game_id=game_id)], args=[owner])
+
+    async def heartbeat(self, worker: str) -> List[str]:
+        now = time.time()
+        pipe = self.get_client().pipeline(transaction=True)
+        pipe.zadd(WORKERS_KEY, {worker: now})
+        pipe.zremrangebyscore(WORKERS_KEY, '-inf', now - lease_ttl())
+        pipe.zrange(WORKERS_KEY, 0, -1)
+        return (await pipe.execute())[-1]
+
+
+STATE_STORES = {
+    'memory': InMemoryStateStore,
+    'redis': RedisStateStore,
+}
+
+
+def get_state_store() -> BaseStateStore:
+    """Build the store selected by GAME_STATE_STORE ('memory' or 'redis')"""
+    backend = getattr(settings, 'GAME_STATE_STORE', 'memory')
+    if backend not in STATE_STORES:
+        raise ValueError(f"Unknown GAME_STATE_STORE {backend!r}, expected one of {sorted(STATE_STORES)}")
+    return STATE_STORES[backend]()
@@ -0,0 +1,277 @@
+import fnmatch
+import os
+import random
+import socket
+from unittest import mock, skipUnless
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from . import batch_physics, checkpoint
+from .checkpoint import Checkpoints, pack_checkpoint
+from .collision import bounce_dx, sweep_ball
+from .game_state import Ball, Paddle, PlayerState
+from .game_state_manager import GameStateManager
+from .leaderboard import DatabaseLeaderboard
+from .models import Game, PlayerStats
+
+
+def make_games(count, seed):
+    """`count` playing games with randomized ball and paddle positions"""
+    rng = random.Random(seed)
+    instances = {}
+    for i in range(count):
+        game_id = str(i)
+        GameStateManager._instances = instances
+        GameStateManager.create_game(game_id, f"{i}a", 'player1')
+        game_state = instances[game_id]
+        game_state.player2 = PlayerState(id=f"{i}b", username='player2')
+        game_state.status = 'playing'
+        game_state.ball.x = rng.uniform(100, 700)
+        game_state.ball.y = rng.uniform(50, 550)
+        game_state.ball.dx = rng.uniform(4, 30) * rng.choice((1, -1))
+        game_state.ball.dy = rng.uniform(-12, 12)
+        game_state.paddle1.y = rng.uniform(0, 500)
+        game_state.paddle2.y = rng.uniform(0, 500)
+    return instances
+
+
+def physics_state(game_state):
+    wire = game_state.to_wire()
+    return wire['ball'], wire['paddles'], wire['score'], wire['status']
+
+
+@skipUnless(batch_physics.is_available(), 'NumPy is not installed')
+@mock.patch('game.game_state_manager.PersistenceQueue.enqueue')
+class BatchPhysicsTests(TestCase):
+    """The NumPy backend must play every game exactly like update_ball_position"""
+
+    def setUp(self):
+        self.saved = GameStateManager._instances, GameStateManager._batch
+
+    def tearDown(self):
+        GameStateManager._instances, GameStateManager._batch = self.saved
+
+    def play(self, batch, seed, ticks, max_steps):
+        """Play `ticks` ticks of several steps per game, as the tick scheduler does; returns the games"""
+        games = make_games(150, seed)
+        GameStateManager._batch = None
+        steps_rng = random.Random(seed + 1)
+        random.seed(seed)
+        for _ in range(ticks):
+            playing = [game_id for game_id, game_state in games.items() if game_state.status == 'playing']
+            steps = [steps_rng.randint(0, max_steps) for _ in playing]
+            stepping = [(game_id, count) for game_id, count in zip(playing, steps) if count]
+            if batch:
+                GameStateManager.step_games_batch([game_id for game_id, _ in stepping],
+                                                  [count for _, count in stepping], 0.5)
+            else:
+                for game_id, count in stepping:
+                    for _ in range(count):
+                        if GameStateManager.update_ball_position(game_id, 0.5) is None:
+                            break
+            for game_id, game_state in games.items():
+                if game_state.status != 'playing':
+                    GameStateManager.release_batch_slot(game_id)
+            # Paddles moved between ticks must be seen by the next batch step
+            for game_id in playing[::7]:
+                GameStateManager._move_paddle(games[game_id], 'player1', 'down')
+        return games
+
+    def assert_same_games(self, ticks, max_steps):
+        scalar = self.play(False, 7, ticks, max_steps)
+        batch = self.play(True, 7, ticks, max_steps)
+        self.assertTrue(any(game_state.status == 'finished' for game_state in scalar.values()))
+        for game_id in scalar:
+            self.assertEqual(physics_state(scalar[game_id]), physics_state(batch[game_id]), f"game {game_id}")
+
+    def test_single_step_matches_scalar(self, persistence):
+        self.assert_same_games(1200, 1)
+
+    def test_multi_step_matches_scalar(self, persistence):
+        # Several points in one tick must draw their random serves in the scalar order
+        self.assert_same_games(400, 5)
+
+    def test_release_restores_plain_objects(self, persistence):
+        games = make_games(3, 1)
+        GameStateManager._batch = None
+        GameStateManager.step_games_batch(list(games), [1, 1, 1])
+        before = physics_state(games['1'])
+        GameStateManager.release_batch_slot('1')
+        self.assertNotIsInstance(games['1'].ball, batch_physics.BallView)
+        self.assertEqual(physics_state(games['1']), before)
+        self.assertEqual(len(GameStateManager._batch), 2)
+
+
+class QueueInputTests(TestCase):
+    """Lag claimed by a client is bounded by the round trip measured on its connection"""
+
+    def setUp(self):
+        self.saved = GameStateManager._instances
+        self.game_state = make_games(1, 3)['0']
+        self.game_state.tick = 100
+
+    def tearDown(self):
+        GameStateManager._instances = self.saved
+
+    def claimed_lag(self, **kwargs):
+        GameStateManager.queue_input('0', '0a', 'up', seen_tick=0, **kwargs)
+        GameStateManager.apply_inputs(self.game_state)
+        return self.game_state.input_lag['player1']
+
+    def test_lag_bounded_by_round_trip(self):
+        self.assertEqual(self.claimed_lag(max_lag=5), 5)
+
+    def test_no_lag_before_round_trip_is_measured(self):
+        self.assertEqual(self.claimed_lag(max_lag=0), 0)
+
+    def test_recent_tick_kept(self):
+        GameStateManager.queue_input('0', '0a', 'up', seen_tick=98, max_lag=5)
+        GameStateManager.apply_inputs(self.game_state)
+        self.assertEqual(self.game_state.input_lag['player1'], 2)
+
+
+class DatabaseLeaderboardTests(TestCase):
+    """Ranks agree with the order of the pages, ties included"""
+
+    def test_tied_ratings_ranked_by_position(self):
+        User = get_user_model()
+        for username, rating in (('a', 1000), ('b', 1100), ('c', 1000), ('d', 1000), ('e', 900)):
+            PlayerStats.objects.create(user=User.objects.create_user(username, password='x'), rating=rating)
+        leaderboard = DatabaseLeaderboard()
+        top = leaderboard.top(0, 10)
+        self.assertEqual([leaderboard.rank(user_id) for user_id, _ in top], [1, 2, 3, 4, 5])
+
+
+def reference_step(ball, paddle1, paddle2, canvas_height, step_scale, substeps):
+    """Ground truth for one step: the overlap rules applied over many tiny sub-steps"""
+    scale = step_scale / substeps
+    r = ball.radius
+    for _ in range(substeps):
+        ball.x += ball.dx * scale
+        ball.y += ball.dy * scale
+        # Elastic wall bounce, mirroring the part of the sub-step spent past the wall
+        if ball.y - r < 0 and ball.dy < 0:
+            ball.y = 2 * r - ball.y
+            ball.dy *= -1
+        elif ball.y + r > canvas_height and ball.dy > 0:
+            ball.y = 2 * (canvas_height - r) - ball.y
+            ball.dy *= -1
+        paddle = paddle1 if ball.dx < 0 else paddle2
+        if (ball.x - r <= paddle.x + paddle.width and ball.x + r >= paddle.x and
+                paddle.y <= ball.y <= paddle.y + paddle.height):
+            ball.dx = bounce_dx(ball.dx)
+
+
+class SweptCollisionTests(TestCase):
+    """collision.sweep against a sub-stepped reference, on random balls and paddles"""
+    CANVAS_HEIGHT = 600
+    CASES = 2000
+
+    def check_random_cases(self, step_scale):
+        rng = random.Random(42)
+        checked = 0
+        for case in range(self.CASES):
+            speed = rng.uniform(2, 120)
+            start = (rng.uniform(80, 720), rng.uniform(20, 580),
+                     speed * rng.choice((1, -1)), rng.uniform(-speed, speed) / 2)
+            paddle_ys = (rng.uniform(0, 500), rng.uniform(0, 500))
+            substeps = max(64, int(speed * step_scale * 8))
+            tolerance = 3 * speed * 1.1 * step_scale / substeps + 1e-6
+
+            def run(step, grow=0.0):
+                ball = Ball(*start)
+                paddle1 = Paddle(x=50, y=paddle_ys[0] - grow, height=100 + 2 * grow)
+                paddle2 = Paddle(x=730, y=paddle_ys[1] - grow, height=100 + 2 * grow)
+                step(ball, paddle1, paddle2)
+                return ball
+
+            swept = lambda b, p1, p2: sweep_ball(b, p1, p2, self.CANVAS_HEIGHT, step_scale)
+            # Hits decided within the tolerance of a paddle corner are not meaningful
+            if (run(swept, tolerance).dx > 0) != (run(swept, -tolerance).dx > 0):
+                continue
+            checked += 1
+
+            result = run(swept)
+            reference = run(lambda b, p1, p2: reference_step(b, p1, p2, self.CANVAS_HEIGHT, step_scale, substeps))
+            self.assertEqual(result.dx > 0, reference.dx > 0, f"hit or miss of case {case} {start}")
+            self.assertAlmostEqual(result.x, reference.x, delta=tolerance, msg=f"x of case {case} {start}")
+            self.assertAlmostEqual(result.y, reference.y, delta=tolerance, msg=f"y of case {case} {start}")
+        self.assertGreater(checked, self.CASES * 0.9)
+
+    def test_matches_reference_at_60hz(self):
+        self.check_random_cases(1)
+
+    def test_matches_reference_at_30hz(self):
+        self.check_random_cases(2)
+
+    def test_matches_reference_at_15hz(self):
+        self.check_random_cases(4)
+
+    def test_fast_ball_does_not_tunnel(self):
+        # Crosses the whole paddle and more within one step
+        ball = Ball(x=120, y=300, dx=-100, dy=0)
+        self.assertTrue(sweep_ball(ball, Paddle(x=50, y=250), Paddle(x=730, y=250), self.CANVAS_HEIGHT))
+        self.assertGreater(ball.dx, 0)
+
+
+class FakeRedis:
+    """The few hash and key commands of redis.asyncio used by Checkpoints.rehydrate"""
+
+    def __init__(self, data):
+        self.data = data
+        self.deleted = []
+
+    async def scan_iter(self, match):
+        for key in list(self.data):
+            if fnmatch.fnmatchcase(key, match):
+                yield key.encode()
+
+    async def exists(self, key):
+        return int(key in self.data)
+
+    async def hgetall(self, key):
+        return {game_id.encode(): blob for game_id, blob in self.data.get(key, {}).items()}
+
+    def pipeline(self, transaction=True):
+        return self
+
+    def hdel(self, key, game_id):
+        self.deleted.append((key, game_id))
+
+    async def execute(self):
+        deleted, self.deleted = self.deleted, []
+        return [int(self.data.get(key, {}).pop(game_id, None) is not None) for key, game_id in deleted]
+
+
+@skipUnless(checkpoint.aioredis is not None, 'redis is not installed')
+@override_settings(GAME_CHECKPOINT_REDIS_URL='redis://checkpoints')
+class RehydrateTests(TestCase):
+    """Checkpoints left by a dead worker are loaded back by the next one"""
+
+    def setUp(self):
+        self.saved = GameStateManager._instances
+        GameStateManager._instances = {}
+        User = get_user_model()
+        self.game = Game.objects.create(player1=User.objects.create_user('left', password='x'),
+                                        player2=User.objects.create_user('right', password='x'),
+                                        status='playing')
+
+    def tearDown(self):
+        GameStateManager._instances = self.saved
+
+    async def test_restores_games_of_dead_worker_with_same_hostname_and_pid(self):
+        # A restarted container gets the hostname and often the pid of the process that died
+        game_id = str(self.game.id)
+        GameStateManager.create_game(game_id, '1', 'left')
+        GameStateManager.join_game(game_id, '2', 'right')
+        game_state = GameStateManager._instances.pop(game_id)
+        game_state.status = 'playing'
+        game_state.score1, game_state.score2 = 3, 1
+        dead = f"{socket.gethostname()}-{os.getpid()}"
+        client = FakeRedis({checkpoint.CHECKPOINTS_KEY.format(worker=dead): {game_id: pack_checkpoint(game_state)}})
+
+        with mock.patch.object(Checkpoints, 'get_client', return_value=client):
+            restored = await Checkpoints.rehydrate()
+
+        self.assertEqual(restored, [game_id])
+        self.assertEqual(GameStateManager._instances[game_id].score1, 3)
+        self.assertEqual(client.data[checkpoint.CHECKPOINTS_KEY.format(worker=dead)], {})
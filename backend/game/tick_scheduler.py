@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import time
+from channels.layers import get_channel_layer
+from django.conf import settings
+from .game_state_manager import GameStateManager
+from .game_engine import FixedTimestepEngine
+from .fanout import LocalFanout
+from .checkpoint import Checkpoints
+from .persistence import PersistenceQueue
+from .match_router import MatchRouter
+
+logger = logging.getLogger('game')
+
+
+class TickScheduler:
+    """Single per-process scheduler that steps every live match.
+
+    One asyncio task wakes up at the tick rate and advances all playing games
+    in GameStateManager._instances in one batched pass, instead of one timer
+    per match. The task stops by itself once no game is playing and is
+    restarted by `ensure_running`. Playing games are checkpointed to Redis
+    between ticks (see Checkpoints).
+    """
+    _task = None
+    _engines = {}  # FixedTimestepEngine per game_id
+    _metrics = {
+        'ticks': 0,
+        'overruns': 0,
+        'last_tick_duration': 0.0,
+        'max_tick_duration': 0.0,
+        'matches_last_tick': 0,
+        'max_matches_per_tick': 0,
+        'total_matches_stepped': 0,
+    }
+
+    @classmethod
+    def ensure_running(cls):
+        """Start the scheduler task if it is not already running"""
+        if cls._task is None or cls._task.done():
+            cls._task = asyncio.get_running_loop().create_task(cls._run())
+            logger.info("Tick scheduler started")
+        return cls._task
+
+    @classmethod
+    def get_metrics(cls) -> dict:
+        """Snapshot of the scheduler metrics"""
+        metrics = dict(cls._metrics)
+        metrics['running'] = cls._task is not None and not cls._task.done()
+        metrics['live_matches'] = len(cls._engines)
+        fanout = LocalFanout.get_stats()
+        metrics['local_broadcasts'] = fanout['local']
+        metrics['channel_layer_broadcasts'] = fanout['layer']
+        metrics['checkpoints'] = Checkpoints.get_stats()
+        metrics['router'] = MatchRouter.get_stats()
+        metrics['tick_rate'] = getattr(settings, 'GAME_TICK_RATE', 60)
+        ticks = metrics['ticks']
+        metrics['avg_matches_per_tick'] = metrics['total_matches_stepped'] / ticks if ticks else 0.0
+        return metrics
+
+    @classmethod
+    def _use_batch_backend(cls, matches: int) -> bool:
+        # Below GAME_BATCH_MIN_MATCHES the fixed cost of the NumPy calls outweighs the vectorization
+        if (getattr(settings, 'GAME_PHYSICS_BACKEND', 'scalar') != 'numpy' or
+                matches < getattr(settings, 'GAME_BATCH_MIN_MATCHES', 40)):
+            return False
+        from . import batch_physics
+        return batch_physics.is_available()
+
+    @classmethod
+    def _drop(cls, game_id):
+        """Forget the engine and batch slot of a game that is no longer playing"""
+        cls._engines.pop(game_id, None)
+        GameStateManager.release_batch_slot(game_id)
+
+    @classmethod
+    async def _run(cls):
+        tick_interval = 1.0 / getattr(settings, 'GAME_TICK_RATE', 60)
+        channel_layer = get_channel_layer()
+        next_tick = time.monotonic()
+        try:
+            while True:
+                started = time.monotonic()
+                matches = await cls.run_tick(channel_layer, started)
+                duration = time.monotonic() - started
+
+                metrics = cls._metrics
+                metrics['ticks'] += 1
+                metrics['last_tick_duration'] = duration
+                metrics['max_tick_duration'] = max(metrics['max_tick_duration'], duration)
+                metrics['matches_last_tick'] = matches
+                metrics['max_matches_per_tick'] = max(metrics['max_matches_per_tick'], matches)
+                metrics['total_matches_stepped'] += matches
+                if duration > tick_interval:
+                    metrics['overruns'] += 1
+                    logger.warning(f"Tick overrun: {duration * 1000:.1f}ms for {matches} matches")
+
+                if not cls._engines:
+                    logger.info("No live matches left, stopping tick scheduler")
+                    # Drop the checkpoints of the games that just ended
+                    Checkpoints.maybe_checkpoint(GameStateManager._instances, force=True)
+                    break
+                Checkpoints.maybe_checkpoint(GameStateManager._instances, started)
+                # Keeps updated_at of the games being played fresh for the inactive games sweeper
+                PersistenceQueue.touch(cls._engines, started)
+
+                # Schedule against the ideal timeline; skip ahead rather than burst after an overrun
+                next_tick += tick_interval
+                now = time.monotonic()
+                if next_tick < now:
+                    next_tick = now
+                await asyncio.sleep(next_tick - now)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in tick scheduler: {str(e)}", exc_info=True)
+        finally:
+            cls._task = None
+
+    @classmethod
+    async def run_tick(cls, channel_layer, now=None) -> int:
+        """Step every playing game once and flush their broadcasts.
+
+        Returns the number of matches stepped during this tick.
+        """
+        if now is None:
+            now = time.monotonic()
+        messages = []
+        due = []
+
+        # First pass: work out how many physics steps each playing game needs
+        for game_id, game_state in list(GameStateManager._instances.items()):
+            if game_state.status != 'playing':
+                cls._drop(game_id)
+                continue
+
+            engine = cls._engines.get(game_id)
+            if engine is None:
+                engine = cls._engines[game_id] = FixedTimestepEngine(game_id)
+                # A game rehydrated from a checkpoint keeps counting from its last tick
+                engine.tick = game_state.tick
+
+            steps, should_broadcast = engine.consume(now)
+
+            # Inputs received since the last tick are applied before the physics step,
+            # and the result goes out with this tick's broadcast
+            if GameStateManager.apply_inputs(game_state):
+                should_broadcast = True
+                GameStateManager.compensate_lag(game_state)
+            due.append((game_id, game_state, engine, steps, should_broadcast))
+
+        # Second pass: run the physics, vectorized across games when enabled
+        stepping = [(game_id, engine, steps) for game_id, _, engine, steps, _ in due if steps]
+        if stepping and cls._use_batch_backend(len(stepping)):
+            GameStateManager.step_games_batch(
+                [game_id for game_id, _, _ in stepping],
+                [steps for _, _, steps in stepping],
+                stepping[0][1].step_scale
+            )
+        else:
+            for game_id, engine, steps in stepping:
+                for _ in range(steps):
+                    if GameStateManager.update_ball_position(game_id, engine.step_scale) is None:
+                        break
+
+        # Third pass: collect notifications and broadcasts
+        for game_id, game_state, engine, steps, should_broadcast in due:
+            player_ids = game_state.player_ids()
+            if steps and game_state.status == 'playing':
+                GameStateManager.record_snapshot(game_state, engine.tick)
+
+            # Check if game has ended and needs to send notification
+            if game_state.send_end_notification and game_state.end_notification_data:
+                print(f"[DEBUG] Game {game_id} has end notification flag set, sending notification")
+                messages.append((game_id, game_state.end_notification_data, player_ids))
+                # Clear notification flag to avoid sending multiple times
+                game_state.send_end_notification = False
+                should_broadcast = True
+
+            if should_broadcast:
+                messages.append((game_id, GameStateManager.state_update_event(game_id), player_ids))
+
+            if game_state.status != 'playing':
+                print(f"[DEBUG] Game {game_id} is no longer playing, removing it from the scheduler")
+                if engine.dropped_time:
+                    logger.warning(f"Game {game_id} dropped {engine.dropped_time:.3f}s of simulation time under load")
+                cls._drop(game_id)
+
+        # Remove engines of games that were deleted from memory
+        for game_id in list(cls._engines):
+            if game_id not in GameStateManager._instances:
+                cls._drop(game_id)
+
+        # Players connected to this process get their frames directly, others through the channel layer
+        if messages:
+            results = await asyncio.gather(
+                *(LocalFanout.broadcast(channel_layer, game_id, message, player_ids)
+                  for game_id, message, player_ids in messages),
+                return_exceptions=True
+            )
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error(f"Error broadcasting game state: {str(result)}")
+
+        return len(stepping)
@@ -5,8 +5,11 @@ from . import views
 urlpatterns = [
     path('create/', views.create_game, name='create_game'),
     path('join/<int:game_id>/', views.join_game, name='join_game'),
+    path('status/', views.game_status, name='game_status'),
     path('get_games/', views.get_games, name='get_games'),
     path('get_stats/', views.get_stats, name='get_stats'),
+    path('leaderboard/', views.leaderboard, name='leaderboard'),
     path('play/<int:game_id>/', views.get_status, name='get_status'),
     path('end/<int:game_id>/', views.end_game, name='end_game'),
+    path('metrics/', views.scheduler_metrics, name='scheduler_metrics'),
 ]
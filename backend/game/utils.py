@@ -1,67 +1,73 @@
+from django.db import connection
+from django.db.models import BigIntegerField, CharField, DurationField, ExpressionWrapper, F, Value
+from django.db.models.functions import Cast, Concat, Extract, Greatest, Length, LPad
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models import Q
 
 
-def cleanup_inactive_games():
+INACTIVE_STATUSES = ['playing', 'waiting', 'active']
+
+
+def seconds_between(start: str, end: str):
+    """Expression SQL du nombre entier de secondes entre deux champs date/heure"""
+    elapsed = ExpressionWrapper(F(end) - F(start), output_field=DurationField())
+    if connection.features.has_native_duration_field:
+        # PostgreSQL : intervalle, converti via EXTRACT(EPOCH ...)
+        return Cast(Extract(elapsed, 'epoch'), BigIntegerField())
+    # SQLite, MySQL : la différence est déjà un nombre de microsecondes
+    return Cast(elapsed, BigIntegerField()) / Value(1000000)
+
+
+def formatted_duration(seconds):
+    """Expression SQL 'MM:SS' d'une durée en secondes, comme duration_formatted"""
+    def two_digits(value):
+        # Au moins deux chiffres, sans tronquer comme LPAD sur PostgreSQL au-delà de 99 minutes
+        text = Cast(value, CharField())
+        return LPad(text, Greatest(Length(text), Value(2)), Value('0'))
+    return Concat(two_digits(seconds / Value(60)), Value(':'),
+                  two_digits(seconds - seconds / Value(60) * Value(60)),
+                  output_field=CharField())
+
+
+def cleanup_inactive_games(max_age_minutes=5):
     """
-    Parcourt toutes les parties en cours, en attente ou actives (status='playing', 'waiting' ou 'active') 
-    qui ont commencé il y a plus de 5 minutes.
-    - Si la partie a un score de 0-0, elle est supprimée de la base de données.
-    - Sinon, son statut est mis à 'finished' et la date de fin (end_time) enregistrée.
-    
-    Cette fonction peut être utilisée dans une tâche Celery ou une commande Django.
+    Nettoie en bloc les parties en cours, en attente ou actives (status='playing', 'waiting' ou 'active')
+    sans activité depuis plus de `max_age_minutes` minutes.
+    - Les parties avec un score de 0-0 sont supprimées en une seule requête.
+    - Les autres passent en 'finished' en une seule requête UPDATE, avec comme durée le temps
+      écoulé entre leur création et leur dernière activité.
+
+    La dernière activité est `updated_at` : il est mis à jour à chaque écriture de la partie, et
+    toutes les GAME_ACTIVITY_INTERVAL secondes pour les parties jouées par un worker (voir
+    PersistenceQueue.touch), si bien qu'un long match en cours n'est jamais interrompu.
+    Les deux requêtes s'appuient sur l'index (status, updated_at). Cette fonction est appelée
+    périodiquement par le thread de persistance et par la commande `manage.py cleanup_games`.
     """
     from game.models import Game  # Import local pour éviter les imports circulaires
-    
-    # Heure actuelle
+
+    # Heure actuelle et heure limite
     now = timezone.now()
-    
-    # Calcul de l'heure limite (5 minutes dans le passé)
-    time_threshold = now - timedelta(minutes=5)
-    
-    # Récupération des parties en cours, en attente ou actives qui ont commencé il y a plus de 5 minutes
+    time_threshold = now - timedelta(minutes=max_age_minutes)
+
     inactive_games = Game.objects.filter(
-        status__in=['playing', 'waiting', 'active'],
-        created_at__lt=time_threshold
+        status__in=INACTIVE_STATUSES,
+        updated_at__lt=time_threshold
+    )
+
+    # Suppression en bloc des parties 0-0
+    _, deleted_per_model = inactive_games.filter(score_player1=0, score_player2=0).delete()
+    deleted_count = deleted_per_model.get(Game._meta.label, 0)
+
+    # Les autres passent en 'finished' dans la base, sans être chargées ;
+    # updated_at en dernier, les durées sont calculées avec sa valeur précédente
+    duration = seconds_between('created_at', 'updated_at')
+    finished_count = inactive_games.update(
+        status='finished',
+        duration=duration,
+        duration_formatted=formatted_duration(duration),
+        updated_at=now
     )
-    
-    # Compteurs pour les statistiques
-    deleted_count = 0
-    finished_count = 0
-    
-    # Traitement de chaque partie inactive
-    for game in inactive_games:
-        if game.score_player1 == 0 and game.score_player2 == 0:
-            # Si le score est 0-0, suppression de la partie
-            game_id = game.id
-            game.delete()
-            deleted_count += 1
-            print(f"Partie #{game_id} supprimée (score 0-0, inactive depuis plus de 5 minutes)")
-        else:
-            # Sinon, mise à jour du statut et enregistrement de la date de fin
-            game.status = 'finished'
-            
-            # Calcul de la durée en secondes
-            duration_seconds = (now - game.created_at).total_seconds()
-            game.duration = duration_seconds
-            
-            # Formatage de la durée en MM:SS
-            minutes, seconds = divmod(int(duration_seconds), 60)
-            game.duration_formatted = f"{minutes:02d}:{seconds:02d}"
-            
-            # Détermination du gagnant - COMMENTED OUT TO CENTRALIZE WINNER DETERMINATION
-            # Only the score comparison in end_game method will set the winner
-            # if game.score_player1 > game.score_player2:
-            #     game.winner = game.player1
-            # elif game.score_player2 > game.score_player1:
-            #     game.winner = game.player2
-            
-            # Sauvegarde des modifications
-            game.save()
-            finished_count += 1
-            print(f"Partie #{game.id} terminée (score {game.score_player1}-{game.score_player2}, inactive depuis plus de 5 minutes)")
-    
+
     return {
         'deleted': deleted_count,
         'finished': finished_count,
@@ -1,11 +1,20 @@
+import binascii
+import hashlib
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
 from django.shortcuts import render
+from django.utils.http import quote_etag
 from rest_framework import viewsets, status
 from rest_framework.decorators import api_view, permission_classes
 from django.contrib.auth import get_user_model
 from django.views.decorators.csrf import ensure_csrf_cookie, csrf_exempt
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser
 from .models import Game
+from .leaderboard import Leaderboard
+from .matchmaking import MatchmakingQueue
+from .ratings import get_stats as get_player_stats, record_result
 from .serializers import GameSerializer, GameDetailSerializer
 from django.utils import timezone
 from django.db.models import Q
@@ -29,14 +38,20 @@ class GameViewSet(viewsets.ModelViewSet):
 def create_game(request):
     game = Game.objects.create(player1=request.user)
     
-    # Initialize game state in GameStateManager
-    from .game_state_manager import GameStateManager
-    initial_state = GameStateManager.create_game(str(game.id), str(request.user.id), request.user.username)
-    
-    # Get the channel layer and send game_created message
+    # Initialize game state on the worker owning the game's shard
+    from .match_router import MatchRouter
     from channels.layers import get_channel_layer
     from asgiref.sync import async_to_sync
+
+    async def create_on_shard():
+        await MatchRouter.ensure_running()
+        return await MatchRouter.call(game.id, 'create_game', str(request.user.id), request.user.username)
+    initial_state = async_to_sync(create_on_shard)()
+
+    # Matchable only once the game exists on its owner
+    MatchmakingQueue.enqueue(game.id, request.user.id, request.data.get('bucket'))
     
+    # Send game_created message
     channel_layer = get_channel_layer()
     user_group = f"user_{request.user.id}"
     
@@ -57,10 +72,15 @@ def create_game(request):
 def join_game(request, game_id):
     try:
         game = Game.objects.get(id=game_id, status='waiting')
-        if game.player1 != request.user and not game.player2:
-            game.player2 = request.user
-            game.status = 'in_progress'
-            game.save()
+        # Conditional update so that two players cannot both take the free slot
+        joined = Game.objects.filter(
+            id=game.id, status='waiting', player2__isnull=True
+        ).exclude(player1=request.user).update(
+            player2=request.user, status='in_progress', updated_at=timezone.now()
+        )
+        if joined:
+            MatchmakingQueue.remove(game.id)
+            game.refresh_from_db()
             return Response(GameSerializer(game).data)
         return Response({'error': 'Cannot join this game'}, status=status.HTTP_400_BAD_REQUEST)
     except Game.DoesNotExist:
@@ -77,13 +97,10 @@ def user_games(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def game_status(request):
-    """Get the status of active games for the current user"""
-    active_game = Game.objects.filter(
-        status='playing',
-        player1=request.user
-    ).first() or Game.objects.filter(
-        status='playing',
-        player2=request.user
+    """Get the status of active games for the current user, or the game matchmaking would give them"""
+    active_game = Game.objects.select_related('player1', 'player2').filter(
+        Q(player1=request.user) | Q(player2=request.user),
+        status='playing'
     ).first()
 
     if active_game:
@@ -92,30 +109,67 @@ def game_status(request):
             'game_id': str(active_game.id),
             'player1': active_game.player1.username,
             'player2': active_game.player2.username if active_game.player2 else None,
-            'score1': active_game.player1_score,
-            'score2': active_game.player2_score,
+            'score1': active_game.score_player1,
+            'score2': active_game.score_player2,
         })
 
-    waiting_game = Game.objects.filter(status='waiting').first()
-    if waiting_game:
+    waiting_game_id = MatchmakingQueue.peek(request.user.id, request.query_params.get('bucket'))
+    if waiting_game_id:
         return Response({
             'status': 'waiting',
-            'game_id': str(waiting_game.id)
+            'game_id': waiting_game_id
         })
 
     return Response({'status': 'no_game'})
 
+# Columns of a match history row, with the usernames of the joined players
+HISTORY_FIELDS = (
+    'id', 'score_player1', 'score_player2', 'created_at', 'duration_formatted',
+    'player1__id', 'player1__username', 'player2__id', 'player2__username', 'winner__id', 'winner__username',
+)
+
+def _encode_cursor(game):
+    return urlsafe_b64encode(f"{game.created_at.isoformat()}|{game.id}".encode()).decode()
+
+def _decode_cursor(cursor):
+    """(created_at, id) of the last game of the previous page"""
+    created_at, game_id = urlsafe_b64decode(cursor.encode()).decode().split('|')
+    parsed = datetime.fromisoformat(created_at)
+    if parsed.tzinfo is None:
+        raise ValueError('cursor timestamp has no timezone')
+    return parsed, int(game_id)
+
 @api_view(['GET'])
 @ensure_csrf_cookie
 @permission_classes([IsAuthenticated])
 def get_games(request):
+    """Match history of `id_user`, newest first, `limit` games after `cursor`"""
     id_user = request.query_params.get('id_user')
     if not id_user:
         return Response({'error': 'id_user is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        id_user = int(id_user)
+        limit = min(100, max(1, int(request.query_params.get('limit', 20))))
+        after = None
+        if request.query_params.get('cursor'):
+            after = _decode_cursor(request.query_params['cursor'])
+    except (ValueError, UnicodeDecodeError, binascii.Error):
+        return Response({'error': 'Invalid id_user, limit or cursor'}, status=status.HTTP_400_BAD_REQUEST)
 
-    games = Game.objects.filter(
-        Q(player1_id=id_user) | Q(player2_id=id_user)
-    ).order_by('created_at')
+    # One query per player column, each walking its (player, created_at) index, merged here;
+    # an OR of both columns cannot be read in order from a single index
+    games = Game.objects.select_related('player1', 'player2', 'winner').only(*HISTORY_FIELDS)
+    if after is not None:
+        created_at, game_id = after
+        games = games.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=game_id))
+    pages = [
+        games.filter(**{column: id_user}).order_by('-created_at', '-id')[:limit + 1]
+        for column in ('player1_id', 'player2_id')
+    ]
+    merged = {game.id: game for page in pages for game in page}
+    page = sorted(merged.values(), key=lambda game: (game.created_at, game.id), reverse=True)
+    next_cursor = _encode_cursor(page[limit - 1]) if len(page) > limit else None
+    page = page[:limit]
 
     formatted_games = [
         {
@@ -137,9 +191,15 @@ def get_games(request):
             "timestamp": game.created_at.strftime("%Y-%m-%d %H:%M:%S"),
             "duration_formatted": game.duration_formatted,
         }
-        for game in games
+        for game in page
     ]
-    return Response({"games": formatted_games}, status=status.HTTP_200_OK)
+    data = {"games": formatted_games, "next_cursor": next_cursor}
+
+    # The page is cheap to rebuild but not to download again; let the browser revalidate it
+    etag = quote_etag(hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest())
+    if etag in [tag.strip().removeprefix('W/') for tag in request.headers.get('If-None-Match', '').split(',')]:
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return Response(data, status=status.HTTP_200_OK, headers={'ETag': etag})
 
 @api_view(['GET'])
 @ensure_csrf_cookie
@@ -149,25 +209,47 @@ def get_stats(request):
     if not id_user:
         return Response({'error': 'id_user is required'}, status=status.HTTP_400_BAD_REQUEST)
 
-    games_played = Game.objects.filter(
-        Q(player1_id=id_user) | Q(player2_id=id_user)
-    ).count()
-
-    games_won = Game.objects.filter(winner_id=id_user).count()
-
-    defeats = Game.objects.filter(
-        Q(player1_id=id_user) | Q(player2_id=id_user),
-        winner__isnull=False
-    ).exclude(winner_id=id_user).count()
+    # One PlayerStats row maintained by game.ratings when games finish
+    player_stats = get_player_stats(id_user)
 
     stats = {
-        "games_played": games_played,
-        "games_won": games_won,
-        "defeats": defeats,
+        "games_played": player_stats['games_played'],
+        "games_won": player_stats['games_won'],
+        "defeats": player_stats['games_lost'],
+        "points_for": player_stats['points_for'],
+        "points_against": player_stats['points_against'],
+        "current_streak": player_stats['current_streak'],
+        "best_streak": player_stats['best_streak'],
+        "play_time": player_stats['play_time'],
+        "rating": round(player_stats['rating']),
+        "rank": Leaderboard.rank(id_user) if player_stats['games_played'] else None,
     }
 
     return Response({"stats": stats}, status=status.HTTP_200_OK)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def leaderboard(request):
+    """Players by rating, `limit` (at most 100) starting after `offset`"""
+    try:
+        offset = max(0, int(request.query_params.get('offset', 0)))
+        limit = min(100, max(1, int(request.query_params.get('limit', 20))))
+    except ValueError:
+        return Response({'error': 'offset and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+
+    entries = Leaderboard.top(offset, limit)
+    usernames = dict(User.objects.filter(id__in=[user_id for user_id, _ in entries]).values_list('id', 'username'))
+    players = [
+        {
+            "rank": offset + index + 1,
+            "id": user_id,
+            "username": usernames.get(user_id),
+            "rating": round(rating),
+        }
+        for index, (user_id, rating) in enumerate(entries)
+    ]
+    return Response({"players": players, "total": Leaderboard.size()}, status=status.HTTP_200_OK)
+
 @api_view(['GET'])
 @ensure_csrf_cookie
 @permission_classes([IsAuthenticated])
@@ -248,6 +330,8 @@ def end_game(request, game_id):
             game.duration_formatted = f"{minutes:02d}:{seconds:02d}"
         
         game.save()
+        MatchmakingQueue.remove(game.id)
+        record_result(game.id)
         
         # Format the game data for response
         game_data = {
@@ -270,3 +354,10 @@ def end_game(request, game_id):
         return Response({"error": "Game not found"}, status=status.HTTP_404_NOT_FOUND)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def scheduler_metrics(request):
+    """Tick scheduler metrics of the worker serving this request"""
+    from .tick_scheduler import TickScheduler
+    return Response({"metrics": TickScheduler.get_metrics()}, status=status.HTTP_200_OK)
@@ -0,0 +1,53 @@
+import struct
+from typing import Dict
+from django.conf import settings
+
+# WebSocket subprotocol a client offers to receive packed state frames
+SUBPROTOCOL = 'pong.bin.v3'
+WIRE_VERSION = 3
+
+# version, status, seq, ball x/y/dx/dy, paddle1 y, paddle2 y, score1, score2,
+# player1 input ack, player2 input ack, tick (little-endian, 46 bytes)
+FRAME = struct.Struct('<BBIffffffHHIII')
+
+STATUS_CODES = {'waiting': 0, 'playing': 1, 'finished': 2}
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+
+def binary_enabled() -> bool:
+    return getattr(settings, 'GAME_BINARY_FRAMES', True)
+
+
+def pack_state(game_state, seq: int) -> bytes:
+    """Pack the per-tick fields of a GameState into a fixed-layout frame"""
+    ball = game_state.ball
+    return FRAME.pack(
+        WIRE_VERSION,
+        STATUS_CODES.get(game_state.status, 0),
+        seq & 0xFFFFFFFF,
+        ball.x, ball.y, ball.dx, ball.dy,
+        game_state.paddle1.y, game_state.paddle2.y,
+        game_state.score1, game_state.score2,
+        game_state.input_acks['player1'] & 0xFFFFFFFF,
+        game_state.input_acks['player2'] & 0xFFFFFFFF,
+        game_state.tick & 0xFFFFFFFF
+    )
+
+
+def unpack_state(frame: bytes) -> Dict:
+    """Decode a frame into the partial wire-format dict it stands for"""
+    (version, status, seq, x, y, dx, dy,
+     paddle1_y, paddle2_y, score1, score2, ack1, ack2, tick) = FRAME.unpack(frame)
+    if version != WIRE_VERSION:
+        raise ValueError(f"Unsupported wire version {version}")
+    return {
+        'seq': seq,
+        'game_state': {
+            'ball': {'x': x, 'y': y, 'dx': dx, 'dy': dy},
+            'paddles': {'player1': {'y': paddle1_y}, 'player2': {'y': paddle2_y}},
+            'score': {'player1': score1, 'player2': score2},
+            'status': STATUS_NAMES.get(status, 'waiting'),
+            'input_acks': {'player1': ack1, 'player2': ack2},
+            'tick': tick
+        }
+    }
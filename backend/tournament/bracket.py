@@ -0,0 +1,306 @@
+import logging
+import threading
+from typing import Dict, List, Optional
+from django.db import transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from game.models import Game
+from game.ratings import record_results
+from .models import Tournament, TournamentMatch, TournamentPlayer
+from .pairing import ROUND_FORMATS, create_round, next_round_pairs, standings
+from .scheduler import launch_ready_matches
+
+logger = logging.getLogger('tournament')
+
+
+class Bracket:
+    """Shape of a single elimination bracket: which match feeds which.
+
+    Built from one query over the tournament's matches (ids, rounds and
+    next_match links) and kept per tournament, since the shape does not
+    change once the tournament has started; players, winners and statuses
+    are always read from the database. Parent, sibling and slot lookups are
+    dictionary accesses.
+
+    Brackets created before next_match was filled are linked on load from
+    their round and match numbers (matches 2k-1 and 2k feed match k of the
+    next round).
+    """
+    _brackets: Dict[int, 'Bracket'] = {}
+    _lock = threading.Lock()
+
+    def __init__(self, tournament_id: int, rows):
+        self.tournament_id = tournament_id
+        self.parents: Dict[int, Optional[int]] = {}  # match_id -> next_match_id
+        self.children: Dict[int, List[int]] = {}  # match_id -> feeding match ids, by match number
+        self.round_sizes: Dict[int, int] = {}  # round_number -> number of matches
+
+        for match_id, round_number, match_number, next_match_id in sorted(rows, key=lambda row: (row[1], row[2])):
+            self.parents[match_id] = next_match_id
+            self.round_sizes[round_number] = self.round_sizes.get(round_number, 0) + 1
+            if next_match_id is not None:
+                self.children.setdefault(next_match_id, []).append(match_id)
+        self.num_rounds = max(self.round_sizes, default=0)
+
+    @classmethod
+    def get(cls, tournament) -> 'Bracket':
+        """Bracket of a tournament (instance or id), loaded on first use"""
+        tournament_id = getattr(tournament, 'id', tournament)
+        bracket = cls._brackets.get(tournament_id)
+        if bracket is None:
+            bracket = cls.load(tournament_id)
+            with cls._lock:
+                cls._brackets[tournament_id] = bracket
+        return bracket
+
+    @classmethod
+    def load(cls, tournament_id: int) -> 'Bracket':
+        rows = list(
+            TournamentMatch.objects.filter(tournament_id=tournament_id)
+            .values_list('id', 'round_number', 'match_number', 'next_match_id')
+        )
+        final_round = max((row[1] for row in rows), default=0)
+        if any(next_match_id is None and round_number < final_round for _, round_number, _, next_match_id in rows):
+            rows = cls._link(rows)
+        return cls(tournament_id, rows)
+
+    @classmethod
+    def _link(cls, rows):
+        """Fill the next_match of brackets created without it, in one bulk UPDATE"""
+        ids = {(round_number, match_number): match_id for match_id, round_number, match_number, _ in rows}
+        linked, updates = [], []
+        for match_id, round_number, match_number, next_match_id in rows:
+            if next_match_id is None:
+                next_match_id = ids.get((round_number + 1, (match_number + 1) // 2))
+                if next_match_id is not None:
+                    updates.append(TournamentMatch(id=match_id, next_match_id=next_match_id))
+            linked.append((match_id, round_number, match_number, next_match_id))
+        TournamentMatch.objects.bulk_update(updates, ['next_match'])
+        return linked
+
+    @classmethod
+    def forget(cls, tournament):
+        """Drop the cached bracket of a finished tournament"""
+        with cls._lock:
+            cls._brackets.pop(getattr(tournament, 'id', tournament), None)
+
+    def parent(self, match_id: int) -> Optional[int]:
+        """Match the winner of `match_id` plays next, None for the final"""
+        return self.parents.get(match_id)
+
+    def sibling(self, match_id: int) -> Optional[int]:
+        """Match whose winner meets the winner of `match_id`"""
+        for other in self.children.get(self.parents.get(match_id), ()):
+            if other != match_id:
+                return other
+        return None
+
+    def slot(self, match_id: int) -> str:
+        """Player field of the parent match taken by the winner of `match_id`"""
+        feeders = self.children.get(self.parents.get(match_id), [])
+        return 'player1' if feeders and feeders[0] == match_id else 'player2'
+
+    def round_size(self, round_number: int) -> int:
+        """Number of matches in a round (4 for quarter-finals, 1 for the final)"""
+        return self.round_sizes.get(round_number, 0)
+
+
+def bracket_size(num_players: int) -> int:
+    """Smallest power of 2 holding `num_players`, the missing players being byes"""
+    return max(2, 1 << (num_players - 1).bit_length())
+
+
+def seed_order(size: int) -> List[int]:
+    """Seeds in bracket order, so that the best seeds meet as late as possible.
+
+    First round match k opposes seeds order[2k-2] and order[2k-1], each
+    seed facing size + 1 - seed: [1, 8, 4, 5, 2, 7, 3, 6] for 8. Seeds 1
+    and 2 can only meet in the final, and the byes of a bracket that is not
+    full go to the top seeds.
+    """
+    order = [1]
+    while len(order) < size:
+        round_size = len(order) * 2
+        order = [seed for top in order for seed in (top, round_size + 1 - top)]
+    return order
+
+
+def seeded_players(tournament) -> List[TournamentPlayer]:
+    """TournamentPlayers of `tournament` from the first seed to the last, with their user, in one query.
+
+    Seeded by rating (players without rated games have the initial rating)
+    or by join order, per `tournament.seeding`; ties go to the earliest to join.
+    """
+    from game.ratings import initial_rating
+
+    entries = TournamentPlayer.objects.filter(tournament=tournament).select_related('player')
+    if tournament.seeding == 'rating':
+        rating = Coalesce('player__player_stats__rating', Value(float(initial_rating())), output_field=FloatField())
+        entries = entries.order_by(rating.desc(), 'joined_at', 'id')
+    else:
+        entries = entries.order_by('joined_at', 'id')
+    return list(entries)
+
+
+def create_bracket(tournament, players, size: Optional[int] = None) -> List[TournamentMatch]:
+    """Create the matches of a single elimination bracket for `players`, listed by seed.
+
+    The bracket has `size` slots (bracket_size(len(players)) by default),
+    placed by seed_order. A first round match without an opponent is a bye:
+    it is created completed and its player already sits in the next round.
+    All the matches are created with one bulk INSERT and linked to the match
+    their winner plays next with one bulk UPDATE, whatever the number of
+    players. Returns the matches ordered by round and match number.
+    """
+    size = size or bracket_size(len(players))
+    num_rounds = size.bit_length() - 1
+    now = timezone.now()
+
+    def seed_player(seed):
+        return players[seed - 1] if seed <= len(players) else None
+
+    seeds = seed_order(size)
+    matches = [
+        TournamentMatch(tournament=tournament, player1=seed_player(seeds[i * 2]), player2=seed_player(seeds[i * 2 + 1]),
+                        round_number=1, match_number=i + 1, status='pending')
+        for i in range(size // 2)
+    ]
+    for round_number in range(2, num_rounds + 1):
+        matches.extend(
+            TournamentMatch(tournament=tournament, round_number=round_number, match_number=i + 1, status='pending')
+            for i in range(size >> round_number)
+        )
+
+    # Matches 2k-1 and 2k of a round feed player1 and player2 of match k of the next one
+    positions = {(match.round_number, match.match_number): match for match in matches}
+
+    def parent(match):
+        return positions.get((match.round_number + 1, (match.match_number + 1) // 2))
+
+    for match in matches[:size // 2]:
+        if match.player1 is None or match.player2 is None:
+            match.winner = match.player1 or match.player2
+            match.status = 'completed'
+            match.started_at = match.ended_at = now
+            if parent(match) is not None:
+                setattr(parent(match), 'player1' if match.match_number % 2 else 'player2', match.winner)
+
+    matches = TournamentMatch.objects.bulk_create(matches)
+    for match in matches:
+        match.next_match = parent(match)
+    TournamentMatch.objects.bulk_update(matches, ['next_match'])
+    byes = [match.winner_id for match in matches if match.winner_id is not None]
+    if byes:
+        TournamentPlayer.objects.filter(tournament=tournament, player_id__in=byes).update(
+            wins=F('wins') + 1, byes=F('byes') + 1
+        )
+
+    bracket = Bracket(tournament.id, [
+        (match.id, match.round_number, match.match_number, match.next_match_id) for match in matches
+    ])
+    with Bracket._lock:
+        Bracket._brackets[tournament.id] = bracket
+    return matches
+
+
+def advance(match, winner) -> Optional[Dict]:
+    """Record the result of a tournament match and move the tournament on.
+
+    The single place where a match result is applied, whatever reported it
+    (game end, complete-match, forfeit or disconnection). In one
+    transaction it completes the match and its game and counts the result
+    in both players' standings. In a single elimination bracket it then
+    eliminates the loser and puts the winner in their slot of the next
+    match, or completes the tournament after the final or when a single
+    player is left. In Swiss and round robin tournaments the last result of
+    a round pairs the next one (see pairing.next_round_pairs), or completes
+    the tournament after its last round. The matches that became ready are
+    started. The match and tournament rows are locked first, so reporting
+    the same result twice only applies it once (the later calls return
+    None) and results of the same tournament are applied one at a time.
+
+    Returns a dict with the match, winner_id, loser_id, next_match_id,
+    round_size and tournament_completed.
+    """
+    winner_id = getattr(winner, 'id', winner)
+
+    with transaction.atomic():
+        match = TournamentMatch.objects.select_for_update().get(id=match.id)
+        if match.status not in ('pending', 'in_progress') or winner_id not in (match.player1_id, match.player2_id):
+            logger.info(f"Match {match.id} is {match.status}, result for player {winner_id} ignored")
+            return None
+        tournament = Tournament.objects.select_for_update().get(id=match.tournament_id)
+        loser_id = match.player2_id if winner_id == match.player1_id else match.player1_id
+        now = timezone.now()
+
+        match.winner_id = winner_id
+        match.status = 'completed'
+        match.ended_at = now
+        match.save(update_fields=['winner', 'status', 'ended_at'])
+        if match.game_id is not None:
+            Game.objects.filter(id=match.game_id).exclude(status='finished').update(status='finished', winner_id=winner_id)
+            game_id = match.game_id
+            transaction.on_commit(lambda: _rate_game(game_id))
+        TournamentPlayer.objects.filter(tournament=tournament, player_id=winner_id).update(wins=F('wins') + 1)
+        TournamentPlayer.objects.filter(tournament=tournament, player_id=loser_id).update(losses=F('losses') + 1)
+
+        if tournament.format in ROUND_FORMATS:
+            next_match_id, round_size, completed = None, None, _advance_round(tournament, match, now)
+        else:
+            next_match_id, round_size, completed = _advance_bracket(tournament, match, loser_id, now)
+        if not completed:
+            launch_ready_matches(tournament)
+
+    logger.info(f"Match {match.id}: player {winner_id} won"
+                + (", tournament completed" if completed else f", plays match {next_match_id} next" if next_match_id else ""))
+    return {
+        'match': match,
+        'winner_id': winner_id,
+        'loser_id': loser_id,
+        'next_match_id': next_match_id,
+        'round_size': round_size,
+        'tournament_completed': completed,
+    }
+
+
+def _rate_game(game_id):
+    """Rate the game of a match whose result was just recorded, like the games finished by play"""
+    try:
+        record_results([game_id])
+    except Exception as e:
+        logger.error(f"Failed to rate game {game_id}: {str(e)}", exc_info=True)
+
+
+def _advance_bracket(tournament, match, loser_id, now):
+    """Single elimination part of advance: (next_match_id, round_size, tournament_completed)"""
+    bracket = Bracket.get(tournament)
+    TournamentPlayer.objects.filter(tournament=tournament, player_id=loser_id).update(alive=False)
+    alive_players = TournamentPlayer.objects.filter(tournament=tournament, alive=True).count()
+
+    next_match_id = bracket.parent(match.id)
+    completed = next_match_id is None or alive_players == 1
+    if completed:
+        Tournament.objects.filter(id=tournament.id).update(status='completed', winner_id=match.winner_id, ended_at=now)
+        transaction.on_commit(lambda: Bracket.forget(tournament))
+    else:
+        TournamentMatch.objects.filter(id=next_match_id).update(**{f'{bracket.slot(match.id)}_id': match.winner_id})
+    return next_match_id, bracket.round_size(match.round_number), completed
+
+
+def _advance_round(tournament, match, now) -> bool:
+    """Swiss and round robin part of advance, True if the tournament is completed"""
+    if TournamentMatch.objects.filter(tournament=tournament, round_number=match.round_number).exclude(status='completed').exists():
+        return False
+
+    # Dernier résultat du tour : on apparie le suivant ou on termine le tournoi
+    entries = seeded_players(tournament)
+    if match.round_number < (tournament.num_rounds or 0) and sum(entry.alive for entry in entries) >= 2:
+        pairs = next_round_pairs(tournament, match.round_number + 1, entries)
+        if any(player2_id is not None for _, player2_id in pairs):
+            create_round(tournament, match.round_number + 1, pairs)
+            return False
+
+    leader = standings(tournament).filter(alive=True).first() or standings(tournament).first()
+    Tournament.objects.filter(id=tournament.id).update(status='completed', winner_id=leader.player_id, ended_at=now)
+    return True
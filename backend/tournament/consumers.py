@@ -3,11 +3,9 @@ from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from .models import Tournament, TournamentMatch
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
 from django.db.models import Q
-import math
 import logging
-from game.models import Game
+from .bracket import advance
 
 logger = logging.getLogger('tournament')
 
@@ -62,251 +60,19 @@ class TournamentConsumer(AsyncWebsocketConsumer):
             # Si le match est en cours et qu'un joueur se déconnecte
             logger.info(f"[DISCONNECT] Processing disconnect for match {self.active_match.id}, current status: {self.active_match.status}")
             if self.active_match.status == 'in_progress':
-                # Détermine le gagnant (l'autre joueur)
+                # L'autre joueur gagne le match et passe au tour suivant
                 winner = self.active_match.player2 if self.user == self.active_match.player1 else self.active_match.player1
-
-                # Met à jour le match
-                logger.info(f"[DISCONNECT] Setting winner for match {self.active_match.id} to {winner.username} (ID: {winner.id})")
-                self.active_match.winner = winner
-                self.active_match.status = 'completed'
-                self.active_match.ended_at = timezone.now()
-                self.active_match.save()
-                logger.info(f"[DISCONNECT] Match {self.active_match.id} updated to status: {self.active_match.status}")
-
-                # Met à jour le jeu associé
-                if self.active_match.game:
-                    game = self.active_match.game
-                    game.status = 'finished'
-                    game.winner = winner
-                    game.save()
-
-                # Crée le prochain match si nécessaire
-                tournament = self.active_match.tournament
-                if self.active_match.round_number == math.ceil(math.log2(tournament.players.count())):
-                    # C'était la finale
-                    tournament.status = 'completed'
-                 #   tournament.winner = winner
-                    tournament.ended_at = timezone.now()
-                    tournament.save()
-                else:
-                    # Vérifie si l'autre match de la paire est terminé
-                    next_match_number = (self.active_match.match_number + 1) // 2
-                    logger.info(f"[DISCONNECT] Calculated next match number: {next_match_number}")
-
-                    # Find the paired match in the current round
-                    # For match 1, the pair is match 2; for match 3, the pair is match 4, etc.
-                    pair_match_number = self.active_match.match_number + 1 if self.active_match.match_number % 2 == 1 else self.active_match.match_number - 1
-                    logger.info(f"[DISCONNECT] Paired match number: {pair_match_number}")
-
-                    logger.info(f"[DISCONNECT] Querying matches in round {self.active_match.round_number} with numbers {self.active_match.match_number} and {pair_match_number}")
-                    current_round_matches = TournamentMatch.objects.filter(
-                        tournament=tournament,
-                        round_number=self.active_match.round_number,
-                        match_number__in=[
-                            self.active_match.match_number,
-                            pair_match_number
-                        ]
-                    )
-                    logger.info(f"[DISCONNECT] Found {current_round_matches.count()} matches in current round")
-                    for m in current_round_matches:
-                        logger.info(f"[DISCONNECT] Match {m.id}: round {m.round_number}, number {m.match_number}, status {m.status}")
-
-                    all_completed = all(m.status == 'completed' for m in current_round_matches)
-                    logger.info(f"[DISCONNECT] All matches in current round completed? {all_completed}")
-                    
-                    # Check if there's a paired match in the current round that should be started
-                    # When a player disconnects, we should start the other match in the same round if it exists
-                    logger.info(f"[DISCONNECT] Looking for paired match in round {self.active_match.round_number} with number {pair_match_number}")
-                    try:
-                        paired_match = TournamentMatch.objects.get(
-                            tournament=tournament,
-                            round_number=self.active_match.round_number,
-                            match_number=pair_match_number
-                        )
-                        logger.info(f"[DISCONNECT] Found paired match {paired_match.id} with status {paired_match.status}")
-                        
-                        # Only proceed if the paired match is pending
-                        if paired_match.status == 'pending':
-                            # This is the match we should set to in_progress
-                            next_match = paired_match
-                        else:
-                            # If the paired match is not pending, check if all matches in the current round are completed
-                            logger.info(f"[DISCONNECT] Paired match is not pending, checking if all matches in the round are completed")
-                            if all_completed:
-                                # Only check the next round match if all matches in the current round are completed
-                                logger.info(f"[DISCONNECT] All matches in current round are completed, checking next round match")
-                                try:
-                                    next_match = TournamentMatch.objects.get(
-                                        tournament=tournament,
-                                        round_number=self.active_match.round_number + 1,
-                                        match_number=next_match_number
-                                    )
-                                    logger.info(f"[DISCONNECT] Found next round match {next_match.id} with status {next_match.status}")
-                                except TournamentMatch.DoesNotExist:
-                                    logger.error(f"[DISCONNECT] Next match not found in round {self.active_match.round_number + 1} with number {next_match_number}")
-                                    return {  # Return early if next match doesn't exist
-                                        'match_id': self.active_match.id,
-                                        'winner_id': winner.id,
-                                        'tournament_id': tournament.id,
-                                        'status': tournament.status
-                                    }
-                            else:
-                                # If not all matches are completed, just return the result without creating a next match
-                                logger.info(f"[DISCONNECT] Not all matches in current round are completed, not creating next match")
-                                return {
-                                    'match_id': self.active_match.id,
-                                    'winner_id': winner.id,
-                                    'tournament_id': tournament.id,
-                                    'status': tournament.status
-                                }
-                    except TournamentMatch.DoesNotExist:
-                        # If there's no paired match, check if all matches in the current round are completed
-                        logger.info(f"[DISCONNECT] No paired match found, checking if all matches in the round are completed")
-                        if all_completed:
-                            # Only check the next round match if all matches in the current round are completed
-                            logger.info(f"[DISCONNECT] All matches in current round are completed, checking next round match")
-                            try:
-                                next_match = TournamentMatch.objects.get(
-                                    tournament=tournament,
-                                    round_number=self.active_match.round_number + 1,
-                                    match_number=next_match_number
-                                )
-                                logger.info(f"[DISCONNECT] Found next round match {next_match.id} with status {next_match.status}")
-                            except TournamentMatch.DoesNotExist:
-                                logger.error(f"[DISCONNECT] Next match not found in round {self.active_match.round_number + 1} with number {next_match_number}")
-                                return {  # Return early if next match doesn't exist
-                                    'match_id': self.active_match.id,
-                                    'winner_id': winner.id,
-                                    'tournament_id': tournament.id,
-                                    'status': tournament.status
-                                }
-                        else:
-                            # If not all matches are completed, just return the result without creating a next match
-                            logger.info(f"[DISCONNECT] Not all matches in current round are completed, not creating next match")
-                            return {
-                                'match_id': self.active_match.id,
-                                'winner_id': winner.id,
-                                'tournament_id': tournament.id,
-                                'status': tournament.status
-                            }
-
-                    # Only update players if this is a next round match, not a paired match in the same round
-                    if next_match.round_number > self.active_match.round_number:
-                        logger.info(f"[DISCONNECT] This is a next round match, updating players")
-                        if all_completed:
-                            winners = [m.winner for m in current_round_matches]
-                            next_match.player1 = winners[0]
-                            next_match.player2 = winners[1] if len(winners) > 1 else None
-                            logger.info(f"[DISCONNECT] Setting next match players to {winners[0].username} and {winners[1].username if len(winners) > 1 and winners[1] else None}")
-                        else:
-                            # Just set the current winner as player1 for now
-                            next_match.player1 = winner
-                            logger.info(f"[DISCONNECT] Setting next match player1 to {winner.username}")
-                    else:
-                        logger.info(f"[DISCONNECT] This is a paired match in the same round, not updating players")
-                        
-                    # Create a game for this match
-                    from game.models import Game
-                    if next_match.round_number > self.active_match.round_number:
-                        # This is a next round match
-                        if all_completed:
-                            winners = [m.winner for m in current_round_matches]
-                            game = Game.objects.create(
-                                player1=winners[0],
-                                player2=winners[1] if len(winners) > 1 else None,
-                                status='waiting'
-                            )
-                        else:
-                            # If not all matches are completed, just create a game with the current winner
-                            game = Game.objects.create(
-                                player1=winner,
-                                player2=None,  # Will be set when the other match completes
-                                status='waiting'
-                            )
-                    else:
-                        # This is a paired match in the same round, use the existing players
-                        game = Game.objects.create(
-                            player1=next_match.player1,
-                            player2=next_match.player2,
-                            status='waiting'
-                        )
-                        logger.info(f"[DISCONNECT] Created game for paired match with players {next_match.player1.username} and {next_match.player2.username if next_match.player2 else None}")
-
-                    # Link the game to the match
-                    next_match.game = game
-                    next_match.status = 'in_progress'
-                    next_match.started_at = timezone.now()
-                    next_match.save()
-
-                    # Initialize game state in memory
-                    from game.game_state_manager import GameStateManager
-                    if next_match.round_number > self.active_match.round_number:
-                        # This is a next round match
-                        if all_completed:
-                            winners = [m.winner for m in current_round_matches]
-                            GameStateManager.create_game(str(game.id), str(winners[0].id), winners[0].username)
-                            if len(winners) > 1 and winners[1]:
-                                GameStateManager.join_game(str(game.id), str(winners[1].id), winners[1].username)
-                        else:
-                            # Just initialize with the current winner
-                            GameStateManager.create_game(str(game.id), str(winner.id), winner.username)
-                    else:
-                        # This is a paired match in the same round, use the existing players
-                        GameStateManager.create_game(str(game.id), str(next_match.player1.id), next_match.player1.username)
-                        if next_match.player2:
-                            GameStateManager.join_game(str(game.id), str(next_match.player2.id), next_match.player2.username)
-
-                    # Notify players through WebSocket that their tournament match is ready
-                    from channels.layers import get_channel_layer
-                    from asgiref.sync import async_to_sync
-                    channel_layer = get_channel_layer()
-                    tournament_group = f'tournament_{tournament.id}'
-                    game_group = f'game_{game.id}'
-
-                    # Send tournament match ready notification
-                    if next_match.round_number > self.active_match.round_number:
-                        # This is a next round match
-                        if all_completed:
-                            winners = [m.winner for m in current_round_matches]
-                            async_to_sync(channel_layer.group_send)(
-                                tournament_group,
-                                {
-                                    'type': 'match_ready',
-                                    'match_id': next_match.id,
-                                    'game_id': game.id,
-                                    'player1_id': winners[0].id,
-                                    'player2_id': winners[1].id if len(winners) > 1 and winners[1] else None
-                                }
-                            )
-                        else:
-                            async_to_sync(channel_layer.group_send)(
-                                tournament_group,
-                                {
-                                    'type': 'match_ready',
-                                    'match_id': next_match.id,
-                                    'game_id': game.id,
-                                    'player1_id': winner.id,
-                                    'player2_id': None
-                                }
-                            )
-                    else:
-                        # This is a paired match in the same round, use the existing players
-                        async_to_sync(channel_layer.group_send)(
-                            tournament_group,
-                            {
-                                'type': 'match_ready',
-                                'match_id': next_match.id,
-                                'game_id': game.id,
-                                'player1_id': next_match.player1.id,
-                                'player2_id': next_match.player2.id if next_match.player2 else None
-                            }
-                        )
+                result = advance(self.active_match, winner)
+                if result is None:
+                    return None
+                self.active_match = result['match']
 
                 return {
                     'match_id': self.active_match.id,
                     'winner_id': winner.id,
-                    'tournament_id': tournament.id,
-                    'status': tournament.status
+                    'winner_username': winner.username,
+                    'tournament_id': self.active_match.tournament_id,
+                    'status': 'completed' if result['tournament_completed'] else 'in_progress'
                 }
         except Exception as e:
             logger.error(f"Error handling player disconnect: {str(e)}", exc_info=True)
@@ -342,7 +108,7 @@ class TournamentConsumer(AsyncWebsocketConsumer):
                                 'type': 'tournament_update',
                                 'status': 'completed',
                                 'winner_id': result['winner_id'],
-                                'message': f"Tournament completed! Winner: {self.active_match.winner.username}"
+                                'message': f"Tournament completed! Winner: {result['winner_username']}"
                             }
                         )
 
@@ -365,16 +131,15 @@ class TournamentConsumer(AsyncWebsocketConsumer):
             'player2_id': event['player2_id']
         }))
 
-    async def match_ready_notification(self, event):
+    async def matches_ready(self, event):
+        # Every match launched at once by scheduler.launch_ready_matches
         await self.send(text_data=json.dumps({
-            'type': 'match_ready_notification',
-            'match_id': event['match_id'],
-            'match_number': event['match_number'],
-            'round_size': event['round_size'],
-            'players': event['players']
+            'type': 'matches_ready',
+            'matches': event['matches']
         }))
 
 
+
     async def match_update(self, event):
         # Send match update to client
         await self.send(text_data=json.dumps({
@@ -483,201 +248,12 @@ class TournamentConsumer(AsyncWebsocketConsumer):
 
     @database_sync_to_async
     def update_match_with_winner(self, match, winner):
-        """Update match with winner"""
-        from django.utils import timezone
-
+        """Update match with winner, None if the result was already recorded"""
         try:
-            # Set match winner
-            match.winner = winner
-            match.status = 'completed'
-            match.ended_at = timezone.now()
-            match.save()
-
-            # Update tournament player status
-            tournament = match.tournament
-            loser = match.player2 if winner == match.player1 else match.player1
-
-            # Update the loser's alive status to False
-            from tournament.models import TournamentPlayer
-            TournamentPlayer.objects.filter(
-                tournament=tournament,
-                player=loser
-            ).update(alive=False)
-
-            # Update the game status
-            if match.game:
-                match.game.status = 'finished'
-                match.game.winner = winner
-                match.game.save()
-
-            # Check if there's only one player alive
-            alive_players = TournamentPlayer.objects.filter(
-                tournament=tournament,
-                alive=True
-            ).count()
-
-            # If only one player is alive or this was the final match, complete the tournament
-            import math
-            if alive_players == 1 or match.round_number == math.ceil(math.log2(tournament.players.count())):
-                tournament.status = 'completed'
-                tournament.winner = winner
-                tournament.ended_at = timezone.now()
-                tournament.save()
-                return True
-
-            # Create next round match if needed
-            next_match_number = (match.match_number + 1) // 2
-
-            # Find the paired match in the current round
-            # For match 1, the pair is match 2; for match 3, the pair is match 4, etc.
-            pair_match_number = match.match_number + 1 if match.match_number % 2 == 1 else match.match_number - 1
-
-            current_round_matches = TournamentMatch.objects.filter(
-                tournament=tournament,
-                round_number=match.round_number,
-                match_number__in=[match.match_number, pair_match_number]
-            )
-
-            # First, check if there are any pending matches in the current round that need a game created for them
-            next_pending_match = TournamentMatch.objects.filter(
-                tournament=tournament,
-                round_number=match.round_number,
-                status='pending',
-                game__isnull=True
-            ).order_by('match_number').first()
-
-            if next_pending_match:
-                # Create a game for the next pending match in the current round
-                from game.models import Game
-                game = Game.objects.create(
-                    player1=next_pending_match.player1,
-                    player2=next_pending_match.player2,
-                    status='waiting'
-                )
-
-                # Link the game to the match
-                next_pending_match.game = game
-                next_pending_match.status = 'in_progress'
-                next_pending_match.started_at = timezone.now()
-                next_pending_match.save()
-
-                # Initialize game state in memory
-                from game.game_state_manager import GameStateManager
-                GameStateManager.create_game(str(game.id), str(next_pending_match.player1.id), next_pending_match.player1.username)
-                if next_pending_match.player2:
-                    GameStateManager.join_game(str(game.id), str(next_pending_match.player2.id), next_pending_match.player2.username)
-
-                # Notify players through WebSocket that their tournament match is ready
-                from channels.layers import get_channel_layer
-                from asgiref.sync import async_to_sync
-                channel_layer = get_channel_layer()
-                tournament_group = f'tournament_{tournament.id}'
-                game_group = f'game_{game.id}'
-
-                # Send tournament match ready notification
-                async_to_sync(channel_layer.group_send)(
-                    tournament_group,
-                    {
-                        'type': 'match_ready',
-                        'match_id': next_pending_match.id,
-                        'game_id': game.id,
-                        'player1_id': next_pending_match.player1.id,
-                        'player2_id': next_pending_match.player2.id if next_pending_match.player2 else None
-                    }
-                )
-
-                # Send game start notification through game WebSocket
-                async_to_sync(channel_layer.group_send)(
-                    game_group,
-                    {
-                        'type': 'game_start',
-                        'game_id': game.id,
-                        'player1_id': next_pending_match.player1.id,
-                        'player2_id': next_pending_match.player2.id if next_pending_match.player2 else None,
-                        'tournament_match_id': next_pending_match.id
-                    }
-                )
-            elif all(m.status == 'completed' for m in current_round_matches):
-                # All matches in the current round are completed, update the next round match
-                winners = [m.winner for m in current_round_matches]
-
-                # Find the existing match in the next round
-                try:
-                    next_match = TournamentMatch.objects.get(
-                        tournament=tournament,
-                        round_number=match.round_number + 1,
-                        match_number=next_match_number
-                    )
-
-                    # Update the match with the winners
-                    next_match.player1 = winners[0]
-                    next_match.player2 = winners[1] if len(winners) > 1 else None
-                    next_match.save()
-
-                    # Check if this is the first match of the next round
-                    is_first_match_of_round = next_match.match_number == 1
-
-                    # If this is the first match of the next round, create a game for it
-                    if is_first_match_of_round:
-                        # Create a game for this match
-                        from game.models import Game
-                        game = Game.objects.create(
-                            player1=winners[0],
-                            player2=winners[1] if len(winners) > 1 else None,
-                            status='waiting'
-                        )
-
-                        # Link the game to the match
-                        next_match.game = game
-                        next_match.status = 'in_progress'
-                        next_match.started_at = timezone.now()
-                        next_match.save()
-
-                        # Initialize game state in memory
-                        from game.game_state_manager import GameStateManager
-                        GameStateManager.create_game(str(game.id), str(winners[0].id), winners[0].username)
-                        if len(winners) > 1 and winners[1]:
-                            GameStateManager.join_game(str(game.id), str(winners[1].id), winners[1].username)
-
-                        # Notify players through WebSocket that their tournament match is ready
-                        from channels.layers import get_channel_layer
-                        from asgiref.sync import async_to_sync
-                        channel_layer = get_channel_layer()
-                        tournament_group = f'tournament_{tournament.id}'
-                        game_group = f'game_{game.id}'
-
-                        # Send tournament match ready notification
-                        async_to_sync(channel_layer.group_send)(
-                            tournament_group,
-                            {
-                                'type': 'match_ready',
-                                'match_id': next_match.id,
-                                'game_id': game.id,
-                                'player1_id': winners[0].id,
-                                'player2_id': winners[1].id if len(winners) > 1 and winners[1] else None
-                            }
-                        )
-
-                        # Send game start notification through game WebSocket
-                        async_to_sync(channel_layer.group_send)(
-                            game_group,
-                            {
-                                'type': 'game_start',
-                                'game_id': game.id,
-                                'player1_id': winners[0].id,
-                                'player2_id': winners[1].id if len(winners) > 1 and winners[1] else None,
-                                'tournament_match_id': next_match.id
-                            }
-                        )
-                except TournamentMatch.DoesNotExist:
-                    # If the match doesn't exist, log an error
-                    logger.error(f"Next round match not found: round {match.round_number + 1}, match number {next_match_number}")
-
-            return False
-
+            return advance(match, winner)
         except Exception as e:
             logger.error(f"Error updating match with winner: {str(e)}", exc_info=True)
-            return False
+            return None
 
     async def handle_game_end(self, content):
         """Handle game end notification"""
@@ -714,8 +290,10 @@ class TournamentConsumer(AsyncWebsocketConsumer):
                 logger.error(f"No user found with ID {winner_id}")
                 return
 
-            # Update match with winner
-            tournament_completed = await self.update_match_with_winner(match, winner)
+            # Update match with winner; every consumer of the group gets the game end, the first one records it
+            result = await self.update_match_with_winner(match, winner)
+            if result is None:
+                return
 
             # Get winner's display name
             from tournament.models import TournamentPlayer
@@ -730,7 +308,7 @@ class TournamentConsumer(AsyncWebsocketConsumer):
                     'type': 'match_update',
                     'match_id': match.id,
                     'match_number': match.match_number,
-                    'round_size': 2 ** (match.round_number - 1),
+                    'round_size': result['round_size'],
                     'winner': {
                         'id': winner.id,
                         'display_name': winner_display_name
@@ -741,7 +319,7 @@ class TournamentConsumer(AsyncWebsocketConsumer):
             )
 
             # If tournament completed, send additional message
-            if tournament_completed:
+            if result['tournament_completed']:
                 await self.channel_layer.group_send(
                     self.tournament_group_name,
                     {
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.19 on 2026-10-18 05:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+PLACEHOLDER_USER_ID = 0
+
+
+def clear_placeholder_players(apps, schema_editor):
+    """Empty the slots that held the placeholder user and remove it"""
+    TournamentMatch = apps.get_model('tournament', 'TournamentMatch')
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    TournamentMatch.objects.filter(player1_id=PLACEHOLDER_USER_ID).update(player1=None)
+    TournamentMatch.objects.filter(player2_id=PLACEHOLDER_USER_ID).update(player2=None)
+    User.objects.filter(id=PLACEHOLDER_USER_ID, username='placeholder').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournament', '0006_recreate_tournament_players'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='tournamentmatch',
+            name='player1',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tournament_matches_1', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='tournamentmatch',
+            name='player2',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='tournament_matches_2', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(clear_placeholder_players, migrations.RunPython.noop),
+    ]
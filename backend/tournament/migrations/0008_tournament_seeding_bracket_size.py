@@ -0,0 +1,47 @@
+# Generated by Django 4.2.19 on 2026-10-18 05:50
+
+import django.core.validators
+from django.db import migrations, models
+
+
+def set_bracket_sizes(apps, schema_editor):
+    """Round metadata of the tournaments already started, from their deepest round"""
+    Tournament = apps.get_model('tournament', 'Tournament')
+    tournaments = list(
+        Tournament.objects.annotate(last_round=models.Max('matches__round_number')).filter(last_round__isnull=False)
+    )
+    for tournament in tournaments:
+        tournament.num_rounds = tournament.last_round
+        tournament.bracket_size = 2 ** tournament.last_round
+    Tournament.objects.bulk_update(tournaments, ['num_rounds', 'bracket_size'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournament', '0007_tournamentmatch_nullable_players'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tournament',
+            name='bracket_size',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='tournament',
+            name='num_rounds',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='tournament',
+            name='seeding',
+            field=models.CharField(choices=[('join_order', 'Join Order'), ('rating', 'Rating')], default='join_order', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='tournament',
+            name='max_players',
+            field=models.IntegerField(default=8, validators=[django.core.validators.MinValueValidator(2), django.core.validators.MaxValueValidator(1024)]),
+        ),
+        migrations.RunPython(set_bracket_sizes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 4.2.19 on 2026-10-18 05:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def count_results(apps, schema_editor):
+    """Standings of the tournaments played so far, from their completed matches"""
+    TournamentMatch = apps.get_model('tournament', 'TournamentMatch')
+    TournamentPlayer = apps.get_model('tournament', 'TournamentPlayer')
+    completed = TournamentMatch.objects.filter(status='completed', winner__isnull=False)
+    totals = {}  # (tournament_id, player_id) -> [wins, losses, byes]
+    for tournament_id, player1_id, player2_id, winner_id in completed.values_list(
+            'tournament_id', 'player1_id', 'player2_id', 'winner_id').iterator():
+        totals.setdefault((tournament_id, winner_id), [0, 0, 0])[0] += 1
+        if player1_id is None or player2_id is None:
+            totals[(tournament_id, winner_id)][2] += 1
+        else:
+            loser_id = player2_id if winner_id == player1_id else player1_id
+            totals.setdefault((tournament_id, loser_id), [0, 0, 0])[1] += 1
+    if not totals:
+        return
+    entries = []
+    for entry in TournamentPlayer.objects.filter(tournament_id__in={key[0] for key in totals}).iterator():
+        counts = totals.get((entry.tournament_id, entry.player_id))
+        if counts:
+            entry.wins, entry.losses, entry.byes = counts
+            entries.append(entry)
+    TournamentPlayer.objects.bulk_update(entries, ['wins', 'losses', 'byes'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tournament', '0008_tournament_seeding_bracket_size'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tournament',
+            name='format',
+            field=models.CharField(choices=[('single_elimination', 'Single Elimination'), ('swiss', 'Swiss'), ('round_robin', 'Round Robin')], default='single_elimination', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='tournamentplayer',
+            name='byes',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tournamentplayer',
+            name='losses',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tournamentplayer',
+            name='wins',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='tournamentplayer',
+            index=models.Index(fields=['tournament', '-wins', 'losses'], name='tournament_standings_idx'),
+        ),
+        migrations.RunPython(count_results, migrations.RunPython.noop),
+    ]
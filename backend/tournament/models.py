@@ -1,3 +1,4 @@
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from django.utils import timezone
 from users.models import User
@@ -10,6 +11,16 @@ class Tournament(models.Model):
         ('completed', 'Completed'),
         ('cancelled', 'Cancelled'),
     ]
+    FORMAT_CHOICES = [
+        ('single_elimination', 'Single Elimination'),
+        ('swiss', 'Swiss'),
+        ('round_robin', 'Round Robin'),
+    ]
+    SEEDING_CHOICES = [
+        ('join_order', 'Join Order'),
+        ('rating', 'Rating'),
+    ]
+    MAX_PLAYERS = 1024
 
     name = models.CharField(max_length=100)
     creator = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_tournaments')
@@ -19,7 +30,13 @@ class Tournament(models.Model):
     started_at = models.DateTimeField(null=True, blank=True)
     ended_at = models.DateTimeField(null=True, blank=True)
     winner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='tournament_wins')
-    max_players = models.IntegerField(default=8)  # Power of 2 for bracket system
+    # Any count up to MAX_PLAYERS, the bracket is completed with byes
+    max_players = models.IntegerField(default=8, validators=[MinValueValidator(2), MaxValueValidator(MAX_PLAYERS)])
+    format = models.CharField(max_length=20, choices=FORMAT_CHOICES, default='single_elimination')
+    seeding = models.CharField(max_length=20, choices=SEEDING_CHOICES, default='join_order')
+    # Set when the tournament starts: power of 2 holding every player, and number of rounds to play
+    bracket_size = models.IntegerField(null=True, blank=True)
+    num_rounds = models.IntegerField(null=True, blank=True)
 
     def __str__(self):
         return f"{self.name} ({self.get_status_display()})"
@@ -30,12 +47,19 @@ class TournamentPlayer(models.Model):
     display_name = models.CharField(max_length=50)
     joined_at = models.DateTimeField(default=timezone.now)
     alive = models.BooleanField(default=True)  # True if player is still in tournament, False if eliminated
+    # Standings, updated with each result (byes count as wins)
+    wins = models.IntegerField(default=0)
+    losses = models.IntegerField(default=0)
+    byes = models.IntegerField(default=0)
 
     class Meta:
         unique_together = [
             ('tournament', 'player'),  # Un joueur ne peut être qu'une fois dans un tournoi
             ('tournament', 'display_name'),  # Le display_name doit être unique dans le tournoi
         ]
+        indexes = [
+            models.Index(fields=['tournament', '-wins', 'losses'], name='tournament_standings_idx'),
+        ]
 
     def __str__(self):
         return f"{self.display_name} in {self.tournament.name}"
@@ -50,8 +74,9 @@ class TournamentMatch(models.Model):
     
     tournament = models.ForeignKey(Tournament, on_delete=models.CASCADE, related_name='matches')
     game = models.OneToOneField(Game, on_delete=models.SET_NULL, null=True, blank=True)
-    player1 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tournament_matches_1')
-    player2 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tournament_matches_2')
+    # Empty until the winner of the previous match is known
+    player1 = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='tournament_matches_1')
+    player2 = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, related_name='tournament_matches_2')
     winner = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='tournament_match_wins')
     round_number = models.IntegerField()  # 1 = first round, 2 = quarter-finals, 3 = semi-finals, 4 = finals
     match_number = models.IntegerField()  # Position in the round
@@ -67,4 +92,6 @@ class TournamentMatch(models.Model):
         ordering = ['round_number', 'match_number']
 
     def __str__(self):
-        return f"Match {self.match_number} (Round {self.round_number}): {self.player1.username} vs {self.player2.username}"
+        player1 = self.player1.username if self.player1_id else 'TBD'
+        player2 = self.player2.username if self.player2_id else 'TBD'
+        return f"Match {self.match_number} (Round {self.round_number}): {player1} vs {player2}"
@@ -0,0 +1,170 @@
+import logging
+import math
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from django.db.models import F
+from django.utils import timezone
+from .models import TournamentMatch, TournamentPlayer
+
+logger = logging.getLogger('tournament')
+
+# Formats played in rounds paired as the tournament goes, instead of a bracket
+ROUND_FORMATS = ('swiss', 'round_robin')
+
+# Search steps spent avoiding rematches before a Swiss round is paired in ranking order
+SWISS_SEARCH_BUDGET = 20000
+
+# (player1_id, player2_id), player2_id is None for a bye
+Pair = Tuple[int, Optional[int]]
+
+
+def format_rounds(tournament_format: str, num_players: int) -> int:
+    """Rounds of a Swiss or round robin tournament of `num_players`"""
+    if tournament_format == 'round_robin':
+        return num_players - 1 if num_players % 2 == 0 else num_players
+    return max(1, math.ceil(math.log2(num_players)))
+
+
+def round_robin_pairs(player_ids: Sequence[int], round_number: int) -> List[Pair]:
+    """Pairs of a round of a round robin, by the circle method.
+
+    The first player stays in place and the others turn by one position
+    each round, so that over format_rounds rounds everyone meets everyone
+    once. With an odd count, the player facing the empty seat has a bye.
+    """
+    players = list(player_ids) + ([None] if len(player_ids) % 2 else [])
+    size = len(players)
+    shift = (round_number - 1) % (size - 1)
+    others = players[1:]
+    circle = [players[0]] + (others[-shift:] + others[:-shift] if shift else others)
+    pairs = []
+    for i in range(size // 2):
+        player1, player2 = circle[i], circle[size - 1 - i]
+        pairs.append((player2, None) if player1 is None else (player1, player2))
+    return pairs
+
+
+def swiss_pairs(ranking: Sequence[int], scores: Dict[int, int], played: Set[frozenset],
+                had_bye: Set[int] = frozenset()) -> List[Pair]:
+    """Pairs of the next round of a Swiss tournament.
+
+    `ranking` lists the players best first. With an odd count, the lowest
+    ranked player without a bye so far gets it. The others are paired within
+    their score group, top half against bottom half (1 against 5, 2 against
+    6... in a group of 8), the odd one out of a group meeting the next
+    group, and never against an opponent from `played`. A depth-first search
+    moves to the next candidate when a choice leaves the rest of the round
+    without a valid pairing; it seldom has to, so a 256 player round takes a
+    few milliseconds. If rematches cannot be avoided within
+    SWISS_SEARCH_BUDGET steps, the round is paired in ranking order.
+    """
+    players = list(ranking)
+    bye = []
+    if len(players) % 2:
+        bye_player = next((player for player in reversed(players) if player not in had_bye), players[-1])
+        players.remove(bye_player)
+        bye = [(bye_player, None)]
+    budget = [SWISS_SEARCH_BUDGET]
+
+    def candidates(pool):
+        # Opponents for pool[0] by preference: the bottom half of its score group, its top half, then the groups below
+        score = scores.get(pool[0], 0)
+        group_end = 1
+        while group_end < len(pool) and scores.get(pool[group_end], 0) == score:
+            group_end += 1
+        group = pool[1:group_end]
+        middle = max((len(group) + 1) // 2 - 1, 0)
+        return group[middle:] + group[:middle][::-1] + pool[group_end:]
+
+    def search(pool):
+        if not pool:
+            return []
+        for opponent in candidates(pool):
+            budget[0] -= 1
+            if budget[0] < 0:
+                return None
+            if frozenset((pool[0], opponent)) in played:
+                continue
+            rest = search([player for player in pool[1:] if player != opponent])
+            if rest is not None:
+                return [(pool[0], opponent)] + rest
+        return None
+
+    pairs = search(players)
+    if pairs is None:
+        logger.warning(f"No Swiss pairing without rematch found for {len(players)} players, pairing in ranking order")
+        pairs = [(players[i], players[i + 1]) for i in range(0, len(players), 2)]
+    return pairs + bye
+
+
+def next_round_pairs(tournament, round_number: int, entries: Optional[List[TournamentPlayer]] = None) -> List[Pair]:
+    """Pairs of round `round_number` of a Swiss or round robin tournament.
+
+    `entries` are the tournament's players by seed (bracket.seeded_players),
+    loaded when not given. Round robin rounds follow the schedule of all
+    the players in join order, a withdrawn player's opponent getting a bye;
+    Swiss rounds pair the players still in, ranked by their standings then
+    their seed, against players they have not met.
+    """
+    if entries is None:
+        from .bracket import seeded_players
+        entries = seeded_players(tournament)
+
+    if tournament.format == 'round_robin':
+        schedule = sorted(entries, key=lambda entry: (entry.joined_at, entry.id))
+        withdrawn = {entry.player_id for entry in entries if not entry.alive}
+        pairs = []
+        for player1, player2 in round_robin_pairs([entry.player_id for entry in schedule], round_number):
+            if player1 in withdrawn:
+                player1, player2 = player2, None
+            elif player2 in withdrawn:
+                player2 = None
+            if player1 is not None and player1 not in withdrawn:
+                pairs.append((player1, player2))
+        return pairs
+
+    ranking = sorted((entry for entry in entries if entry.alive), key=lambda entry: (-entry.wins, entry.losses))
+    played = {
+        frozenset(pair) for pair in TournamentMatch.objects.filter(
+            tournament=tournament, player1__isnull=False, player2__isnull=False
+        ).values_list('player1_id', 'player2_id')
+    } if round_number > 1 else set()
+    return swiss_pairs(
+        [entry.player_id for entry in ranking],
+        {entry.player_id: entry.wins for entry in ranking},
+        played,
+        {entry.player_id for entry in ranking if entry.byes}
+    )
+
+
+def create_round(tournament, round_number: int, pairs: List[Pair]) -> List[TournamentMatch]:
+    """Create the matches of a round with one bulk INSERT.
+
+    A pair without a second player is a bye: the match is created
+    completed and counts as a win in its player's standings.
+    """
+    now = timezone.now()
+    matches = []
+    for i, (player1_id, player2_id) in enumerate(pairs):
+        match = TournamentMatch(tournament=tournament, player1_id=player1_id, player2_id=player2_id,
+                                round_number=round_number, match_number=i + 1, status='pending')
+        if player2_id is None:
+            match.winner_id = player1_id
+            match.status = 'completed'
+            match.started_at = match.ended_at = now
+        matches.append(match)
+    matches = TournamentMatch.objects.bulk_create(matches)
+
+    byes = [player1_id for player1_id, player2_id in pairs if player2_id is None]
+    if byes:
+        TournamentPlayer.objects.filter(tournament=tournament, player_id__in=byes).update(
+            wins=F('wins') + 1, byes=F('byes') + 1
+        )
+    logger.info(f"Tournament {tournament.id}: round {round_number} paired, {len(matches)} matches, {len(byes)} byes")
+    return matches
+
+
+def standings(tournament):
+    """TournamentPlayers of `tournament` from first to last: most wins, fewest losses, earliest to join"""
+    return (TournamentPlayer.objects.filter(tournament=tournament)
+            .select_related('player')
+            .order_by('-wins', 'losses', 'joined_at', 'id'))
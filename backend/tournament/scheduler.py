@@ -0,0 +1,109 @@
+import asyncio
+import logging
+from typing import List
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.utils import timezone
+from game.match_router import MatchRouter
+from game.models import Game
+from .models import TournamentMatch, TournamentPlayer
+
+logger = logging.getLogger('tournament')
+
+
+def launch_ready_matches(tournament) -> List[TournamentMatch]:
+    """Start every pending match of `tournament` whose two players are known.
+
+    Called when the tournament starts and after each result, so a match
+    starts as soon as both its players are decided instead of waiting for
+    the matches before it: all the matches of a round are played at the
+    same time. The games are created with one bulk INSERT, the matches
+    updated with one bulk UPDATE, and the tournament group gets a single
+    `matches_ready` message listing them. Returns the started matches.
+    """
+    with transaction.atomic():
+        matches = list(
+            TournamentMatch.objects.select_for_update(of=('self',))
+            .select_related('player1', 'player2')
+            .filter(tournament=tournament, status='pending', game__isnull=True,
+                    player1__isnull=False, player2__isnull=False)
+            .order_by('round_number', 'match_number')
+        )
+        if not matches:
+            return []
+
+        games = Game.objects.bulk_create([
+            Game(player1=match.player1, player2=match.player2, status='waiting',
+                 game_state=Game.default_game_state())
+            for match in matches
+        ])
+        now = timezone.now()
+        for match, game in zip(matches, games):
+            match.game = game
+            match.status = 'in_progress'
+            match.started_at = now
+        TournamentMatch.objects.bulk_update(matches, ['game', 'status', 'started_at'])
+        transaction.on_commit(lambda: _announce(tournament, matches))
+
+    logger.info(f"Tournament {tournament.id}: started {len(matches)} matches")
+    return matches
+
+
+async def _load_game(match: TournamentMatch):
+    state = await MatchRouter.call(match.game_id, 'create_game', str(match.player1.id), match.player1.username)
+    if state is None:
+        raise RuntimeError("the owner of its shard did not answer")
+    await MatchRouter.call(match.game_id, 'join_game', str(match.player2.id), match.player2.username)
+
+
+async def _load_games(matches: List[TournamentMatch]):
+    """Create the games of `matches` on the workers owning their shard, as the game consumers do.
+
+    The games are created concurrently; a game that could not be created is
+    logged and does not stop the others.
+    """
+    await MatchRouter.ensure_running()
+    results = await asyncio.gather(*(_load_game(match) for match in matches), return_exceptions=True)
+    for match, result in zip(matches, results):
+        if isinstance(result, Exception):
+            logger.error(f"Tournament match {match.id}: failed to create game {match.game_id}: {str(result)}")
+
+
+def _announce(tournament, matches: List[TournamentMatch]):
+    """Load the games in memory and tell the tournament group which matches can be played"""
+    # Runs after the commit: the matches are in progress whatever happens here, so they are always announced
+    try:
+        async_to_sync(_load_games)(matches)
+    except Exception as e:
+        logger.error(f"Tournament {tournament.id}: failed to load the games of {len(matches)} matches: {str(e)}")
+
+    display_names = dict(
+        TournamentPlayer.objects.filter(tournament=tournament).values_list('player_id', 'display_name')
+    )
+    # Swiss and round robin rounds are named by their number, brackets by their size
+    bracket = None
+    if tournament.format == 'single_elimination':
+        from .bracket import Bracket
+        bracket = Bracket.get(tournament)
+
+    def player(user):
+        return {'id': user.id, 'display_name': display_names.get(user.id, user.username)}
+
+    async_to_sync(get_channel_layer().group_send)(
+        f'tournament_{tournament.id}',
+        {
+            'type': 'matches_ready',
+            'matches': [
+                {
+                    'match_id': match.id,
+                    'game_id': match.game_id,
+                    'round_number': match.round_number,
+                    'match_number': match.match_number,
+                    'round_size': bracket.round_size(match.round_number) if bracket else None,
+                    'players': [player(match.player1), player(match.player2)],
+                }
+                for match in matches
+            ]
+        }
+    )
@@ -2,12 +2,40 @@ from rest_framework import serializers
 from .models import Tournament, TournamentMatch, TournamentPlayer
 from users.serializers import UserSerializer
 
+
+def display_names(context, tournament):
+    """{player_id: display_name} of a tournament, built once per serialization.
+
+    The map is kept in the serializer context, which nested serializers share,
+    and comes from the prefetched `display_names` when the queryset has them
+    (see TournamentViewSet.get_queryset), otherwise from one query.
+    """
+    cache = context.setdefault('display_names', {})
+    tournament_id = tournament.pk if isinstance(tournament, Tournament) else tournament
+    if tournament_id not in cache:
+        prefetched = getattr(tournament, '_prefetched_objects_cache', {}).get('display_names')
+        if prefetched is not None:
+            cache[tournament_id] = {tp.player_id: tp.display_name for tp in prefetched}
+        else:
+            cache[tournament_id] = dict(
+                TournamentPlayer.objects.filter(tournament_id=tournament_id).values_list('player_id', 'display_name')
+            )
+    return cache[tournament_id]
+
+
+def display_name(context, tournament, user):
+    """Display name of `user` in `tournament`, their username if they have none"""
+    if user is None:
+        return None
+    return display_names(context, tournament).get(user.id, user.username)
+
+
 class TournamentPlayerSerializer(serializers.ModelSerializer):
     player = UserSerializer()
     
     class Meta:
         model = TournamentPlayer
-        fields = ['id', 'player', 'display_name', 'joined_at']
+        fields = ['id', 'player', 'display_name', 'joined_at', 'alive', 'wins', 'losses', 'byes']
 
 class TournamentMatchSerializer(serializers.ModelSerializer):
     player1 = UserSerializer()
@@ -26,30 +54,19 @@ class TournamentMatchSerializer(serializers.ModelSerializer):
                  'winner_display_name']
         read_only_fields = ['tournament', 'game', 'next_match']
 
+    def display_name(self, obj, user):
+        # Matches prefetched with their tournament carry its prefetched display names
+        tournament = obj.tournament if TournamentMatch.tournament.is_cached(obj) else obj.tournament_id
+        return display_name(self.context, tournament, user)
+
     def get_player1_display_name(self, obj):
-        try:
-            tp = TournamentPlayer.objects.get(tournament=obj.tournament, player=obj.player1)
-            return tp.display_name
-        except TournamentPlayer.DoesNotExist:
-            return obj.player1.username
+        return self.display_name(obj, obj.player1)
 
     def get_player2_display_name(self, obj):
-        if not obj.player2:
-            return None
-        try:
-            tp = TournamentPlayer.objects.get(tournament=obj.tournament, player=obj.player2)
-            return tp.display_name
-        except TournamentPlayer.DoesNotExist:
-            return obj.player2.username
+        return self.display_name(obj, obj.player2)
 
     def get_winner_display_name(self, obj):
-        if not obj.winner:
-            return None
-        try:
-            tp = TournamentPlayer.objects.get(tournament=obj.tournament, player=obj.winner)
-            return tp.display_name
-        except TournamentPlayer.DoesNotExist:
-            return obj.winner.username
+        return self.display_name(obj, obj.winner)
 
 class TournamentSerializer(serializers.ModelSerializer):
     players = TournamentPlayerSerializer(source='display_names', many=True, read_only=True)
@@ -62,22 +79,12 @@ class TournamentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tournament
         fields = ['id', 'name', 'creator', 'players', 'status', 'created_at', 
-                 'started_at', 'ended_at', 'winner', 'max_players', 'matches',
-                 'creator_display_name', 'winner_display_name']
-        read_only_fields = ['creator', 'status', 'started_at', 'ended_at', 'winner']
+                 'started_at', 'ended_at', 'winner', 'max_players', 'format', 'seeding', 'bracket_size',
+                 'num_rounds', 'matches', 'creator_display_name', 'winner_display_name']
+        read_only_fields = ['creator', 'status', 'started_at', 'ended_at', 'winner', 'bracket_size', 'num_rounds']
 
     def get_creator_display_name(self, obj):
-        try:
-            tp = TournamentPlayer.objects.get(tournament=obj, player=obj.creator)
-            return tp.display_name
-        except TournamentPlayer.DoesNotExist:
-            return obj.creator.username
+        return display_name(self.context, obj, obj.creator)
 
     def get_winner_display_name(self, obj):
-        if not obj.winner:
-            return None
-        try:
-            tp = TournamentPlayer.objects.get(tournament=obj, player=obj.winner)
-            return tp.display_name
-        except TournamentPlayer.DoesNotExist:
-            return obj.winner.username
+        return display_name(self.context, obj, obj.winner)
@@ -7,12 +7,14 @@ from rest_framework.permissions import IsAuthenticated
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 from .models import Tournament, TournamentMatch, TournamentPlayer
-from .serializers import TournamentSerializer, TournamentMatchSerializer
-import math
+from .serializers import TournamentSerializer, TournamentMatchSerializer, TournamentPlayerSerializer
+from .bracket import advance, bracket_size, create_bracket, seeded_players
+from .pairing import ROUND_FORMATS, create_round, format_rounds, next_round_pairs, standings
+from .scheduler import launch_ready_matches
 from game.models import Game
-from game.game_state_manager import GameStateManager  # Import from the correct module
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Prefetch, Q
 import logging
 
 logger = logging.getLogger(__name__)
@@ -24,6 +26,16 @@ class TournamentViewSet(viewsets.ModelViewSet):
     serializer_class = TournamentSerializer
     permission_classes = [IsAuthenticated]
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ('list', 'retrieve', 'get_player_tournaments'):
+            # Everything TournamentSerializer reads, in a constant number of queries
+            queryset = queryset.select_related('creator', 'winner').prefetch_related(
+                Prefetch('display_names', queryset=TournamentPlayer.objects.select_related('player')),
+                Prefetch('matches', queryset=TournamentMatch.objects.select_related('player1', 'player2', 'winner')),
+            )
+        return queryset
+
     def perform_create(self, serializer):
         tournament = serializer.save(creator=self.request.user)
         display_name = self.request.data.get('display_name', self.request.user.username)
@@ -99,57 +111,6 @@ class TournamentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    def create_tournament_game(self, match):
-        """Create a game for a tournament match and notify players"""
-        # Create the game
-        game = Game.objects.create(
-            player1=match.player1,
-            player2=match.player2,
-            status='waiting'  # Set to waiting
-        )
-        
-        # Link the game to the match
-        match.game = game
-        match.status = 'in_progress'
-        match.started_at = timezone.now()
-        match.save()
-
-        # Initialize game state in memory
-        GameStateManager.create_game(str(game.id), str(match.player1.id), match.player1.username)
-        if match.player2:
-            GameStateManager.join_game(str(game.id), str(match.player2.id), match.player2.username)
-
-        # Notify players through WebSocket that their tournament match is ready
-        channel_layer = get_channel_layer()
-        tournament_group = f'tournament_{match.tournament.id}'
-        game_group = f'game_{game.id}'
-        
-        # Send tournament match ready notification
-        async_to_sync(channel_layer.group_send)(
-            tournament_group,
-            {
-                'type': 'match_ready',
-                'match_id': match.id,
-                'game_id': game.id,
-                'player1_id': match.player1.id,
-                'player2_id': match.player2.id if match.player2 else None
-            }
-        )
-        
-        # Send game start notification through game WebSocket
-        async_to_sync(channel_layer.group_send)(
-            game_group,
-            {
-                'type': 'game_start',
-                'game_id': game.id,
-                'player1_id': match.player1.id,
-                'player2_id': match.player2.id if match.player2 else None,
-                'tournament_match_id': match.id
-            }
-        )
-        
-        return game
-
     @action(detail=True, methods=['post'])
     def start(self, request, pk=None):
         tournament = self.get_object()
@@ -160,93 +121,53 @@ class TournamentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
             
-        if tournament.players.count() < 2:
-            return Response(
-                {'error': 'Not enough players to start tournament'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        with transaction.atomic():
+            entries = seeded_players(tournament)
+            if len(entries) < 2:
+                return Response(
+                    {'error': 'Not enough players to start tournament'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-        # Create tournament bracket
-        players = list(tournament.players.all())
-        num_players = len(players)
-        num_rounds = math.ceil(math.log2(num_players))
-        matches_data = []
-        
-        # Create all tournament matches upfront (without games)
-        # First, create all first round matches
-        first_round_matches = []
-        matches_in_round = num_players // 2
-        for i in range(matches_in_round):
-            match = TournamentMatch.objects.create(
-                tournament=tournament,
-                player1=players[i*2],
-                player2=players[i*2 + 1] if i*2 + 1 < num_players else None,
-                round_number=1,
-                match_number=i + 1,
-                status='pending'  # All matches start as pending
+            if tournament.format in ROUND_FORMATS:
+                size, num_rounds = None, format_rounds(tournament.format, len(entries))
+            else:
+                size = bracket_size(len(entries))
+                num_rounds = size.bit_length() - 1
+
+            # Marque le tournoi comme lancé, une seule fois même si deux requêtes arrivent ensemble
+            started = Tournament.objects.filter(id=tournament.id, status='pending').update(
+                status='in_progress', started_at=timezone.now(),
+                bracket_size=size, num_rounds=num_rounds
             )
-            first_round_matches.append(match)
-            
-            # Add match data for WebSocket
-            player1_data = TournamentPlayer.objects.get(tournament=tournament, player=players[i*2])
-            player2_data = TournamentPlayer.objects.get(tournament=tournament, player=players[i*2 + 1]) if i*2 + 1 < num_players else None
-            matches_data.append({
-                'match_number': i + 1,
-                'round_size': 2 ** (num_rounds - 1),  # Will be 8 for eighth-finals, 4 for quarters, etc.
-                'player1': {'id': players[i*2].id, 'display_name': player1_data.display_name},
-                'player2': {'id': players[i*2 + 1].id, 'display_name': player2_data.display_name} if player2_data else None
-            })
-        
-        # Create future round matches with placeholder user ID 0
-        # Get or create a placeholder user with ID 0
-        placeholder_user, created = User.objects.get_or_create(
-            id=0,
-            defaults={
-                'username': 'placeholder',
-                'email': 'placeholder@example.com'
-            }
-        )
-        
-        # Create future round matches with placeholder user
-        for round_num in range(2, num_rounds + 1):
-            matches_in_round = 2 ** (num_rounds - round_num)
-            for i in range(matches_in_round):
-                TournamentMatch.objects.create(
-                    tournament=tournament,
-                    player1=placeholder_user,  # Placeholder user
-                    player2=placeholder_user,  # Placeholder user
-                    round_number=round_num,
-                    match_number=i + 1,
-                    status='pending'
+            if not started:
+                return Response(
+                    {'error': 'Tournament has already started or is completed'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-        
-        # Only create a game for the first match of the first round
-        if first_round_matches:
-            first_match = first_round_matches[0]
-            self.create_tournament_game(first_match)
-            
-            # Send match ready notification for the first match
-            player1_data = TournamentPlayer.objects.get(tournament=tournament, player=first_match.player1)
-            player2_data = TournamentPlayer.objects.get(tournament=tournament, player=first_match.player2) if first_match.player2 else None
-            
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f'tournament_{tournament.id}',
-                {
-                    'type': 'match_ready_notification',
-                    'match_id': first_match.id,
-                    'match_number': 1,
-                    'round_size': 2 ** (num_rounds - 1),
-                    'players': [
-                        {'id': first_match.player1.id, 'display_name': player1_data.display_name},
-                        {'id': first_match.player2.id, 'display_name': player2_data.display_name} if player2_data else None
-                    ]
-                }
-            )
-            
-        tournament.status = 'in_progress'
-        tournament.started_at = timezone.now()
-        tournament.save()
+
+            if tournament.format in ROUND_FORMATS:
+                # Swiss et toutes rondes : seul le premier tour est apparié, les suivants au fil des résultats
+                matches = create_round(tournament, 1, next_round_pairs(tournament, 1, entries))
+            else:
+                # Create tournament bracket, seeds placed so that the best players meet last
+                matches = create_bracket(tournament, [entry.player for entry in entries], size)
+
+        display_names = {entry.player_id: entry.display_name for entry in entries}
+
+        def player_data(player_id):
+            return {'id': player_id, 'display_name': display_names.get(player_id)} if player_id else None
+
+        first_round = [match for match in matches if match.round_number == 1]
+        matches_data = [
+            {
+                'match_number': match.match_number,
+                'round_size': len(first_round),  # Will be 8 for eighth-finals, 4 for quarters, etc.
+                'player1': player_data(match.player1_id),
+                'player2': player_data(match.player2_id)
+            }
+            for match in first_round
+        ]
 
         # Send WebSocket message with matches info
         channel_layer = get_channel_layer()
@@ -257,19 +178,11 @@ class TournamentViewSet(viewsets.ModelViewSet):
                 'matches': matches_data
             }
         )
-        
-        return Response({'status': 'tournament started'})
 
-    def update_player_alive_status(self, tournament, match, winner):
-        """Update the alive status of players after a match"""
-        # Get the loser of the match
-        loser = match.player2 if winner == match.player1 else match.player1
+        # Every first round match starts right away
+        launch_ready_matches(tournament)
         
-        # Update the loser's alive status to False
-        TournamentPlayer.objects.filter(
-            tournament=tournament,
-            player=loser
-        ).update(alive=False)
+        return Response({'status': 'tournament started'})
 
     @action(detail=True, methods=['post'])
     def complete_match(self, request, pk=None):
@@ -285,21 +198,17 @@ class TournamentViewSet(viewsets.ModelViewSet):
                 {'error': 'Match is not in progress'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        self.update_player_alive_status(tournament, match, winner)
-        
-        match.winner = winner
-        match.status = 'completed'
-        match.ended_at = timezone.now()
-        match.save()
+
+        result = advance(match, winner)
+        if result is None:
+            return Response(
+                {'error': 'Match is not in progress'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         # Get winner's display name
         winner_display_name = TournamentPlayer.objects.get(tournament=tournament, player=winner).display_name
 
-        # Calculate round size (8 for eighth-finals, 4 for quarters, etc.)
-        num_rounds = math.ceil(math.log2(tournament.players.count()))
-        round_size = 2 ** (num_rounds - match.round_number)
-
         # Send WebSocket message about match completion
         channel_layer = get_channel_layer()
         async_to_sync(channel_layer.group_send)(
@@ -307,7 +216,7 @@ class TournamentViewSet(viewsets.ModelViewSet):
             {
                 'type': 'match_update',
                 'match_number': match.match_number,
-                'round_size': round_size,
+                'round_size': result['round_size'],
                 'winner': {
                     'id': winner.id,
                     'display_name': winner_display_name
@@ -315,117 +224,13 @@ class TournamentViewSet(viewsets.ModelViewSet):
             }
         )
 
-        # Update the game status
-        if match.game:
-            match.game.status = 'finished'
-            match.game.winner = winner
-            match.game.save()
-        
-        # Check if there's only one player alive
-        alive_players = TournamentPlayer.objects.filter(
-            tournament=tournament,
-            alive=True
-        ).count()
-
-        # If only one player is alive or this was the final match, complete the tournament
-        if alive_players == 1 or match.round_number == math.ceil(math.log2(tournament.players.count())):
-            tournament.status = 'completed'
-            tournament.winner = winner
-            tournament.ended_at = timezone.now()
-            tournament.save()
+        if result['tournament_completed']:
             return Response({
                 'status': 'tournament completed',
                 'winner': winner.username,
-                'alive_players': alive_players
+                'alive_players': TournamentPlayer.objects.filter(tournament=tournament, alive=True).count()
             })
-        
-        # If not final match, create the next round match if both matches are complete
-        next_match_number = (match.match_number + 1) // 2
-        
-        # Find the paired match in the current round
-        # For match 1, the pair is match 2; for match 3, the pair is match 4, etc.
-        pair_match_number = match.match_number + 1 if match.match_number % 2 == 1 else match.match_number - 1
-        
-        current_round_matches = TournamentMatch.objects.filter(
-            tournament=tournament,
-            round_number=match.round_number,
-            match_number__in=[match.match_number, pair_match_number]
-        )
-        
-        # First, check if there are any pending matches in the current round that need a game created for them
-        next_pending_match = TournamentMatch.objects.filter(
-            tournament=tournament,
-            round_number=match.round_number,
-            status='pending',
-            game__isnull=True
-        ).order_by('match_number').first()
-        
-        if next_pending_match:
-            # Create a game for the next pending match in the current round
-            self.create_tournament_game(next_pending_match)
-            
-            # Get display names for the players
-            player1_data = TournamentPlayer.objects.get(tournament=tournament, player=next_pending_match.player1)
-            player2_data = TournamentPlayer.objects.get(tournament=tournament, player=next_pending_match.player2) if next_pending_match.player2 else None
-            
-            # Send match ready notification for the next match
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f'tournament_{tournament.id}',
-                {
-                    'type': 'match_ready_notification',
-                    'match_id': next_pending_match.id,
-                    'match_number': next_pending_match.match_number,
-                    'round_size': 2 ** (num_rounds - next_pending_match.round_number),
-                    'players': [
-                        {'id': next_pending_match.player1.id, 'display_name': player1_data.display_name},
-                        {'id': next_pending_match.player2.id, 'display_name': player2_data.display_name} if player2_data else None
-                    ]
-                }
-            )
-        elif all(m.status == 'completed' for m in current_round_matches):
-            # All matches in the current round are completed, update the next round match
-            winners = [m.winner for m in current_round_matches]
-            
-            # Find the existing match in the next round
-            next_match = TournamentMatch.objects.get(
-                tournament=tournament,
-                round_number=match.round_number + 1,
-                match_number=next_match_number
-            )
-            
-            # Update the match with the winners
-            next_match.player1 = winners[0]
-            next_match.player2 = winners[1] if len(winners) > 1 else None
-            next_match.save()
-            
-            # Check if this is the first match of the next round
-            is_first_match_of_round = next_match.match_number == 1
-            
-            # If this is the first match of the next round, create a game for it
-            if is_first_match_of_round:
-                self.create_tournament_game(next_match)
-                
-                # Get display names for the players
-                player1_data = TournamentPlayer.objects.get(tournament=tournament, player=winners[0])
-                player2_data = TournamentPlayer.objects.get(tournament=tournament, player=winners[1]) if len(winners) > 1 else None
-                
-                # Send match ready notification for the next match
-                channel_layer = get_channel_layer()
-                async_to_sync(channel_layer.group_send)(
-                    f'tournament_{tournament.id}',
-                    {
-                        'type': 'match_ready_notification',
-                        'match_id': next_match.id,
-                        'match_number': next_match.match_number,
-                        'round_size': 2 ** (num_rounds - next_match.round_number),
-                        'players': [
-                            {'id': winners[0].id, 'display_name': player1_data.display_name},
-                            {'id': winners[1].id, 'display_name': player2_data.display_name} if player2_data else None
-                        ]
-                    }
-                )
-        
+
         return Response({'status': 'match completed'})
 
     @action(detail=True, methods=['post'])
@@ -449,9 +254,10 @@ class TournamentViewSet(viewsets.ModelViewSet):
             match.player2_ready = True
         match.save()
         
-        # Si les deux joueurs sont prêts, démarrer le match
-        if match.player1_ready and match.player2_ready:
-            self.create_tournament_game(match)
+        # Si les deux joueurs sont prêts, démarrer le match (s'il n'a pas déjà été lancé)
+        if match.player1_ready and match.player2_ready and match.game_id is None:
+            launch_ready_matches(tournament)
+            match.refresh_from_db(fields=['game', 'status', 'started_at'])
             
         # Notifier via WebSocket
         channel_layer = get_channel_layer()
@@ -573,24 +379,10 @@ class TournamentViewSet(viewsets.ModelViewSet):
                 # Déclarer l'autre joueur comme vainqueur
                 winner = match.player2 if request.user == match.player1 else match.player1
                 
-                # Instead of duplicating the disconnect logic, use the WebSocket consumer's disconnect handler
-                from tournament.consumers import TournamentConsumer
-                
-                # Create a temporary consumer instance to handle the forfeit
-                consumer = TournamentConsumer()
-                
-                # Set the necessary attributes
-                consumer.user = request.user
-                consumer.active_match = match
-                consumer.tournament_group_name = f'tournament_{tournament.id}'
-                
-                # Get the channel layer
+                result = advance(match, winner)
+                tournament.refresh_from_db()  # advance a peut terminer le tournoi
                 channel_layer = get_channel_layer()
-                consumer.channel_layer = channel_layer
-                
-                # Call the disconnect handler
-                result = async_to_sync(consumer.handle_player_disconnect)()
-                
+
                 # Notify all clients about the forfeit
                 if result:
                     # First, send a tournament update to refresh all clients
@@ -619,7 +411,7 @@ class TournamentViewSet(viewsets.ModelViewSet):
                         f'tournament_{tournament.id}',
                         {
                             'type': 'match_update',
-                            'match_id': result['match_id'],
+                            'match_id': result['match'].id,
                             'status': 'completed',
                             'winner_id': result['winner_id'],
                             'forfeit': True,
@@ -629,7 +421,6 @@ class TournamentViewSet(viewsets.ModelViewSet):
                     )
                 
                 # Check if the tournament is completed after the forfeit
-                tournament.refresh_from_db()  # Refresh to get the latest status
                 if tournament.status == 'completed':
                     return Response({
                         'status': 'tournament completed', 
@@ -637,8 +428,6 @@ class TournamentViewSet(viewsets.ModelViewSet):
                         'creator_changed': is_creator and tournament.status != 'cancelled'
                     })
                     
-                # The disconnect handler already takes care of all the tournament progression logic
-                
                 return Response({
                     'status': 'match forfeited',
                     'creator_changed': is_creator and tournament.status != 'cancelled'
@@ -649,6 +438,12 @@ class TournamentViewSet(viewsets.ModelViewSet):
         return Response({'status': 'tournament not started'})
 
 
+    @action(detail=True, methods=['get'])
+    def standings(self, request, pk=None):
+        """Classement du tournoi, mis à jour à chaque résultat plutôt que recalculé ici"""
+        tournament = self.get_object()
+        return Response(TournamentPlayerSerializer(standings(tournament), many=True).data)
+
     @action(detail=False, methods=['get'], url_path='player-tournaments/(?P<player_id>[^/.]+)')
     def get_player_tournaments(self, request, player_id=None):
         """
@@ -661,15 +456,9 @@ class TournamentViewSet(viewsets.ModelViewSet):
             return Response({'error': 'Player not found'}, status=404)
 
         # Récupérer tous les tournois où le joueur est inscrit
-        tournaments = Tournament.objects.filter(
+        tournaments = self.get_queryset().filter(
             players=player,
             status__in=['pending', 'in_progress']  # On ne récupère que les tournois en attente ou en cours
-        ).prefetch_related(
-            'players',
-            'matches',
-            'matches__player1',
-            'matches__player2',
-            'matches__winner'
         ).order_by('-created_at')
 
         # Utiliser notre serializer pour formater les données
@@ -682,7 +471,7 @@ class TournamentViewSet(viewsets.ModelViewSet):
             next_match = None
             for match in tournament_data['matches']:
                 if (match['status'] in ['pending', 'in_progress'] and 
-                    (match['player1']['id'] == player.id or 
+                    ((match['player1'] and match['player1']['id'] == player.id) or 
                      (match['player2'] and match['player2']['id'] == player.id))):
                     next_match = match
                     break
@@ -193,6 +193,41 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Game engine settings
+GAME_TICK_RATE = int(os.getenv('GAME_TICK_RATE', 60))  # Physics steps per second
+GAME_BROADCAST_RATE = int(os.getenv('GAME_BROADCAST_RATE', 60))  # State broadcasts per second
+GAME_MAX_STEPS_PER_FRAME = 5  # Caps catch-up steps per wakeup so a slow host cannot spiral
+GAME_PHYSICS_BACKEND = os.getenv('GAME_PHYSICS_BACKEND', 'scalar')  # 'scalar' or 'numpy' (vectorized batch stepping)
+GAME_BATCH_MIN_MATCHES = 40  # Fewer matches stepping in a tick use the scalar path even with the numpy backend
+GAME_KEYFRAME_INTERVAL = int(os.getenv('GAME_KEYFRAME_INTERVAL', 60))  # Full state every N broadcasts, deltas in between
+GAME_KEYFRAME_REQUEST_INTERVAL = 1.0  # Seconds between two keyframes sent to a connection that missed a delta
+GAME_BINARY_FRAMES = os.getenv('GAME_BINARY_FRAMES', 'True') == 'True'  # Allow the packed binary subprotocol for per-tick updates
+GAME_SNAPSHOT_HISTORY = int(os.getenv('GAME_SNAPSHOT_HISTORY', 32))  # Snapshots kept per game for lag compensation (56 bytes each)
+GAME_MAX_REWIND_MS = int(os.getenv('GAME_MAX_REWIND_MS', 200))  # Furthest back a paddle hit may be evaluated
+GAME_PING_INTERVAL = 2.0  # Seconds between round trip probes of a connection receiving game states, which bound its lag compensation
+GAME_MAX_BALL_SPEED = float(os.getenv('GAME_MAX_BALL_SPEED', 0)) or None  # Cap on |dx| after paddle hits, None for no cap
+GAME_PERSIST_INTERVAL = 0.5  # Seconds between write-behind flushes of game states to the database
+GAME_PERSIST_BATCH_SIZE = 500  # Games per bulk UPDATE
+GAME_PERSIST_MAX_PENDING = 10000  # Bound of the write-behind queue
+GAME_PERSIST_MAX_RETRIES = 3  # Failed flushes retried before a write is dropped
+GAME_CLEANUP_INTERVAL = 300  # Seconds between inactive games sweeps on the persistence thread, 0 to disable
+GAME_ACTIVITY_INTERVAL = 60  # Seconds between refreshes of updated_at of the games being played, well under the sweep's 5 minutes
+GAME_CHECKPOINT_REDIS_URL = os.getenv('GAME_CHECKPOINT_REDIS_URL', 'redis://redis:6379/1')  # Live match checkpoints, empty to disable
+GAME_CHECKPOINT_INTERVAL = float(os.getenv('GAME_CHECKPOINT_INTERVAL', 1.0))  # Seconds between checkpoints of the playing games
+GAME_CHECKPOINT_TTL = 600  # Seconds the checkpoints of a dead process are kept for rehydration
+GAME_STATE_STORE = os.getenv('GAME_STATE_STORE', 'memory')  # 'memory' (single worker) or 'redis' (game leases shared by all workers)
+GAME_STATE_STORE_REDIS_URL = os.getenv('GAME_STATE_STORE_REDIS_URL', 'redis://redis:6379/1')
+GAME_LEASE_TTL = 3.0  # Seconds a worker keeps ownership of its games without renewing; renewed every third of it
+GAME_FORWARD_TIMEOUT = 2.0  # Seconds to wait for the owning worker to answer a forwarded game command
+GAME_SHARD_VNODES = 100  # Virtual nodes per worker on the consistent hash ring assigning games to workers
+GAME_MATCHMAKING_BACKEND = os.getenv('GAME_MATCHMAKING_BACKEND', 'memory')  # 'memory' (single worker) or 'redis' (queue shared by all workers)
+GAME_MATCHMAKING_REDIS_URL = os.getenv('GAME_MATCHMAKING_REDIS_URL', 'redis://redis:6379/1')
+GAME_MATCHMAKING_TIMEOUT = 60  # Seconds a waiting game stays available to matchmaking
+GAME_ELO_INITIAL_RATING = 1000  # Rating of a player before their first rated game
+GAME_ELO_K_FACTOR = 32  # Largest rating change a single game can cause
+GAME_LEADERBOARD_BACKEND = os.getenv('GAME_LEADERBOARD_BACKEND', 'database')  # 'database' (indexed rating column) or 'redis' (sorted set)
+GAME_LEADERBOARD_REDIS_URL = os.getenv('GAME_LEADERBOARD_REDIS_URL', 'redis://redis:6379/1')
+
 # WebSocket specific settings
 WEBSOCKET_ACCEPT_ALL = True  # Accept WebSocket upgrade requests
 WEBSOCKET_TIMEOUT = 3600  # 1 hour timeout for WebSocket connections
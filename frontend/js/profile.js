@@ -157,19 +157,27 @@ async function loadStats() {
             document.getElementById("matches_played").textContent = data.stats.games_played;
             document.getElementById("victories").textContent = data.stats.games_won;
             document.getElementById("defeats").textContent = data.stats.defeats;
+            document.getElementById("rating").textContent = data.stats.rank
+                ? data.stats.rating + " (#" + data.stats.rank + ")"
+                : data.stats.rating;
         }
     } catch (error) {
         console.error("Error loading stats:", error);
     }
 }
 
-async function loadMatchHistory() {
+let matchHistoryCursor = null;
+
+async function loadMatchHistory(more = false) {
     let userId = getHashParam("id");
     if (userId == null) {
         userId = getCookie("id");
     }
     try {
-        const response = await fetch('/api/game/get_games/?id_user=' + userId, {
+        let url = '/api/game/get_games/?id_user=' + userId;
+        if (more && matchHistoryCursor)
+            url += '&cursor=' + encodeURIComponent(matchHistoryCursor);
+        const response = await fetch(url, {
             method: 'GET',
             headers: {
                 'Content-Type': 'application/json',
@@ -178,9 +186,12 @@ async function loadMatchHistory() {
         });
         const data = await response.json();
         const matchHistoryList = document.getElementById('match_history_list');
-        matchHistoryList.innerHTML = "";
+        if (!more)
+            matchHistoryList.innerHTML = "";
         const not_found = document.getElementById("profile_match_not_found");
         const matchTable = document.getElementById("match_table");
+        matchHistoryCursor = data.next_cursor || null;
+        document.getElementById("profile_history_more").classList.toggle("active", matchHistoryCursor != null);
 
         if (data.games && data.games.length > 0) {
             matchTable.classList.add("active");
@@ -237,7 +248,7 @@ async function loadMatchHistory() {
                 if (opponentName)
                     matchHistoryList.appendChild(gameCard);
             });
-        } else {
+        } else if (!more) {
             matchTable.classList.remove("active");
             not_found.classList.add("active");
             not_found.innerHTML = "<p>"+getTranslation("profile_no_match_found")+"</p>";
@@ -250,6 +261,8 @@ async function loadMatchHistory() {
 function initProfile(){
 	console.log("Initializing profile.")
 
+	document.getElementById('profile_history_more').addEventListener('click', () => loadMatchHistory(true));
+
 	document.getElementById('profile_friend_manage').addEventListener('click', async () => {
 		let cmd = "add_friend_user";
 		if(document.getElementById("profile_friend_manage").textContent == getTranslation("profile_friend_manage_pending")
@@ -45,6 +45,10 @@ class PongGame {
         this.currentUser = null;
         this.gameId = null;
         this.gameState = null;
+        this.stateSeq = null;
+        this.inputSeq = 0;
+        this.pendingInputs = [];
+        this.serverPaddleY = null;
         this.animationFrameId = null;
         this.gameStarted = false;
         this.isCreatingGame = false;
@@ -529,7 +533,9 @@ class PongGame {
         const wsUrl = `${wsBase}/ws/game/`;
         console.log('Connecting to UI WebSocket:', wsUrl);
 
-        this.uiSocket = new WebSocket(wsUrl);
+        // Offer the packed binary subprotocol for per-tick updates; the server may stick to JSON
+        this.uiSocket = new WebSocket(wsUrl, ['pong.bin.v3']);
+        this.uiSocket.binaryType = 'arraybuffer';
 
         this.uiSocket.onopen = () => {
             console.log('UI WebSocket connection established');
@@ -551,6 +557,10 @@ class PongGame {
         };
 
         this.uiSocket.onmessage = (event) => {
+            if (event.data instanceof ArrayBuffer) {
+                this.applyBinaryFrame(event.data);
+                return;
+            }
             const data = JSON.parse(event.data);
             console.log('Received UI WebSocket message:', data);
             this.handleWebSocketMessage(data);
@@ -702,6 +712,13 @@ class PongGame {
             console.log('Received WebSocket message:', message);
 
             switch (message.type) {
+                case 'ping':
+                    // Answered at once: the server bounds lag compensation by the measured round trip
+                    if (this.uiSocket && this.uiSocket.readyState === WebSocket.OPEN) {
+                        this.uiSocket.send(JSON.stringify({ type: 'pong', id: message.id }));
+                    }
+                    break;
+
                 case 'game_created':
                     console.log('Game created:', message);
                     this.gameId = parseInt(message.game_id, 10);
@@ -799,13 +816,15 @@ class PongGame {
                     }
                     break;
                 case 'game_state_update':
-                    this.gameState = message.game_state;
+                    if (!this.applyStateUpdate(message)) {
+                        break;
+                    }
 
                     // Update ready button states
-                    this.updateReadyState(message.game_state);
+                    this.updateReadyState(this.gameState);
 
                     // Start game and show canvas only when both players are ready and game is playing
-                    if (message.game_state.status === 'playing') {
+                    if (this.gameState.status === 'playing') {
                         if (!this.gameStarted) {
                             this.gameStarted = true;
                             if (this.canvasContainer) {
@@ -872,6 +891,134 @@ class PongGame {
         }
     }
 
+    // Apply a full ('all') or delta game_state_update. Returns false when a delta
+    // does not follow the last applied update; a keyframe is then requested.
+    applyStateUpdate(message) {
+        if (message.update_type !== 'delta') {
+            this.gameState = message.game_state;
+            this.stateSeq = message.seq;
+            if (!this.gameState) {
+                return false;
+            }
+            this.reconcilePaddle(this.gameState.paddles[this.myPaddleKey()].y);
+            return true;
+        }
+
+        if (!this.gameState || message.base_seq !== this.stateSeq) {
+            console.log('Missed a game state update, requesting keyframe');
+            if (this.uiSocket && this.uiSocket.readyState === WebSocket.OPEN && this.gameId) {
+                this.uiSocket.send(JSON.stringify({
+                    type: 'request_keyframe',
+                    game_id: this.gameId
+                }));
+            }
+            return false;
+        }
+
+        const merge = (target, delta) => {
+            for (const [key, value] of Object.entries(delta)) {
+                if (value && typeof value === 'object' && target[key] && typeof target[key] === 'object') {
+                    merge(target[key], value);
+                } else {
+                    target[key] = value;
+                }
+            }
+        };
+        merge(this.gameState, message.game_state);
+        this.stateSeq = message.seq;
+        const paddles = message.game_state.paddles;
+        const ownPaddle = paddles && paddles[this.myPaddleKey()];
+        this.reconcilePaddle(ownPaddle ? ownPaddle.y : undefined);
+        return true;
+    }
+
+    // Decode a packed state frame (see backend/game/wire.py) into the current game state.
+    // Layout, little-endian: u8 version, u8 status, u32 seq, f32 ball x/y/dx/dy,
+    // f32 paddle1 y, f32 paddle2 y, u16 score1, u16 score2, u32 ack1, u32 ack2, u32 tick.
+    applyBinaryFrame(buffer) {
+        const view = new DataView(buffer);
+        if (view.getUint8(0) !== 3 || !this.gameState) {
+            return;
+        }
+        const statuses = ['waiting', 'playing', 'finished'];
+        const state = this.gameState;
+        state.status = statuses[view.getUint8(1)] || state.status;
+        this.stateSeq = view.getUint32(2, true);
+        state.ball.x = view.getFloat32(6, true);
+        state.ball.y = view.getFloat32(10, true);
+        state.ball.dx = view.getFloat32(14, true);
+        state.ball.dy = view.getFloat32(18, true);
+        state.paddles.player1.y = view.getFloat32(22, true);
+        state.paddles.player2.y = view.getFloat32(26, true);
+        state.score.player1 = view.getUint16(30, true);
+        state.score.player2 = view.getUint16(32, true);
+        state.input_acks = {
+            player1: view.getUint32(34, true),
+            player2: view.getUint32(38, true)
+        };
+        state.tick = view.getUint32(42, true);
+        this.reconcilePaddle(state.paddles[this.myPaddleKey()].y);
+    }
+
+    myPaddleKey() {
+        const players = this.gameState && this.gameState.players;
+        if (players && players.player1 && parseInt(players.player1.id, 10) === this.playerId) {
+            return 'player1';
+        }
+        return 'player2';
+    }
+
+    movePaddle(paddle, direction) {
+        const speed = this.gameState.paddle_speed;
+        if (direction === 'up') {
+            paddle.y = Math.max(0, paddle.y - speed);
+        } else {
+            paddle.y = Math.min(this.gameState.canvas.height - paddle.height, paddle.y + speed);
+        }
+    }
+
+    // Send a numbered input and apply it locally right away; the server applies it
+    // at its next tick and acknowledges the sequence number in input_acks. The tick
+    // of the state on screen lets the server judge paddle hits as we saw them.
+    sendPaddleMove(direction) {
+        const seq = ++this.inputSeq;
+        this.pendingInputs.push({ seq, direction });
+        this.movePaddle(this.gameState.paddles[this.myPaddleKey()], direction);
+        this.uiSocket.send(JSON.stringify({
+            type: 'paddle_move',
+            direction: direction,
+            game_id: this.gameId,
+            seq: seq,
+            tick: this.gameState.tick
+        }));
+    }
+
+    // Replay the inputs the server has not applied yet on top of its paddle position.
+    // serverY is the authoritative y from this update, undefined if it did not change.
+    reconcilePaddle(serverY) {
+        const state = this.gameState;
+        if (!state || !state.input_acks || !state.paddles) {
+            return;
+        }
+        if (serverY !== undefined) {
+            this.serverPaddleY = serverY;
+        }
+        if (this.serverPaddleY === null) {
+            return;
+        }
+        const key = this.myPaddleKey();
+        state.paddles[key].y = this.serverPaddleY;
+        const ack = state.input_acks[key] || 0;
+        if (ack > this.inputSeq) {
+            // Page reloaded mid-game: continue numbering after what the server has seen
+            this.inputSeq = ack;
+        }
+        this.pendingInputs = this.pendingInputs.filter(input => input.seq > ack);
+        for (const input of this.pendingInputs) {
+            this.movePaddle(state.paddles[key], input.direction);
+        }
+    }
+
     joinGame(gameId) {
 
         try {
@@ -928,8 +1075,7 @@ class PongGame {
             event.preventDefault();
 
             // Get current paddle position
-            const paddleKey = this.playerId === this.gameState.player1_id ? 'player1' : 'player2';
-            const paddle = this.gameState.paddles[paddleKey];
+            const paddle = this.gameState.paddles[this.myPaddleKey()];
             const canvasHeight = this.gameState.canvas.height;
 
             // Move paddle based on key
@@ -942,11 +1088,7 @@ class PongGame {
 
             if (direction) {
                 console.log('Sending paddle_move:', { direction, gameId: this.gameId });
-                this.uiSocket.send(JSON.stringify({
-                    type: 'paddle_move',
-                    direction: direction,
-                    game_id: this.gameId
-                }));
+                this.sendPaddleMove(direction);
             }
         }
     }
@@ -964,8 +1106,7 @@ class PongGame {
         }
 
         // Get current paddle position
-        const paddleKey = this.playerId === this.gameState.player1_id ? 'player1' : 'player2';
-        const paddle = this.gameState.paddles[paddleKey];
+        const paddle = this.gameState.paddles[this.myPaddleKey()];
         const canvasHeight = this.gameState.canvas.height;
 
         let direction = null;
@@ -976,11 +1117,7 @@ class PongGame {
         }
 
         if (direction) {
-            this.uiSocket.send(JSON.stringify({
-                type: 'paddle_move',
-                direction: direction,
-                game_id: this.gameId
-            }));
+            this.sendPaddleMove(direction);
             this.lastPaddleUpdate = now;
         }
     }
@@ -77,17 +77,24 @@ function initSocket(tournamentId) {
                         }
             }});
 
-        } else if (data.type === 'match_ready_notification') {
-            // Notification spécifique pour le lancement du match
+        } else if (data.type === 'matches_ready') {
+            // Tous les matchs lancés en même temps ; on prévient le joueur si l'un d'eux est le sien
             const userId = await getid();
-            const opponent = data.players[0].id === userId ?
-                data.players[1]?.display_name : data.players[0].display_name;
-            const roundName = getRoundName(data.round_size);
+            const match = data.matches.find(m => m.players.some(p => p.id === userId));
             loadTournament(tournamentId).then(tournament => {
                 if (tournament) {
-                    const message = getTranslation("global_tournament") + `: ${tournament.name}\n` +
-                                    roundName + ` vs ${opponent}\n` + getTranslation("tournament_five_min");
-                    showNotification(message, 'success', 5000);
+                    displayPlayers(tournament);
+                    displayMatches(tournament);
+                    initTournamentActions(tournament);
+                    if (match) {
+                        const opponent = match.players[0].id === userId ?
+                            match.players[1].display_name : match.players[0].display_name;
+                        // Les tours suisses et toutes rondes n'ont pas de nom de tableau
+                        const roundName = match.round_size ? getRoundName(match.round_size) : `Round ${match.round_number}`;
+                        const message = getTranslation("global_tournament") + `: ${tournament.name}\n` +
+                                        roundName + ` vs ${opponent}\n` + getTranslation("tournament_five_min");
+                        showNotification(message, 'success', 5000);
+                    }
                 }
             });
         } else if (data.type === 'tournament_update') {
@@ -170,8 +177,9 @@ function displayMatches(tournament) {
             }
 
             // Marquer le match comme actif si le joueur actuel est impliqué et que le match est en cours
+            // Plusieurs matchs peuvent être en cours en même temps, seul celui du joueur est actif
             if (match.status === 'in_progress' &&
-                (match.player1_id === tournament.current_user_id || match.player2_id === tournament.current_user_id)) {
+                (match.player1?.id === tournament.current_user_id || match.player2?.id === tournament.current_user_id)) {
                 matchDiv.classList.add('tournament_match-active');
             }
 
@@ -180,10 +188,13 @@ function displayMatches(tournament) {
 
             const player1Span = document.createElement('span');
             player1Span.className = 'tournament_match-player';
-            if (match.winner_display_name === match.player1_display_name) {
+            if (match.winner && match.winner.id === match.player1?.id) {
                 player1Span.classList.add('tournament_match-winner');
             }
-            player1Span.textContent = match.player1_display_name;
+            // Les places des tours suivants restent vides tant que le vainqueur n'est pas connu,
+            // celles du premier tour sans adversaire sont des exemptions
+            const emptySlot = match.status === 'completed' ? getTranslation("tournament_bye") : getTranslation("tournament_tbd");
+            player1Span.textContent = match.player1_display_name ?? emptySlot;
             if (match.player1_ready) player1Span.classList.add('tournament_player-ready');
 
             const vsSpan = document.createElement('span');
@@ -192,10 +203,10 @@ function displayMatches(tournament) {
 
             const player2Span = document.createElement('span');
             player2Span.className = 'tournament_match-player';
-            if (match.winner_display_name === match.player2_display_name) {
+            if (match.winner && match.winner.id === match.player2?.id) {
                 player2Span.classList.add('tournament_match-winner');
             }
-            player2Span.textContent = match.player2_display_name;
+            player2Span.textContent = match.player2_display_name ?? emptySlot;
             if (match.player2_ready) player2Span.classList.add('tournament_player-ready');
 
             playersDiv.appendChild(player1Span);
@@ -236,6 +247,7 @@ async function loadTournament(tournamentId) {
         }
 
         const tournament = await response.json();
+        tournament.current_user_id = Number(getCookie("id"));
         console.log('Tournament:', tournament);
         displayTournamentName(tournament.name);
         globTournament = tournament;
@@ -326,7 +338,12 @@ function displayPlayers(tournament) {
         return;
     }
 
-    tournament.players.forEach(player => {
+    // En suisse et toutes rondes, les joueurs sont affichés dans l'ordre du classement
+    const isRoundFormat = tournament.format === 'swiss' || tournament.format === 'round_robin';
+    const players = isRoundFormat ?
+        [...tournament.players].sort((a, b) => b.wins - a.wins || a.losses - b.losses) : tournament.players;
+
+    players.forEach(player => {
         const playerItem = document.createElement('div');
         const isCreator = player.player.id === tournament.creator.id;
         const isEliminated = false;
@@ -346,6 +363,9 @@ function displayPlayers(tournament) {
         if (isCreator) {
             playerContent += `<span class="tournament_player-badge">Creator</span>`;
         }
+        if (isRoundFormat && tournament.status !== 'pending') {
+            playerContent += `<span class="tournament_player-badge">${player.wins} - ${player.losses}</span>`;
+        }
 
         playerItem.innerHTML = playerContent;
         playersListElement.appendChild(playerItem);
@@ -642,11 +662,12 @@ async function updateMatchGameId(matchId, gameId) {
     }
 }
 
+// roundSize est le nombre de matchs du tour
 function getRoundName(roundSize) {
     switch (roundSize) {
-        case 2: return 'Finals';
-        case 4: return 'Semi-finals';
-        case 8: return 'Quarter-finals';
-        default: return `Round of ${roundSize}`;
+        case 1: return 'Finals';
+        case 2: return 'Semi-finals';
+        case 4: return 'Quarter-finals';
+        default: return `Round of ${roundSize * 2}`;
     }
 }
@@ -6,11 +6,14 @@ function initTournamentButtons() {
     const inputSection = document.getElementById('inputSection');
     const resultSection = document.getElementById('resultSection');
     const modalTitle = document.getElementById('modalTitle');
-    const chips = document.querySelectorAll('.game_chip');
+    const chips = document.querySelectorAll('.game_chip[data-players]');
+    const formatChips = document.querySelectorAll('.game_chip[data-format]');
     let selectedPlayers = 2;
+    let selectedFormat = 'single_elimination';
 
     //montrer la valeur par defaut
     document.querySelector('[data-players="2"]').classList.add('selected');
+    document.querySelector('[data-format="single_elimination"]').classList.add('selected');
     
     // update l'affichage de la chip selection
     chips.forEach(chip => {
@@ -20,6 +23,15 @@ function initTournamentButtons() {
             selectedPlayers = parseInt(this.getAttribute('data-players')); // Get the selected player count from the data attribute
         });
     });
+
+    // meme chose pour le format du tournoi
+    formatChips.forEach(chip => {
+        chip.addEventListener('click', function() {
+            formatChips.forEach(c => c.classList.remove('selected'));
+            this.classList.add('selected');
+            selectedFormat = this.getAttribute('data-format');
+        });
+    });
     
     document.getElementById('game_createTournamentBtn').addEventListener('click', function() {
         modalTitle.textContent = getTranslation("game_tournament_create"); // retablit le content si on veut recreer un tournoi
@@ -37,7 +49,7 @@ function initTournamentButtons() {
         const tournamentName = nameInput.value.trim();
         const displayName = document.getElementById('displayName').value.trim();
         if (tournamentName && displayName && selectedPlayers) {
-            createTournament(tournamentName, selectedPlayers);
+            createTournament(tournamentName, selectedPlayers, selectedFormat);
         }
     });
     
@@ -131,7 +143,7 @@ function initTournamentButtons() {
     });
 }
 
-async function createTournament(name, playersNum) {
+async function createTournament(name, playersNum, format = 'single_elimination') {
     const modal = document.getElementById('tournamentModal');
     const inputSection = document.getElementById('inputSection');
     const resultSection = document.getElementById('resultSection');
@@ -150,6 +162,7 @@ async function createTournament(name, playersNum) {
             body: JSON.stringify({
                 name: name,
                 max_players: playersNum,
+                format: format,
                 display_name: displayName
             })
         });